@@ -1,7 +1,8 @@
 from pydantic_ai import Agent, RunContext
 from pydantic_ai.tools import Tool
 from models import FinanceDeps
-from functions_database import (
+from functions_database_async import (
+    run_db,
     save_expense_transaction, 
     save_income_transaction,
     mark_transaction_as_paid,
@@ -11,6 +12,7 @@ from functions_database import (
     mark_expense_as_paid
 )
 from calculator_tool import FinancialCalculator
+from budget_engine import budget_engine
 from dynamic_query import DynamicQueryBuilder
 from typing import Optional, Dict, Any
 from datetime import datetime, date
@@ -44,7 +46,7 @@ async def register_expense(
         installments: Número de parcelas (padrão 1, usado apenas para cartão de crédito)
         recurrence: Se a despesa é recorrente (ex: conta de luz, internet)
         due_day: Dia do vencimento para despesas recorrentes (1-31, obrigatório se recurrence for True)
-        recurring_months: Número de meses para criar (padrão 6 para recorrentes, ou use o número informado pelo usuário)
+        recurring_months: Número de meses da recorrência (só se o usuário informar; sem valor repete até ser cancelada)
     """
     if not ctx.deps:
         return "❌ Erro: Dados do usuário não encontrados"
@@ -64,6 +66,7 @@ async def register_expense(
     
     # Buscar cartão de crédito por nome se necessário
     credit_card_id = None
+    credit_card = None
     if payment_method == "cartao_credito":
         if not credit_card_name:
             if not ctx.deps.credit_cards:
@@ -75,6 +78,7 @@ async def register_expense(
         for card in ctx.deps.credit_cards:
             if card["name"].lower() == credit_card_name.lower() or credit_card_name.lower() in card["name"].lower():
                 credit_card_id = card["id"]
+                credit_card = card
                 break
         
         if not credit_card_id:
@@ -88,12 +92,8 @@ async def register_expense(
     if due_day is not None and (due_day < 1 or due_day > 31):
         return "❌ O dia do vencimento deve estar entre 1 e 31."
     
-    # Para despesas recorrentes, definir número de meses (padrão 6, ou o que o usuário informou)
-    if recurrence and recurring_months is None:
-        recurring_months = 6  # Padrão de 6 meses
-    
     # Salvar no banco de dados
-    result = save_expense_transaction(
+    result = await save_expense_transaction(
         user_id=user_id,
         amount=amount,
         description=description,
@@ -103,7 +103,8 @@ async def register_expense(
         installments=installments,
         recurrence=recurrence,
         due_day=due_day,
-        recurring_months=recurring_months
+        recurring_months=recurring_months,
+        credit_card=credit_card
     )
     
     if result.get("success"):
@@ -131,7 +132,8 @@ async def register_expense(
             payment_info = f"💰 {payment_method}"
         
         if recurrence:
-            return f"{category_emoji} **Despesa recorrente registrada!**\n\n💰 R$ {amount:.2f} - {description}\n{payment_info}\n📂 Categoria: {category_name}\n📅 Registrei pelos próximos {recurring_months} meses\n\n*Seu orçamento está atualizado! 📊*"
+            recurrence_text = f"Registrei pelos próximos {recurring_months} meses" if recurring_months else "Repete todo mês até você cancelar"
+            return f"{category_emoji} **Despesa recorrente registrada!**\n\n💰 R$ {amount:.2f} - {description}\n{payment_info}\n📂 Categoria: {category_name}\n📅 {recurrence_text}\n\n*Seu orçamento está atualizado! 📊*"
         else:
             return f"{category_emoji} **Despesa registrada!**\n\n💰 R$ {amount:.2f} - {description}\n{payment_info}\n📂 Categoria: {category_name}\n\n*Seu orçamento está atualizado! 📊*"
     else:
@@ -159,7 +161,7 @@ async def register_income(
         payment_method: Método de recebimento ("pix", "transferencia", "dinheiro", "cartao_debito")
         recurrence: Se a receita é recorrente (ex: salário, aluguel recebido)
         due_day: Dia do mês que a receita deve ser recebida (1-31, obrigatório se recurrence for True)
-        recurring_months: Número de meses para criar (padrão 6 para recorrentes)
+        recurring_months: Número de meses da recorrência (só se o usuário informar; sem valor repete até ser cancelada)
     """
     if not ctx.deps:
         return "❌ Erro: Dados do usuário não encontrados"
@@ -184,12 +186,8 @@ async def register_income(
     if due_day is not None and (due_day < 1 or due_day > 31):
         return "❌ O dia do recebimento deve estar entre 1 e 31."
     
-    # Para receitas recorrentes, definir número de meses (padrão 6, ou o que o usuário informou)
-    if recurrence and recurring_months is None:
-        recurring_months = 6  # Padrão de 6 meses
-    
     # Salvar no banco de dados
-    result = save_income_transaction(
+    result = await save_income_transaction(
         user_id=user_id,
         amount=amount,
         description=description,
@@ -205,7 +203,8 @@ async def register_income(
         payment_info = f"💰 {payment_method.upper()}"
         
         if recurrence:
-            return f"💰 **Receita recorrente registrada!**\n\n💵 R$ {amount:.2f} - {description}\n{payment_info}\n📂 Categoria: {category_name}\n📅 Registrei pelos próximos {recurring_months} meses\n\n*Suas finanças estão em dia! ✨*"
+            recurrence_text = f"Registrei pelos próximos {recurring_months} meses" if recurring_months else "Repete todo mês até você cancelar"
+            return f"💰 **Receita recorrente registrada!**\n\n💵 R$ {amount:.2f} - {description}\n{payment_info}\n📂 Categoria: {category_name}\n📅 {recurrence_text}\n\n*Suas finanças estão em dia! ✨*"
         else:
             return f"💰 **Receita registrada!**\n\n💵 R$ {amount:.2f} - {description}\n{payment_info}\n📂 Categoria: {category_name}\n\n*Suas finanças estão em dia! ✨*"
     else:
@@ -229,7 +228,7 @@ async def mark_expense_paid(
     user_id = ctx.deps.user_id
     
     # Primeiro, buscar despesas pendentes com a palavra-chave
-    pending_expenses = find_pending_expenses_by_description(user_id, description_keyword)
+    pending_expenses = await find_pending_expenses_by_description(user_id, description_keyword)
     
     if not pending_expenses:
         return f"😅 Nenhuma despesa pendente encontrada com a palavra-chave '{description_keyword}'.\n\n💡 Tente uma palavra diferente da descrição da despesa ou verifique se ela já foi marcada como paga."
@@ -248,7 +247,7 @@ async def mark_expense_paid(
         multiple_msg = ""
     
     # Marcar como paga usando o ID da transação
-    result = mark_expense_as_paid(expense_to_pay['id'], user_id)
+    result = await mark_expense_as_paid(expense_to_pay['id'], user_id)
     
     if result.get("success"):
         return f"✅ **Despesa marcada como paga!**\n\n� {expense_to_pay['description']}\n� Valor: R$ {expense_to_pay['amount']:.2f}\n📅 Marcada como paga hoje\n\n*Sua carteira foi atualizada! 📊*{multiple_msg}"
@@ -273,7 +272,7 @@ async def confirm_income_received(
     user_id = ctx.deps.user_id
     
     # Primeiro, buscar receitas pendentes com a palavra-chave
-    pending_incomes = find_pending_income_by_description(user_id, description_keyword)
+    pending_incomes = await find_pending_income_by_description(user_id, description_keyword)
     
     if not pending_incomes:
         return f"😅 Nenhuma receita pendente encontrada com a palavra-chave '{description_keyword}'.\n\n💡 Tente uma palavra diferente da descrição da receita ou verifique se ela já foi marcada como recebida."
@@ -292,7 +291,7 @@ async def confirm_income_received(
         multiple_msg = ""
     
     # Marcar como recebida usando o ID da transação
-    result = mark_income_as_received(income_to_confirm['id'], user_id)
+    result = await mark_income_as_received(income_to_confirm['id'], user_id)
     
     if result.get("success"):
         return f"✅ **Receita confirmada como recebida!**\n\n💰 {income_to_confirm['description']}\n💵 Valor: R$ {income_to_confirm['amount']:.2f}\n📅 Marcada como recebida hoje\n\n*Suas finanças foram atualizadas! 💚*{multiple_msg}"
@@ -330,9 +329,9 @@ async def edit_transaction(
         print(f"🔍 Buscando transação para editar: {description_keyword}")
         
         # Buscar transações que contenham a palavra-chave
-        resp = supabase.table("transactions").select(
+        resp = await run_db(supabase.table("transactions").select(
             "id, amount, description, transaction_type, transaction_date"
-        ).eq("user_id", user_id).ilike("description", f"%{description_keyword}%").order("transaction_date", desc=True).execute()
+        ).eq("user_id", user_id).ilike("description", f"%{description_keyword}%").order("transaction_date", desc=True).execute)
         
         results = resp.data or []
         
@@ -351,10 +350,11 @@ async def edit_transaction(
             final_description = new_description if new_description else old_description
             
             # Atualizar transação
-            update_resp = supabase.table("transactions").update({
+            update_resp = await run_db(supabase.table("transactions").update({
                 "amount": new_amount,
                 "description": final_description
-            }).eq("id", transaction_id).eq("user_id", user_id).execute()
+            }).eq("id", transaction_id).eq("user_id", user_id).execute)
+            await budget_engine.invalidate(user_id)
             
             calc = FinancialCalculator()
             tipo_emoji = "💚" if transaction_type == "income" else "💸"
@@ -407,9 +407,9 @@ async def delete_transaction(
         print(f"🔍 Buscando transação para remover: {description_keyword}")
         
         # Buscar transações que contenham a palavra-chave
-        resp = supabase.table("transactions").select(
+        resp = await run_db(supabase.table("transactions").select(
             "id, amount, description, transaction_type, transaction_date"
-        ).eq("user_id", user_id).ilike("description", f"%{description_keyword}%").order("transaction_date", desc=True).execute()
+        ).eq("user_id", user_id).ilike("description", f"%{description_keyword}%").order("transaction_date", desc=True).execute)
         
         results = resp.data or []
         
@@ -425,7 +425,8 @@ async def delete_transaction(
             transaction_type = transaction['transaction_type']
             
             # Remover transação
-            delete_resp = supabase.table("transactions").delete().eq("id", transaction_id).eq("user_id", user_id).execute()
+            delete_resp = await run_db(supabase.table("transactions").delete().eq("id", transaction_id).eq("user_id", user_id).execute)
+            await budget_engine.invalidate(user_id)
             
             calc = FinancialCalculator()
             tipo_emoji = "💚" if transaction_type == "income" else "💸"
@@ -454,6 +455,48 @@ async def delete_transaction(
         return f"❌ Erro ao remover transação: {e}"
 
 
+# Tool para cancelar recorrência
+async def cancel_recurrence(
+    ctx: RunContext,
+    description_keyword: str
+) -> str:
+    """
+    Cancela uma despesa ou receita recorrente (para de repetir nos próximos meses).
+    
+    Args:
+        description_keyword: Palavra-chave da descrição da recorrência
+    
+    Returns:
+        Mensagem de confirmação
+    """
+    if not ctx.deps:
+        return "❌ Erro: Dados do usuário não encontrados"
+    
+    try:
+        from recurrence_scheduler import cancel_rules
+        print(f"🔍 Buscando recorrência para cancelar: {description_keyword}")
+        
+        rules = await run_db(cancel_rules, ctx.deps.user_id, description_keyword)
+        if rules:
+            await budget_engine.invalidate(ctx.deps.user_id)
+        
+        if not rules:
+            return f"❌ Nenhuma recorrência ativa encontrada com '{description_keyword}'."
+        
+        calc = FinancialCalculator()
+        output = ["✅ **Recorrência cancelada!**"]
+        for rule in rules:
+            tipo_emoji = "💚" if rule["transaction_type"] == "income" else "💸"
+            output.append(f"{tipo_emoji} {calc.format_currency(float(rule['amount']))} - {rule['description']}")
+        output.append("\n📅 Os próximos meses não serão mais registrados.")
+        
+        return "\n".join(output)
+        
+    except Exception as e:
+        print(f"❌ Erro ao cancelar recorrência: {e}")
+        return f"❌ Erro ao cancelar recorrência: {e}"
+
+
 # ==================== FERRAMENTAS PRINCIPAIS ====================
 
 # Tool de calculadora financeira
@@ -578,13 +621,14 @@ async def set_category_budget(
         from functions_database import supabase
         
         # Inserir ou atualizar orçamento
-        result = supabase.table("category_budgets").upsert({
+        result = await run_db(supabase.table("category_budgets").upsert({
             "user_id": user_id,
             "category_id": category_id,
             "budget_amount": budget_amount,
             "period_type": period_type,
             "is_active": True
-        }, on_conflict="user_id,category_id,period_type").execute()
+        }, on_conflict="user_id,category_id,period_type").execute)
+        await budget_engine.invalidate(user_id)
         
         calc = FinancialCalculator()
         period_text = {"weekly": "semanal", "monthly": "mensal", "yearly": "anual"}[period_type]
@@ -612,27 +656,17 @@ async def check_budget_status(
         return "❌ Erro: Dados do usuário não encontrados"
     
     try:
-        from functions_database import supabase
-        from datetime import datetime, timedelta
-        
-        # Buscar orçamentos ativos
-        budgets_query = supabase.table("category_budgets").select(
-            "*, categories(name, category_type)"
-        ).eq("user_id", ctx.deps.user_id).eq("is_active", True).eq("period_type", period_type)
-        
+        category_id = None
         if category_name:
             # Buscar categoria específica
-            category_id = None
             for cat in ctx.deps.categories:
                 if cat["name"].lower() == category_name.lower():
                     category_id = cat["id"]
                     break
-            
-            if category_id:
-                budgets_query = budgets_query.eq("category_id", category_id)
         
-        budgets_result = budgets_query.execute()
-        budgets = budgets_result.data or []
+        # Orçamentos e gastos de todas as categorias numa avaliação (em cache até a próxima escrita)
+        budget_status = await budget_engine.evaluate(ctx.deps.user_id, period_type, category_id)
+        budgets = budget_status["budgets"]
         
         if not budgets:
             if category_name:
@@ -640,82 +674,17 @@ async def check_budget_status(
             else:
                 return "📊 Nenhum orçamento definido ainda.\n\n💡 Diga 'define orçamento de R$ X para [categoria]' para começar!"
         
-        # Calcular período atual
-        today = datetime.now().date()
-        if period_type == "weekly":
-            period_start = today - timedelta(days=today.weekday())
-            period_end = period_start + timedelta(days=6)
-        elif period_type == "monthly":
-            period_start = today.replace(day=1)
-            next_month = period_start.replace(month=period_start.month % 12 + 1) if period_start.month < 12 else period_start.replace(year=period_start.year + 1, month=1)
-            period_end = next_month - timedelta(days=1)
-        else:  # yearly
-            period_start = today.replace(month=1, day=1)
-            period_end = today.replace(month=12, day=31)
-        
         calc = FinancialCalculator()
         results = []
-        total_budget = 0
-        total_spent = 0
-        
-        # Usar execute_dynamic_query para buscar gastos por categoria
-        query_builder = DynamicQueryBuilder(ctx.deps)
         
         for budget in budgets:
-            category_name_db = budget["categories"]["name"]
-            budget_amount = float(budget["budget_amount"])
-            total_budget += budget_amount
-            
-            # Buscar gastos direto do banco para esta categoria específica
-            try:
-                # Buscar categoria ID
-                category_id = budget["category_id"]
-                
-                # Consulta direta no banco para gastos da categoria no período
-                gastos_query = supabase.table("transactions").select("amount").eq(
-                    "user_id", ctx.deps.user_id
-                ).eq("transaction_type", "expense").eq(
-                    "category_id", category_id
-                ).gte("transaction_date", period_start.strftime('%Y-%m-%d')).lte(
-                    "transaction_date", period_end.strftime('%Y-%m-%d')
-                )
-                
-                gastos_result = gastos_query.execute()
-                
-                # Somar gastos da categoria
-                gasto_atual = 0.0
-                if gastos_result.data:
-                    gasto_atual = sum(float(t["amount"]) for t in gastos_result.data)
-                
-            except Exception as e:
-                # Fallback: usar o método anterior se houver erro
-                gastos_result = await query_builder.execute_query(
-                    query_type="summary",
-                    filters={
-                        "transaction_type": "expense",
-                        "categoria": category_name_db
-                    },
-                    period_start=period_start.strftime('%Y-%m-%d'),
-                    period_end=period_end.strftime('%Y-%m-%d')
-                )
-                
-                # Extrair valor gasto com regex (método anterior)
-                gasto_atual = 0.0
-                if "R$" in gastos_result:
-                    import re
-                    valores = re.findall(r'R\$\s*([\d.,]+)', gastos_result)
-                    if valores:
-                        try:
-                            valor_str = valores[0].replace('.', '').replace(',', '.')
-                            gasto_atual = float(valor_str)
-                        except:
-                            pass
-            
-            total_spent += gasto_atual
+            category_name_db = budget["category_name"]
+            budget_amount = budget["budget_amount"]
+            gasto_atual = budget["spent"]
             
-            # Calcular porcentagens e status
-            porcentagem = (gasto_atual / budget_amount) * 100 if budget_amount > 0 else 0
-            valor_restante = budget_amount - gasto_atual
+            # Status baseado na porcentagem
+            porcentagem = budget["percentage"]
+            valor_restante = budget["remaining"]
             
             # Definir emoji e status baseado na porcentagem
             if porcentagem >= 100:
@@ -743,10 +712,9 @@ async def check_budget_status(
         
         # Resumo geral se mais de um orçamento
         if len(budgets) > 1:
-            total_percentage = (total_spent / total_budget) * 100 if total_budget > 0 else 0
             period_text = {"weekly": "semana", "monthly": "mês", "yearly": "ano"}[period_type]
             
-            resumo = f"\n\n📈 **RESUMO GERAL ({period_text.upper()}):**\n💰 Total gasto: {calc.format_currency(total_spent)}\n🎯 Total orçado: {calc.format_currency(total_budget)}\n📊 {total_percentage:.1f}% do orçamento total usado"
+            resumo = f"\n\n📈 **RESUMO GERAL ({period_text.upper()}):**\n💰 Total gasto: {calc.format_currency(budget_status['total_spent'])}\n🎯 Total orçado: {calc.format_currency(budget_status['total_budget'])}\n📊 {budget_status['total_percentage']:.1f}% do orçamento total usado"
             
             results.append(resumo)
         
@@ -804,7 +772,7 @@ async def set_financial_goal(
                 return "❌ Formato de data inválido. Use YYYY-MM-DD (ex: 2024-12-31)"
         
         # Inserir meta
-        result = supabase.table("financial_goals").insert({
+        result = await run_db(supabase.table("financial_goals").insert({
             "user_id": ctx.deps.user_id,
             "goal_name": goal_name,
             "goal_type": goal_type,
@@ -812,7 +780,7 @@ async def set_financial_goal(
             "current_amount": current_amount,
             "target_date": target_date,
             "is_active": True
-        }).execute()
+        }).execute)
         
         calc = FinancialCalculator()
         goal_type_name = valid_types[goal_type]
@@ -854,6 +822,7 @@ agent = Agent(
         Tool(confirm_income_received),
         Tool(edit_transaction),
         Tool(delete_transaction),
+        Tool(cancel_recurrence),
         Tool(financial_calculator),
         Tool(execute_dynamic_query),
         Tool(set_category_budget),
@@ -901,7 +870,7 @@ Você é um assistente financeiro pessoal brasileiro especializado em ajudar usu
 ### 📋 FUNÇÕES ESPECÍFICAS (use apenas quando necessário):
 **REGISTROS:** register_expense, register_income
 **CONFIRMAÇÕES:** mark_expense_paid, confirm_income_received  
-**EDIÇÃO/EXCLUSÃO:** edit_transaction, delete_transaction
+**EDIÇÃO/EXCLUSÃO:** edit_transaction, delete_transaction, cancel_recurrence (para de repetir uma recorrência)
 **CÁLCULOS:** financial_calculator (para somas, subtrações, multiplicações e porcentagens precisas)
 
 ## 🔍 SISTEMA DE QUERIES DINÂMICAS - USO PRIORITÁRIO:
@@ -968,7 +937,7 @@ Você é um assistente financeiro pessoal brasileiro especializado em ajudar usu
 - Esta ferramenta é mais precisa e flexível que as outras!
 
 ### 📋 OUTRAS REGRAS IMPORTANTES:
-1. Para despesas recorrentes, sempre especifique o número de meses criados
+1. Para despesas recorrentes, informe o número de meses só se o usuário pedir (sem ele, repete até ser cancelada com cancel_recurrence)
 2. Use templates padronizados para confirmações  
 3. Seja claro sobre o que são pendências vs despesas futuras
 4. **SEMPRE use financial_calculator para somas, subtrações e cálculos - NUNCA calcule manualmente**
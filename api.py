@@ -3,7 +3,7 @@ FastAPI para integração com Evolution API (WhatsApp) e API REST para Frontend
 Recebe mensagens do WhatsApp e responde através do assistente financeiro
 Fornece API REST completa para gerenciamento financeiro via frontend web
 """
-from fastapi import FastAPI, HTTPException, Request, BackgroundTasks, Depends, status
+from fastapi import FastAPI, HTTPException, Request, Depends, Query, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import HTMLResponse
 from fastapi.staticfiles import StaticFiles
@@ -12,7 +12,6 @@ from pydantic import BaseModel, ValidationError
 from typing import Optional, Dict, Any, List
 import json
 import asyncio
-import httpx
 import os
 import jwt
 from datetime import datetime, timedelta
@@ -22,15 +21,26 @@ from dotenv import load_dotenv
 load_dotenv()
 
 from agent import agent
-from functions_database import get_user_by_phone, get_user_categories, get_user_credit_cards
+from functions_database_async import run_db, get_user_by_phone
 from models import FinanceDeps
 from onboarding import complete_onboarding, check_user_exists
-from media_processor import MediaProcessor, detect_media_type, extract_message_id
-from chat_redis import ChatRedisDatabase
+from media_processor import MediaProcessor, detect_media_type, extract_message_id, close_openai_client, get_media_stats
+from receipt_preprocess import shutdown_preprocess_pool, get_preprocess_stats
+from media_result_cache import media_result_cache
+from receipt_parser import get_parser_stats
+from chat_redis import AsyncChatRedisDatabase, close_async_redis_client
+from message_dispatcher import MessageDispatcher, DispatcherFullError
+from webhook_inbox import WebhookInbox, WEBHOOK_INBOX_MODE
+from message_dedup import MessageDeduplicator
+from history_manager import history_manager
+from user_context_cache import user_context_cache
+from recurrence_scheduler import recurrence_scheduler
+from budget_engine import budget_engine
 
 # Imports para API Web
 from web_models import *
 from web_database import WebDatabaseService
+from transaction_export import transactions_export_response, EXPORT_FORMATS
 
 # Configurações
 app = FastAPI(
@@ -40,11 +50,20 @@ app = FastAPI(
 )
 
 # Inicializar Redis para confirmações
-redis_db = ChatRedisDatabase()
+redis_db = AsyncChatRedisDatabase()
 
 # Inicializar serviço de banco web
 db_service = WebDatabaseService()
 
+# Despachante de mensagens (fila ordenada por telefone)
+dispatcher = MessageDispatcher()
+
+# Inbox durável de webhooks (Redis Streams)
+webhook_inbox = WebhookInbox()
+
+# Deduplicação de reentregas do webhook (evita processamento duplicado)
+message_dedup = MessageDeduplicator()
+
 # Configuração JWT
 SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key-here")
 ALGORITHM = "HS256"
@@ -63,9 +82,8 @@ app.add_middleware(
 )
 
 # Configurações Evolution API
-EVOLUTION_BASE_URL = os.getenv("EVOLUTION_API_URL", "http://localhost:8080")
-EVOLUTION_API_KEY = os.getenv("EVOLUTION_TOKEN", "")
-EVOLUTION_INSTANCE = os.getenv("EVOLUTION_INSTANCE", "assistente-financeiro")
+from evolution_client import evolution_client, EVOLUTION_BASE_URL, EVOLUTION_API_KEY, EVOLUTION_INSTANCE
+from whatsapp_outbox import whatsapp_outbox, format_whatsapp_number
 
 # Models para webhooks
 class EvolutionMessage(BaseModel):
@@ -115,9 +133,6 @@ class OnboardingData(BaseModel):
     categories: List[CategoryData] = []
     credit_cards: List[CreditCardData] = []
 
-# Cache para evitar processamento duplicado
-processed_messages = set()
-
 # Utilitários JWT para API Web
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -157,36 +172,21 @@ def get_current_user(user_id: str = Depends(verify_token)):
     return user
 
 async def send_whatsapp_message(phone_number: str, message: str) -> bool:
-    """Envia mensagem via Evolution API"""
+    """Envia mensagem via Evolution API imediatamente (sem fila, sem retentativas)"""
     try:
         # Limpar número para formato internacional
-        clean_phone = phone_number.replace("+", "").replace("-", "").replace(" ", "")
-        if not clean_phone.startswith("55"):
-            clean_phone = f"55{clean_phone}"
+        clean_phone = format_whatsapp_number(phone_number)
         
-        url = f"{EVOLUTION_BASE_URL}/message/sendText/{EVOLUTION_INSTANCE}"
+        response = await evolution_client.send_text(clean_phone, message)
         
-        payload = {
-            "number": clean_phone,
-            "text": message
-        }
-        
-        headers = {
-            "Content-Type": "application/json",
-            "apikey": EVOLUTION_API_KEY
-        }
-        
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, json=payload, headers=headers)
+        # 200 e 201 são códigos de sucesso
+        if response.status_code in [200, 201]:
+            print(f"✅ Mensagem enviada para {phone_number}")
+            return True
+        else:
+            print(f"❌ Erro ao enviar mensagem: {response.status_code} - {response.text}")
+            return False
             
-            # 200 e 201 são códigos de sucesso
-            if response.status_code in [200, 201]:
-                print(f"✅ Mensagem enviada para {phone_number}")
-                return True
-            else:
-                print(f"❌ Erro ao enviar mensagem: {response.status_code} - {response.text}")
-                return False
-                
     except Exception as e:
         print(f"❌ Erro ao enviar mensagem WhatsApp: {e}")
         return False
@@ -199,12 +199,12 @@ async def process_media_message(phone_number: str, message_data: dict, user_name
         message_id = extract_message_id(message_data)
         
         if not message_id:
-            await send_whatsapp_message(phone_number, "❌ Não consegui processar a mídia enviada.")
+            whatsapp_outbox.enqueue(phone_number, "❌ Não consegui processar a mídia enviada.")
             return
         
         # Verificar se usuário existe
-        user_data = get_user_by_phone(phone_number)
-        if not user_data:
+        user_context = await user_context_cache.get(phone_number)
+        if not user_context:
             # Mesmo fluxo de onboarding para usuários não cadastrados
             base_url = os.getenv("BASE_URL", "http://localhost:8001")
             onboarding_url = f"{base_url}/onboarding?phone={phone_number}"
@@ -213,23 +213,24 @@ async def process_media_message(phone_number: str, message_data: dict, user_name
                 "Para processar suas mídias financeiras, você precisa fazer um cadastro rápido.\n\n"
                 f"🔗 Acesse: {onboarding_url}"
             )
-            await send_whatsapp_message(phone_number, onboarding_message)
+            whatsapp_outbox.enqueue(phone_number, onboarding_message)
             return
         
         if media_type == "audio":
             # Processar áudio
-            await send_whatsapp_message(phone_number, "🎧 Processando seu áudio...")
+            whatsapp_outbox.enqueue(phone_number, "🎧 Processando seu áudio...", coalesce=True)
             
             # Baixar áudio
-            base64_audio = await MediaProcessor.get_media_from_evolution(message_id, instance, False)
-            if not base64_audio:
-                await send_whatsapp_message(phone_number, "❌ Não consegui baixar o áudio.")
+            audio = await MediaProcessor.download_media(message_id, instance, filename="audio.mp3")
+            if not audio:
+                whatsapp_outbox.enqueue(phone_number, "❌ Não consegui baixar o áudio.")
                 return
             
             # Transcrever áudio
-            transcription = await MediaProcessor.transcribe_audio(base64_audio)
+            with audio:
+                transcription = await MediaProcessor.transcribe_audio(audio)
             if not transcription:
-                await send_whatsapp_message(phone_number, "❌ Não consegui transcrever o áudio.")
+                whatsapp_outbox.enqueue(phone_number, "❌ Não consegui transcrever o áudio.")
                 return
             
             # Processar transcrição como mensagem de texto
@@ -237,31 +238,32 @@ async def process_media_message(phone_number: str, message_data: dict, user_name
             
         elif media_type == "image":
             # Processar imagem
-            await send_whatsapp_message(phone_number, "📸 Analisando sua imagem...")
+            whatsapp_outbox.enqueue(phone_number, "📸 Analisando sua imagem...", coalesce=True)
             
             # Baixar imagem
-            base64_image = await MediaProcessor.get_media_from_evolution(message_id, instance, False)
-            if not base64_image:
-                await send_whatsapp_message(phone_number, "❌ Não consegui baixar a imagem.")
+            image = await MediaProcessor.download_media(message_id, instance, filename="image.jpg", mimetype="image/jpeg")
+            if not image:
+                whatsapp_outbox.enqueue(phone_number, "❌ Não consegui baixar a imagem.")
                 return
             
             # Extrair dados do comprovante
-            receipt_data = await MediaProcessor.extract_receipt_data(base64_image)
+            with image:
+                receipt_data = await MediaProcessor.read_receipt(image)
             if not receipt_data:
-                await send_whatsapp_message(phone_number, "❌ Não consegui analisar a imagem.")
+                whatsapp_outbox.enqueue(phone_number, "❌ Não consegui analisar a imagem.")
                 return
             
             # Verificar se foi identificado como comprovante
             if "erro" in receipt_data:
-                await send_whatsapp_message(phone_number, "📷 Não consegui identificar um comprovante financeiro nesta imagem. Tente enviar uma foto mais clara do comprovante.")
+                whatsapp_outbox.enqueue(phone_number, "📷 Não consegui identificar um comprovante financeiro nesta imagem. Tente enviar uma foto mais clara do comprovante.")
                 return
             
             # Sempre pedir confirmação para dados extraídos de mídia
             valor = receipt_data.get('valor')
-            descricao = receipt_data.get('descricao') or receipt_data.get('estabelecimento', 'Comprovante')
-            categoria = receipt_data.get('categoria_sugerida', 'Outras despesas')
-            metodo = receipt_data.get('metodo_pagamento', 'pix')
-            confidence = receipt_data.get("confianca", 0)
+            descricao = receipt_data.get('descricao') or receipt_data.get('estabelecimento') or 'Comprovante'
+            categoria = receipt_data.get('categoria_sugerida') or 'Outras despesas'
+            metodo = receipt_data.get('metodo_pagamento') or 'pix'
+            confidence = receipt_data.get("confianca") or 0
             
             if valor and valor > 0:
                 # Salvar dados de confirmação temporariamente
@@ -276,7 +278,7 @@ async def process_media_message(phone_number: str, message_data: dict, user_name
                 }
                 
                 # Salvar no Redis por 5 minutos
-                redis_db.save_pending_confirmation(phone_number, confirmation_data, expires_in=300)
+                await redis_db.save_pending_confirmation(phone_number, confirmation_data, expires_in=300)
                 
                 # Montar mensagem de confirmação inteligente
                 confidence_emoji = "🎯" if confidence > 0.8 else "⚠️" if confidence > 0.5 else "❓"
@@ -291,15 +293,15 @@ async def process_media_message(phone_number: str, message_data: dict, user_name
                     f"Ex: 'muda para cartão' ou 'categoria alimentação'"
                 )
                 
-                await send_whatsapp_message(phone_number, confirmation_message)
+                whatsapp_outbox.enqueue(phone_number, confirmation_message)
                 return
             else:
-                await send_whatsapp_message(phone_number, "❌ Não consegui identificar o valor no comprovante.")
+                whatsapp_outbox.enqueue(phone_number, "❌ Não consegui identificar o valor no comprovante.")
                 return
         
     except Exception as e:
         print(f"❌ Erro ao processar mídia: {e}")
-        await send_whatsapp_message(phone_number, "❌ Erro ao processar sua mídia. Tente novamente.")
+        whatsapp_outbox.enqueue(phone_number, "❌ Erro ao processar sua mídia. Tente novamente.")
 
 async def process_confirmed_data(phone_number: str, pending_data: dict, user_name: str = None):
     """Processa dados confirmados pelo usuário"""
@@ -319,20 +321,20 @@ async def process_confirmed_data(phone_number: str, pending_data: dict, user_nam
             await process_user_message(phone_number, comando, user_name)
             
             # Enviar confirmação adicional
-            await send_whatsapp_message(phone_number, f"✅ **Comprovante confirmado e registrado!**\n🎯 Transação processada com sucesso!")
+            whatsapp_outbox.enqueue(phone_number, f"✅ **Comprovante confirmado e registrado!**\n🎯 Transação processada com sucesso!")
             
     except Exception as e:
         print(f"❌ Erro ao processar confirmação: {e}")
-        await send_whatsapp_message(phone_number, "❌ Erro ao processar confirmação. Tente novamente.")
+        whatsapp_outbox.enqueue(phone_number, "❌ Erro ao processar confirmação. Tente novamente.")
 
 async def process_user_message(phone_number: str, message_text: str, user_name: str = None):
     """Processa mensagem de texto do usuário através do assistente"""
     print(f"🚀 INICIANDO PROCESSAMENTO DE TEXTO - Usuário: {phone_number}, Mensagem: {message_text[:50]}...")
     try:
-        # Verificar se usuário existe
-        user_data = get_user_by_phone(phone_number)
+        # Verificar se usuário existe (usuário, categorias e cartões vêm do cache de contexto)
+        user_context = await user_context_cache.get(phone_number)
         
-        if not user_data:
+        if not user_context:
             # Usuário não cadastrado - enviar para onboarding
             # Obter URL base dinamicamente (será o ngrok URL)
             base_url = os.getenv("BASE_URL", "http://localhost:8001")
@@ -350,15 +352,16 @@ async def process_user_message(phone_number: str, message_text: str, user_name:
                 "📈 Acompanhar seu saldo"
             )
             
-            await send_whatsapp_message(phone_number, onboarding_message)
+            whatsapp_outbox.enqueue(phone_number, onboarding_message)
             return
         
         # Usuário cadastrado - processar com o agente
+        user_data = user_context["user"]
         user_id = user_data["id"]
         user_name = user_data["name"]
         
         # Verificar se há dados pendentes de confirmação
-        pending_data = redis_db.get_pending_confirmation(phone_number)
+        pending_data = await redis_db.get_pending_confirmation(phone_number)
         
         if pending_data:
             # Verificar se é confirmação simples
@@ -367,7 +370,7 @@ async def process_user_message(phone_number: str, message_text: str, user_name:
                 # Processar confirmação
                 await process_confirmed_data(phone_number, pending_data, user_name)
                 # Limpar dados pendentes
-                redis_db.clear_pending_confirmation(phone_number)
+                await redis_db.clear_pending_confirmation(phone_number)
                 return
             
             # Verificar se o usuário quer alterar algum dado
@@ -379,26 +382,25 @@ async def process_user_message(phone_number: str, message_text: str, user_name:
         # Se não há dados pendentes e é uma confirmação simples
         message_lower = message_text.lower().strip()
         if message_lower in ['sim', 'confirma', 'confirmar', 'ok', 'certo', 'correto', 'confirmo']:
-            await send_whatsapp_message(phone_number, "❌ Não tenho dados pendentes para confirmar. Tente enviar novamente a mídia ou digite o registro manualmente.")
+            whatsapp_outbox.enqueue(phone_number, "❌ Não tenho dados pendentes para confirmar. Tente enviar novamente a mídia ou digite o registro manualmente.")
             return
         
-        # Buscar categorias e cartões do usuário para criar as dependências
-        categories = get_user_categories(user_id)
-        credit_cards = get_user_credit_cards(user_id)
-        
         # Criar dependências para o agente
         deps = FinanceDeps(
             user_id=user_id,
             user_name=user_name,
             phone_number=phone_number,
-            categories=categories,
-            credit_cards=credit_cards
+            categories=user_context["categories"],
+            credit_cards=user_context["credit_cards"]
         )
         
         # Recuperar histórico de mensagens do Redis
-        message_history = redis_db.get_messages(user_id, limit=50)
+        message_history = await redis_db.get_messages(user_id, limit=50)
         print(f"📚 Carregado {len(message_history)} mensagens do histórico para {user_name}")
         
+        # Recortar para o orçamento de tokens (turnos antigos viram resumo)
+        message_history = await history_manager.prepare(user_id, message_history)
+        
         # Executar o agente com o histórico de mensagens
         result = await agent.run(message_text, deps=deps, message_history=message_history)
         
@@ -428,12 +430,12 @@ async def process_user_message(phone_number: str, message_text: str, user_name:
             new_messages = result.new_messages()
             if new_messages:
                 messages_json = result.new_messages_json()
-                redis_db.add_messages(user_id, messages_json)
+                await redis_db.add_messages(user_id, messages_json)
                 print(f"💾 Salvo {len(new_messages)} novas mensagens no Redis para {user_name}")
         except Exception as redis_error:
             print(f"⚠️ Erro ao salvar mensagens no Redis: {redis_error}")
         
-        await send_whatsapp_message(phone_number, response_text)
+        whatsapp_outbox.enqueue(phone_number, response_text)
         
         print(f"✅ Mensagem processada para {user_name} ({phone_number})")
         
@@ -443,7 +445,30 @@ async def process_user_message(phone_number: str, message_text: str, user_name:
             "😔 Ops! Ocorreu um erro ao processar sua mensagem. "
             "Tente novamente em alguns instantes."
         )
-        await send_whatsapp_message(phone_number, error_message)
+        whatsapp_outbox.enqueue(phone_number, error_message)
+
+@app.on_event("startup")
+async def on_startup():
+    """Conecta ao Redis, abre o cliente da Evolution API e inicia o inbox se ele roda no processo web"""
+    await redis_db.connect()
+    await evolution_client.startup()
+    if WEBHOOK_INBOX_MODE == "local":
+        await webhook_inbox.start(process_inbox_payload)
+    if WEBHOOK_INBOX_MODE != "remote":
+        # Sem worker separado, o agendador de recorrências roda no processo web
+        await recurrence_scheduler.start()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    """Drena as mensagens em processamento antes de encerrar o worker"""
+    await recurrence_scheduler.stop()
+    await webhook_inbox.stop()
+    await dispatcher.drain()
+    await whatsapp_outbox.drain()
+    await evolution_client.shutdown()
+    await close_openai_client()
+    shutdown_preprocess_pool()
+    await close_async_redis_client()
 
 @app.get("/")
 async def root():
@@ -466,11 +491,31 @@ async def health_check():
         "timestamp": datetime.now().isoformat()
     }
 
+@app.get("/webhook/stats")
+async def get_webhook_stats():
+    """Estatísticas do processamento de mensagens do webhook"""
+    return {
+        "dispatcher": dispatcher.get_stats(),
+        "inbox": webhook_inbox.get_stats(),
+        "dedup": message_dedup.get_stats(),
+        "outbox": whatsapp_outbox.get_stats(),
+        "history_cache": redis_db.history_cache.get_stats(),
+        "history": history_manager.get_stats(),
+        "user_context": user_context_cache.get_stats(),
+        "recurrence": recurrence_scheduler.get_stats(),
+        "budgets": budget_engine.get_stats(),
+        "media": get_media_stats(),
+        "receipt_preprocess": get_preprocess_stats(),
+        "media_cache": media_result_cache.get_stats(),
+        "receipt_parser": get_parser_stats(),
+        "timestamp": datetime.now().isoformat()
+    }
+
 @app.get("/chat/stats/{user_id}")
 async def get_chat_stats(user_id: str):
     """Obter estatísticas do chat de um usuário"""
     try:
-        stats = redis_db.get_chat_stats(user_id)
+        stats = await redis_db.get_chat_stats(user_id)
         return {
             "user_id": user_id,
             "stats": stats,
@@ -483,7 +528,8 @@ async def get_chat_stats(user_id: str):
 async def clear_chat(user_id: str):
     """Limpar histórico de chat de um usuário"""
     try:
-        redis_db.clear_chat(user_id)
+        await redis_db.clear_chat(user_id)
+        await history_manager.clear(user_id)
         return {
             "message": f"Histórico do usuário {user_id} limpo com sucesso",
             "timestamp": datetime.now().isoformat()
@@ -495,7 +541,7 @@ async def clear_chat(user_id: str):
 async def get_chat_history(user_id: str, limit: int = 50):
     """Obter histórico de mensagens de um usuário"""
     try:
-        messages = redis_db.get_messages(user_id, limit=limit)
+        messages = await redis_db.get_messages(user_id, limit=limit)
         return {
             "user_id": user_id,
             "message_count": len(messages),
@@ -511,8 +557,109 @@ async def get_chat_history(user_id: str, limit: int = 50):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao obter histórico: {str(e)}")
 
+def parse_webhook_message(webhook_data: dict) -> Dict[str, Any]:
+    """
+    Interpreta o payload do webhook da Evolution API (sem I/O)
+    
+    Returns:
+        Dict com "status" ("accepted" ou "ignored") e, se aceito, os dados da mensagem
+    """
+    # Extrair evento e instância
+    event = webhook_data.get("event")
+    instance = webhook_data.get("instance")
+    print(f"🎯 Evento: {event}, Instância: {instance}")
+    
+    # Verificar se é uma mensagem recebida
+    if event != "messages.upsert":
+        print(f"❌ Evento ignorado: {event}")
+        return {"status": "ignored", "reason": "not a message event"}
+    
+    # Acessar dados da mensagem
+    message_data = webhook_data.get("data")
+    if not message_data:
+        print(f"❌ Dados da mensagem não encontrados")
+        return {"status": "ignored", "reason": "no message data"}
+    print(f"📱 Message data recebido")
+    
+    # Extrair informações básicas
+    key_data = message_data.get('key', {})
+    phone_number = key_data.get('remoteJid', "").replace("@s.whatsapp.net", "")
+    from_me = key_data.get('fromMe', False)
+    user_name = message_data.get('pushName', 'Usuário')
+    print(f"📞 Telefone: {phone_number}, FromMe: {from_me}, Nome: {user_name}")
+    
+    # Verificar se não é mensagem nossa
+    if from_me:
+        return {"status": "ignored", "reason": "message from bot"}
+    
+    # Limpar número de telefone
+    clean_phone = phone_number.replace("55", "", 1) if phone_number.startswith("55") else phone_number
+    
+    parsed = {
+        "status": "accepted",
+        "message_id": key_data.get('id'),
+        "phone": clean_phone,
+        "user_name": user_name,
+        "instance": instance,
+        "message_data": message_data
+    }
+    
+    # Verificar se é texto
+    message_content = message_data.get('message', {})
+    conversation = message_content.get('conversation')
+    extended_text = message_content.get('extendedTextMessage', {})
+    
+    message_text = None
+    if conversation:
+        message_text = conversation
+    elif extended_text and extended_text.get('text'):
+        message_text = extended_text.get('text')
+    
+    # Se tem texto, processar como mensagem de texto (fluxo original)
+    if message_text:
+        return {**parsed, "type": "text", "text": message_text}
+    
+    # Se não tem texto, verificar se é mídia (áudio ou imagem)
+    if message_content.get('audioMessage'):
+        return {**parsed, "type": "audio"}
+    
+    if message_content.get('imageMessage'):
+        return {**parsed, "type": "image"}
+    
+    # Caso contrário, ignorar
+    return {"status": "ignored", "reason": "unsupported message type"}
+
+def dispatch_webhook_message(parsed: Dict[str, Any]) -> asyncio.Future:
+    """Enfileira uma mensagem já interpretada no despachante do telefone"""
+    if parsed["type"] == "text":
+        return dispatcher.submit(
+            parsed["phone"], process_user_message,
+            parsed["phone"], parsed["text"], parsed["user_name"]
+        )
+    
+    return dispatcher.submit(
+        parsed["phone"], process_media_message,
+        parsed["phone"], parsed["message_data"], parsed["user_name"], parsed["instance"]
+    )
+
+def webhook_response(parsed: Dict[str, Any]) -> Dict[str, Any]:
+    """Monta a resposta do webhook para uma mensagem aceita"""
+    response = {"status": "accepted", "type": parsed["type"]}
+    if parsed["type"] == "text":
+        response["preview"] = parsed["text"][:50]
+    return response
+
+async def process_inbox_payload(webhook_data: dict):
+    """Processa um payload vindo do inbox (Redis Stream) e aguarda o término"""
+    parsed = parse_webhook_message(webhook_data)
+    if parsed["status"] != "accepted":
+        return
+    
+    # submit antes de qualquer await mantém a ordem de leitura do stream
+    await dispatch_webhook_message(parsed)
+
 @app.post("/webhook/evolution")
-async def evolution_webhook(request: Request, background_tasks: BackgroundTasks):
+async def evolution_webhook(request: Request):
     """Webhook para receber mensagens da Evolution API"""
     print(f"🔔 WEBHOOK RECEBIDO!")
     try:
@@ -520,69 +667,32 @@ async def evolution_webhook(request: Request, background_tasks: BackgroundTasks)
         webhook_data = await request.json()
         print(f"📦 Dados brutos: {webhook_data}")
         
-        # Extrair evento e instância
-        event = webhook_data.get("event")
-        instance = webhook_data.get("instance")
-        print(f"🎯 Evento: {event}, Instância: {instance}")
-        
-        # Verificar se é uma mensagem recebida
-        if event != "messages.upsert":
-            print(f"❌ Evento ignorado: {event}")
-            return {"status": "ignored", "reason": "not a message event"}
-        
-        # Acessar dados da mensagem
-        message_data = webhook_data.get("data")
-        if not message_data:
-            print(f"❌ Dados da mensagem não encontrados")
-            return {"status": "ignored", "reason": "no message data"}
-        print(f"📱 Message data recebido")
-        
-        # Extrair informações básicas
-        key_data = message_data.get('key', {})
-        phone_number = key_data.get('remoteJid', "").replace("@s.whatsapp.net", "")
-        from_me = key_data.get('fromMe', False)
-        user_name = message_data.get('pushName', 'Usuário')
-        print(f"📞 Telefone: {phone_number}, FromMe: {from_me}, Nome: {user_name}")
-        
-        # Verificar se não é mensagem nossa
-        if from_me:
-            return {"status": "ignored", "reason": "message from bot"}
-        
-        # Limpar número de telefone
-        clean_phone = phone_number.replace("55", "", 1) if phone_number.startswith("55") else phone_number
-        
-        # Detectar tipo de mensagem e extrair conteúdo
-        message_text = None
-        
-        # Verificar se é texto
-        message_content = message_data.get('message', {})
-        conversation = message_content.get('conversation')
-        extended_text = message_content.get('extendedTextMessage', {})
-        
-        if conversation:
-            message_text = conversation
-        elif extended_text and extended_text.get('text'):
-            message_text = extended_text.get('text')
-        
-        # Se tem texto, processar como mensagem de texto (fluxo original)
-        if message_text:
-            background_tasks.add_task(process_user_message, clean_phone, message_text, user_name)
-            return {"status": "accepted", "type": "text", "preview": message_text[:50]}
-        
-        # Se não tem texto, verificar se é mídia (áudio ou imagem)
-        # Verificar se tem áudio
-        if message_content.get('audioMessage'):
-            background_tasks.add_task(process_media_message, clean_phone, message_data, user_name, instance)
-            return {"status": "accepted", "type": "audio"}
-        
-        # Verificar se tem imagem
-        if message_content.get('imageMessage'):
-            background_tasks.add_task(process_media_message, clean_phone, message_data, user_name, instance)
-            return {"status": "accepted", "type": "image"}
-        
-        # Caso contrário, ignorar
-        return {"status": "ignored", "reason": "unsupported message type"}
+        parsed = parse_webhook_message(webhook_data)
+        if parsed["status"] != "accepted":
+            return parsed
         
+        # Descartar reentregas da mesma mensagem antes de qualquer processamento
+        if await message_dedup.is_duplicate(parsed["message_id"]):
+            print(f"♻️ Mensagem duplicada ignorada: {parsed['message_id']}")
+            return {"status": "ignored", "reason": "duplicate message"}
+        
+        try:
+            # Modo inbox: só grava o payload no Redis Stream e responde
+            if webhook_inbox.enabled:
+                entry_id = await webhook_inbox.publish(webhook_data)
+                return {**webhook_response(parsed), "status": "queued", "entry_id": entry_id}
+            
+            dispatch_webhook_message(parsed)
+            return webhook_response(parsed)
+        except Exception:
+            # Mensagem não aceita - liberar o ID para a reentrega da Evolution
+            await message_dedup.release(parsed["message_id"])
+            raise
+        
+    except DispatcherFullError as e:
+        # Backpressure: 503 faz a Evolution API reenviar a mensagem depois
+        print(f"⚠️ Mensagem recusada pelo despachante: {e}")
+        raise HTTPException(status_code=503, detail=f"Webhook busy: {str(e)}")
     except Exception as e:
         print(f"❌ Erro no webhook: {e}")
         raise HTTPException(status_code=500, detail=f"Webhook error: {str(e)}")
@@ -605,7 +715,7 @@ async def send_message_endpoint(response: WhatsAppResponse):
 async def get_user_info(phone_number: str):
     """Endpoint para verificar informações do usuário"""
     try:
-        user_data = get_user_by_phone(phone_number)
+        user_data = await get_user_by_phone(phone_number)
         
         if user_data:
             return {
@@ -649,7 +759,7 @@ async def complete_user_onboarding(data: OnboardingData):
     """Completa o processo de onboarding do usuário"""
     try:
         # Verificar se usuário já existe
-        if check_user_exists(data.phone):
+        if await run_db(check_user_exists, data.phone):
             return {
                 "success": False,
                 "message": "Usuário já cadastrado! Você pode usar o assistente normalmente."
@@ -674,7 +784,8 @@ async def complete_user_onboarding(data: OnboardingData):
         ]
         
         # Completar onboarding
-        result = complete_onboarding(
+        result = await run_db(
+            complete_onboarding,
             phone_number=data.phone,
             name=data.name,
             cpf=data.cpf,
@@ -682,6 +793,9 @@ async def complete_user_onboarding(data: OnboardingData):
             credit_cards=credit_cards
         )
         
+        # O telefone pode ter sido consultado antes do cadastro
+        await user_context_cache.invalidate(data.phone)
+        
         if result["success"]:
             return {
                 "success": True,
@@ -708,7 +822,7 @@ async def complete_user_onboarding(data: OnboardingData):
 async def check_onboarding_status(phone_number: str):
     """Verifica se o usuário já completou o onboarding"""
     try:
-        user_exists = check_user_exists(phone_number)
+        user_exists = await run_db(check_user_exists, phone_number)
         
         return {
             "registered": user_exists,
@@ -732,7 +846,7 @@ async def register_user(user_data: UserCreate):
         
         # Verificar se email já existe
         print(f"🔍 Verificando se email {user_data.email} já existe...")
-        existing_user = db_service.get_user_by_email(user_data.email)
+        existing_user = await run_db(db_service.get_user_by_email, user_data.email)
         if existing_user:
             print(f"❌ Email {user_data.email} já está cadastrado")
             raise HTTPException(
@@ -742,7 +856,7 @@ async def register_user(user_data: UserCreate):
         
         # Verificar se telefone já existe
         print(f"🔍 Verificando se telefone {user_data.phone_number} já existe...")
-        existing_phone = db_service.get_user_by_phone(user_data.phone_number)
+        existing_phone = await run_db(db_service.get_user_by_phone, user_data.phone_number)
         if existing_phone:
             print(f"❌ Telefone {user_data.phone_number} já está cadastrado")
             raise HTTPException(
@@ -752,7 +866,7 @@ async def register_user(user_data: UserCreate):
         
         # Verificar se CPF já existe
         print(f"🔍 Verificando se CPF {user_data.cpf} já existe...")
-        existing_cpf = db_service.get_user_by_cpf(user_data.cpf)
+        existing_cpf = await run_db(db_service.get_user_by_cpf, user_data.cpf)
         if existing_cpf:
             print(f"❌ CPF {user_data.cpf} já está cadastrado")
             raise HTTPException(
@@ -764,7 +878,7 @@ async def register_user(user_data: UserCreate):
         
         # Criar usuário
         print(f"🔨 Criando usuário no banco de dados...")
-        user = db_service.create_user(user_data.dict())
+        user = await run_db(db_service.create_user, user_data.dict())
         print(f"📊 Resultado da criação: {user}")
         
         if not user or "error" in user:
@@ -818,7 +932,7 @@ async def login_user(login_data: UserLogin):
             )
         
         # Autenticar usuário
-        user = db_service.verify_user_password(login_data.email, login_data.password)
+        user = await run_db(db_service.verify_user_password, login_data.email, login_data.password)
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -867,7 +981,7 @@ async def get_categories(
 ):
     """Lista categorias do usuário"""
     try:
-        categories = db_service.get_user_categories(current_user["id"], category_type)
+        categories = await run_db(db_service.get_user_categories, current_user["id"], category_type)
         
         return ApiResponse(
             success=True,
@@ -888,7 +1002,7 @@ async def create_category(
 ):
     """Cria uma nova categoria"""
     try:
-        category = db_service.create_category(current_user["id"], category_data.dict())
+        category = await run_db(db_service.create_category, current_user["id"], category_data.dict())
         
         if not category:
             raise HTTPException(
@@ -896,6 +1010,8 @@ async def create_category(
                 detail="Erro ao criar categoria"
             )
         
+        await user_context_cache.invalidate(current_user.get("phone_number"))
+        
         return ApiResponse(
             success=True,
             message="Categoria criada com sucesso",
@@ -915,7 +1031,7 @@ async def create_category(
 async def get_credit_cards(current_user: dict = Depends(get_current_user)):
     """Lista cartões de crédito do usuário"""
     try:
-        cards = db_service.get_user_credit_cards(current_user["id"])
+        cards = await run_db(db_service.get_user_credit_cards, current_user["id"])
         
         return ApiResponse(
             success=True,
@@ -936,7 +1052,7 @@ async def create_credit_card(
 ):
     """Cria um novo cartão de crédito"""
     try:
-        card = db_service.create_credit_card(current_user["id"], card_data.dict())
+        card = await run_db(db_service.create_credit_card, current_user["id"], card_data.dict())
         
         if not card:
             raise HTTPException(
@@ -944,6 +1060,8 @@ async def create_credit_card(
                 detail="Erro ao criar cartão"
             )
         
+        await user_context_cache.invalidate(current_user.get("phone_number"))
+        
         return ApiResponse(
             success=True,
             message="Cartão criado com sucesso",
@@ -959,6 +1077,35 @@ async def create_credit_card(
         )
 
 # ENDPOINTS DE TRANSAÇÕES
+@app.get("/api/transactions/export")
+async def export_transactions(
+    export_format: str = Query("ndjson", alias="format"),
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    category_id: Optional[str] = None,
+    payment_method: Optional[str] = None,
+    transaction_type: Optional[str] = None,
+    credit_card_id: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """Exporta todas as transações do usuário em streaming (format=ndjson ou csv)"""
+    if export_format not in EXPORT_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Formato inválido. Use: {', '.join(EXPORT_FORMATS)}"
+        )
+    
+    filters = {
+        "start_date": start_date,
+        "end_date": end_date,
+        "category_id": category_id,
+        "payment_method": payment_method,
+        "transaction_type": transaction_type,
+        "credit_card_id": credit_card_id
+    }
+    
+    return transactions_export_response(db_service, current_user["id"], filters, export_format)
+
 @app.get("/api/transactions", response_model=ApiResponse)
 async def get_transactions(
     start_date: Optional[str] = None,
@@ -987,7 +1134,8 @@ async def get_transactions(
         if credit_card_id:
             filters['credit_card_id'] = credit_card_id
         
-        transactions = db_service.get_user_transactions(
+        transactions = await run_db(
+            db_service.get_user_transactions,
             current_user["id"], filters, limit, offset
         )
         
@@ -1015,7 +1163,7 @@ async def create_transaction(
 ):
     """Cria uma nova transação"""
     try:
-        transaction = db_service.create_transaction(current_user["id"], transaction_data.dict())
+        transaction = await run_db(db_service.create_transaction, current_user["id"], transaction_data.dict())
         
         if not transaction:
             raise HTTPException(
@@ -1023,6 +1171,8 @@ async def create_transaction(
                 detail="Erro ao criar transação"
             )
         
+        await budget_engine.invalidate(current_user["id"])
+        
         return ApiResponse(
             success=True,
             message="Transação criada com sucesso",
@@ -1042,7 +1192,7 @@ async def create_transaction(
 async def get_dashboard(current_user: dict = Depends(get_current_user)):
     """Retorna dados do dashboard"""
     try:
-        dashboard_data = db_service.get_dashboard_data(current_user["id"])
+        dashboard_data = await run_db(db_service.get_dashboard_data, current_user["id"])
         
         return ApiResponse(
             success=True,
@@ -8,7 +8,8 @@ import re
 from typing import Optional, Dict, Any
 from datetime import datetime, timedelta
 from functions_database import supabase
-from chat_redis import ChatRedisDatabase
+from functions_database_async import run_db
+from chat_redis import AsyncChatRedisDatabase
 
 
 class AuthUtils:
@@ -71,15 +72,15 @@ class AuthUtils:
 
 
 class SessionAuth:
-    """Sistema de autenticação com sessions no Redis"""
+    """Sistema de autenticação com sessions no Redis (assíncrono)"""
     
     def __init__(self):
-        self.redis_db = ChatRedisDatabase()
+        self.redis_db = AsyncChatRedisDatabase()
         self.session_prefix = "auth_session:"
         self.user_session_prefix = "user_sessions:"
         self.session_duration = 24 * 3600  # 24 horas
     
-    def create_session(self, user_id: str, user_data: Dict) -> str:
+    async def create_session(self, user_id: str, user_data: Dict) -> str:
         """
         Cria sessão do usuário
         
@@ -106,7 +107,7 @@ class SessionAuth:
             # Salvar no Redis
             if self.redis_db.redis_client:
                 session_key = f"{self.session_prefix}{session_token}"
-                self.redis_db.redis_client.setex(
+                await self.redis_db.redis_client.setex(
                     session_key, 
                     self.session_duration, 
                     json.dumps(session_data, ensure_ascii=False)
@@ -114,11 +115,11 @@ class SessionAuth:
                 
                 # Mapear usuário -> sessões (para logout múltiplas sessões)
                 user_session_key = f"{self.user_session_prefix}{user_id}"
-                self.redis_db.redis_client.sadd(user_session_key, session_token)
-                self.redis_db.redis_client.expire(user_session_key, self.session_duration)
+                await self.redis_db.redis_client.sadd(user_session_key, session_token)
+                await self.redis_db.redis_client.expire(user_session_key, self.session_duration)
                 
                 # Atualizar último login
-                self._update_last_login(user_id)
+                await run_db(self._update_last_login, user_id)
                 
                 print(f"✅ Sessão criada para usuário {user_id}")
                 return session_token
@@ -130,7 +131,7 @@ class SessionAuth:
             print(f"❌ Erro ao criar sessão: {e}")
             return None
     
-    def get_session(self, session_token: str) -> Optional[Dict]:
+    async def get_session(self, session_token: str) -> Optional[Dict]:
         """
         Recupera dados da sessão
         
@@ -145,7 +146,7 @@ class SessionAuth:
                 return None
             
             session_key = f"{self.session_prefix}{session_token}"
-            session_data = self.redis_db.redis_client.get(session_key)
+            session_data = await self.redis_db.redis_client.get(session_key)
             
             if session_data:
                 data = json.loads(session_data)
@@ -153,14 +154,14 @@ class SessionAuth:
                 # Verificar se não expirou
                 expires_at = datetime.fromisoformat(data["expires_at"])
                 if datetime.now() > expires_at:
-                    self.delete_session(session_token)
+                    await self.delete_session(session_token)
                     return None
                 
                 # Atualizar última atividade e estender sessão
                 data["last_activity"] = datetime.now().isoformat()
                 data["expires_at"] = (datetime.now() + timedelta(seconds=self.session_duration)).isoformat()
                 
-                self.redis_db.redis_client.setex(
+                await self.redis_db.redis_client.setex(
                     session_key, 
                     self.session_duration, 
                     json.dumps(data, ensure_ascii=False)
@@ -174,7 +175,7 @@ class SessionAuth:
             print(f"❌ Erro ao recuperar sessão: {e}")
             return None
     
-    def delete_session(self, session_token: str) -> bool:
+    async def delete_session(self, session_token: str) -> bool:
         """
         Remove sessão (logout)
         
@@ -191,7 +192,7 @@ class SessionAuth:
             session_key = f"{self.session_prefix}{session_token}"
             
             # Recuperar dados da sessão antes de deletar
-            session_data = self.redis_db.redis_client.get(session_key)
+            session_data = await self.redis_db.redis_client.get(session_key)
             if session_data:
                 data = json.loads(session_data)
                 user_id = data.get("user_id")
@@ -199,10 +200,10 @@ class SessionAuth:
                 # Remover da lista de sessões do usuário
                 if user_id:
                     user_session_key = f"{self.user_session_prefix}{user_id}"
-                    self.redis_db.redis_client.srem(user_session_key, session_token)
+                    await self.redis_db.redis_client.srem(user_session_key, session_token)
             
             # Deletar sessão
-            result = self.redis_db.redis_client.delete(session_key) > 0
+            result = await self.redis_db.redis_client.delete(session_key) > 0
             print(f"✅ Sessão {session_token[:8]}... removida")
             return result
             
@@ -210,7 +211,7 @@ class SessionAuth:
             print(f"❌ Erro ao deletar sessão: {e}")
             return False
     
-    def delete_all_user_sessions(self, user_id: str) -> int:
+    async def delete_all_user_sessions(self, user_id: str) -> int:
         """
         Remove todas as sessões do usuário
         
@@ -225,16 +226,16 @@ class SessionAuth:
                 return 0
             
             user_session_key = f"{self.user_session_prefix}{user_id}"
-            session_tokens = self.redis_db.redis_client.smembers(user_session_key)
+            session_tokens = await self.redis_db.redis_client.smembers(user_session_key)
             
             count = 0
             for token in session_tokens:
                 session_key = f"{self.session_prefix}{token}"
-                if self.redis_db.redis_client.delete(session_key):
+                if await self.redis_db.redis_client.delete(session_key):
                     count += 1
             
             # Limpar lista de sessões do usuário
-            self.redis_db.redis_client.delete(user_session_key)
+            await self.redis_db.redis_client.delete(user_session_key)
             
             print(f"✅ {count} sessões removidas para usuário {user_id}")
             return count
@@ -243,7 +244,7 @@ class SessionAuth:
             print(f"❌ Erro ao deletar sessões do usuário: {e}")
             return 0
     
-    def get_user_sessions(self, user_id: str) -> list:
+    async def get_user_sessions(self, user_id: str) -> list:
         """
         Lista todas as sessões ativas de um usuário
         
@@ -258,11 +259,11 @@ class SessionAuth:
                 return []
             
             user_session_key = f"{self.user_session_prefix}{user_id}"
-            session_tokens = self.redis_db.redis_client.smembers(user_session_key)
+            session_tokens = await self.redis_db.redis_client.smembers(user_session_key)
             
             sessions = []
             for token in session_tokens:
-                session_data = self.get_session(token)
+                session_data = await self.get_session(token)
                 if session_data:
                     sessions.append({
                         "token": token[:8] + "...",  # Mascarar token
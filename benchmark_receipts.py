@@ -0,0 +1,173 @@
+"""
+Benchmark do pré-processamento e da leitura local de comprovantes
+Mede, para cada imagem da pasta, o tamanho antes e depois de receipt_preprocess e o
+tempo do pré-processamento; com --vision mede também o tempo total de
+extract_receipt_data (chamada real à OpenAI) com e sem pré-processamento
+
+Com --parser avalia a leitura local (receipt_parser) num corpus anotado: cada
+<nome>.json traz os campos esperados ({"fast_path", "valor", "data",
+"estabelecimento", "tipo_comprovante"}) e a entrada é a imagem <nome>.jpg/.png
+(OCR pelo Tesseract) ou o texto <nome>.txt (só os modelos de layout).
+Corpus de exemplo: fixtures/receipts
+
+Uso: python benchmark_receipts.py <pasta> [--vision | --parser]
+"""
+import asyncio
+import json
+import mimetypes
+import statistics
+import sys
+import time
+from pathlib import Path
+
+from media_payload import MediaPayload
+from media_processor import MediaProcessor, close_openai_client
+from receipt_parser import fast_path_accepts, parse_receipt_image, parse_receipt_text
+from receipt_preprocess import PIL_AVAILABLE, preprocess_receipt, shutdown_preprocess_pool
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp"}
+
+
+def _payload(path: Path, data: bytes) -> MediaPayload:
+    payload = MediaPayload(filename=path.name, mimetype=mimetypes.guess_type(path.name)[0] or "image/jpeg")
+    payload.write(data)
+    return payload
+
+
+async def _timed_extract(path: Path, data: bytes, preprocess: bool) -> float:
+    start = time.perf_counter()
+    with _payload(path, data) as payload:
+        await MediaProcessor.extract_receipt_data(payload, preprocess=preprocess, use_cache=False)
+    return time.perf_counter() - start
+
+
+async def run_benchmark(folder: Path, vision: bool = False):
+    paths = sorted(p for p in folder.iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS)
+    if not paths:
+        print(f"❌ Nenhuma imagem em {folder}")
+        return
+
+    if not PIL_AVAILABLE:
+        print("⚠️ Pillow não instalado: as imagens seguem sem pré-processamento")
+
+    totals = {"bytes_in": 0, "bytes_out": 0, "preprocess": 0.0, "raw": 0.0, "processed": 0.0}
+    print(f"{'imagem':<32} {'original':>10} {'final':>10} {'redução':>8} {'prep ms':>8}" + (f" {'raw s':>7} {'prep s':>7}" if vision else ""))
+
+    for path in paths:
+        data = path.read_bytes()
+        start = time.perf_counter()
+        result, _ = await preprocess_receipt(data, mimetypes.guess_type(path.name)[0] or "image/jpeg")
+        elapsed = time.perf_counter() - start
+
+        totals["bytes_in"] += len(data)
+        totals["bytes_out"] += len(result)
+        totals["preprocess"] += elapsed
+        line = f"{path.name[:32]:<32} {len(data):>10} {len(result):>10} {1 - len(result) / len(data):>8.1%} {elapsed * 1000:>8.1f}"
+
+        if vision:
+            raw = await _timed_extract(path, data, preprocess=False)
+            processed = await _timed_extract(path, data, preprocess=True)
+            totals["raw"] += raw
+            totals["processed"] += processed
+            line += f" {raw:>7.2f} {processed:>7.2f}"
+
+        print(line)
+
+    saved = totals["bytes_in"] - totals["bytes_out"]
+    print(f"\n📊 {len(paths)} imagens: {totals['bytes_in']} → {totals['bytes_out']} bytes "
+          f"({saved} economizados, {saved / totals['bytes_in']:.1%})")
+    print(f"⏱️ Pré-processamento: {totals['preprocess'] * 1000 / len(paths):.1f} ms por imagem")
+    if vision:
+        print(f"⏱️ Visão ponta a ponta: {totals['raw'] / len(paths):.2f}s sem pré-processamento, "
+              f"{totals['processed'] / len(paths):.2f}s com")
+
+
+def _field_matches(field: str, expected, actual) -> bool:
+    if field == "valor":
+        return actual is not None and abs(float(actual) - float(expected)) < 0.005
+    if field == "estabelecimento":
+        return bool(actual) and expected.lower() in actual.lower()
+    return actual == expected
+
+
+async def _parse_fixture(path: Path) -> dict:
+    text_path = path.with_suffix(".txt")
+    if text_path.exists():
+        return parse_receipt_text(text_path.read_text(encoding="utf-8"))
+
+    image_path = next((path.with_suffix(ext) for ext in IMAGE_EXTENSIONS if path.with_suffix(ext).exists()), None)
+    if image_path is None:
+        raise FileNotFoundError(f"Sem imagem ou texto para {path.name}")
+    data, _ = await preprocess_receipt(image_path.read_bytes(), mimetypes.guess_type(image_path.name)[0] or "image/jpeg")
+    return await parse_receipt_image(data)
+
+
+async def run_parser_benchmark(folder: Path):
+    fixtures = sorted(folder.glob("*.json"))
+    if not fixtures:
+        print(f"❌ Nenhum comprovante anotado (.json) em {folder}")
+        return
+
+    fields = ["valor", "data", "estabelecimento", "tipo_comprovante"]
+    correct = {field: 0 for field in fields}
+    checked = {field: 0 for field in fields}
+    latencies = []
+    routed_right = 0
+    accepted = 0
+    wrong_accepts = 0
+
+    print(f"{'comprovante':<28} {'banco':<16} {'conf':>5} {'rápido':>7} {'ms':>8}  divergências")
+    for path in fixtures:
+        expected = json.loads(path.read_text(encoding="utf-8"))
+        start = time.perf_counter()
+        result = await _parse_fixture(path) or {}
+        latencies.append(time.perf_counter() - start)
+
+        fast_path = fast_path_accepts(result)
+        routed_right += fast_path == expected.get("fast_path", True)
+
+        mismatches = []
+        if fast_path:
+            accepted += 1
+            for field in fields:
+                if field not in expected:
+                    continue
+                checked[field] += 1
+                if _field_matches(field, expected[field], result.get(field)):
+                    correct[field] += 1
+                else:
+                    mismatches.append(f"{field}={result.get(field)!r}")
+            if "valor" in expected and not _field_matches("valor", expected["valor"], result.get("valor")):
+                wrong_accepts += 1
+
+        print(f"{path.stem[:28]:<28} {str(result.get('banco'))[:16]:<16} {result.get('confianca', 0):>5.2f} "
+              f"{'sim' if fast_path else 'não':>7} {latencies[-1] * 1000:>8.1f}  {', '.join(mismatches)}")
+
+    total = len(fixtures)
+    print(f"\n📊 {total} comprovantes: {accepted} pelo caminho rápido ({accepted / total:.0%}), "
+          f"roteamento correto em {routed_right / total:.0%}, {wrong_accepts} aceitos com valor errado")
+    for field in fields:
+        if checked[field]:
+            print(f"   {field}: {correct[field] / checked[field]:.0%} ({correct[field]}/{checked[field]})")
+    p95 = statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else latencies[0]
+    print(f"⏱️ Leitura local: mediana {statistics.median(latencies) * 1000:.1f} ms, p95 {p95 * 1000:.1f} ms")
+
+
+async def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    if not args:
+        print(__doc__)
+        sys.exit(1)
+
+    try:
+        if "--parser" in sys.argv:
+            await run_parser_benchmark(Path(args[0]))
+        else:
+            await run_benchmark(Path(args[0]), vision="--vision" in sys.argv)
+    finally:
+        shutdown_preprocess_pool()
+        await close_openai_client()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,101 @@
+"""
+Ciclo de faturamento do cartão de crédito em lote
+Calcula fechamento, vencimento e mês da fatura de cada parcela de várias compras
+numa única passada, usando tabelas pré-calculadas de tamanho e início de cada mês
+(sem construir datas inválidas nem tratar ValueError)
+
+Mesma regra de calculate_credit_card_due_date: compra até o dia de fechamento entra
+na fatura do mês da compra, depois dele na do mês seguinte; a parcela k cai k meses depois.
+"""
+import calendar
+from datetime import date
+from decimal import Decimal, ROUND_HALF_UP
+from typing import List, Sequence
+
+# Meses cobertos pelas tabelas (índice = ano * 12 + mês - 1 - _BASE_INDEX)
+TABLE_FIRST_YEAR = 1970
+TABLE_LAST_YEAR = 2199
+_BASE_INDEX = TABLE_FIRST_YEAR * 12
+
+_MONTH_DAYS = []
+_MONTH_FIRST_ORDINAL = []
+for _year in range(TABLE_FIRST_YEAR, TABLE_LAST_YEAR + 1):
+    for _month in range(1, 13):
+        _MONTH_DAYS.append(calendar.monthrange(_year, _month)[1])
+        _MONTH_FIRST_ORDINAL.append(date(_year, _month, 1).toordinal())
+
+
+def _day_in_month(index: int, day: int) -> date:
+    """Data do dia no mês do índice, limitada ao último dia do mês"""
+    return date.fromordinal(_MONTH_FIRST_ORDINAL[index] + min(day, _MONTH_DAYS[index]) - 1)
+
+
+def split_amount(amount: float, installments: int) -> List[float]:
+    """
+    Divide o valor em parcelas de centavos inteiros (a última leva o resto)
+    Mesma divisão usada pelas faturas no banco
+    """
+    installments = max(int(installments or 1), 1)
+    total = Decimal(str(amount))
+    part = (total / installments).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+    return [float(part)] * (installments - 1) + [float(total - part * (installments - 1))]
+
+
+def schedule_installments(
+    purchase_dates: Sequence[date],
+    close_days: Sequence[int],
+    due_days: Sequence[int],
+    installments: Sequence[int] = None
+) -> List[List[dict]]:
+    """
+    Agenda as parcelas de várias compras no cartão
+
+    Args:
+        purchase_dates: Data de cada compra
+        close_days: Dia de fechamento do cartão de cada compra
+        due_days: Dia de vencimento do cartão de cada compra
+        installments: Quantidade de parcelas de cada compra (padrão 1)
+
+    Returns:
+        Para cada compra, a lista das parcelas com
+        {"installment", "close_date", "due_date", "bill_month", "bill_year"}
+
+    Raises:
+        ValueError: Se as listas tiverem tamanhos diferentes ou alguma fatura
+                    cair fora das tabelas (TABLE_FIRST_YEAR a TABLE_LAST_YEAR)
+    """
+    if installments is None:
+        installments = [1] * len(purchase_dates)
+    if not (len(purchase_dates) == len(close_days) == len(due_days) == len(installments)):
+        raise ValueError("purchase_dates, close_days, due_days e installments devem ter o mesmo tamanho")
+
+    schedules = []
+    for purchase, close_day, due_day, count in zip(purchase_dates, close_days, due_days, installments):
+        # Índice do mês da primeira fatura
+        first = purchase.year * 12 + purchase.month - 1 - _BASE_INDEX
+        if purchase.day > close_day:
+            first += 1
+
+        count = max(int(count or 1), 1)
+        if first < 0 or first + count > len(_MONTH_DAYS):
+            raise ValueError(f"Fatura fora do intervalo suportado ({TABLE_FIRST_YEAR}-{TABLE_LAST_YEAR}): {purchase}")
+
+        schedule = []
+        for number in range(count):
+            index = first + number
+            year, month = divmod(index + _BASE_INDEX, 12)
+            schedule.append({
+                "installment": number + 1,
+                "close_date": _day_in_month(index, close_day),
+                "due_date": _day_in_month(index, due_day),
+                "bill_month": month + 1,
+                "bill_year": year
+            })
+        schedules.append(schedule)
+
+    return schedules
+
+
+def schedule_purchase(purchase_date: date, close_day: int, due_day: int, installments: int = 1) -> List[dict]:
+    """Parcelas de uma única compra (atalho para schedule_installments)"""
+    return schedule_installments([purchase_date], [close_day], [due_day], [installments])[0]
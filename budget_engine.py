@@ -0,0 +1,244 @@
+"""
+Avaliação dos orçamentos por categoria (category_budgets)
+Busca os orçamentos e o gasto de todas as categorias do período em paralelo, com
+uma única consulta agrupada (RPC budget_spend, que lê os rollups mensais quando o
+período é de meses inteiros). O resultado de cada período fica em cache no Redis
+até uma escrita nas transações do usuário invalidá-lo; um contador de geração por
+usuário impede que um cálculo iniciado antes da invalidação seja gravado depois dela
+"""
+import asyncio
+import json
+import os
+from datetime import date, timedelta
+from typing import Dict, Optional, Tuple
+from dotenv import load_dotenv
+
+from chat_redis import get_async_redis_client
+from database import supabase
+
+load_dotenv()
+
+# Validade máxima do cache (rede de segurança para escritas que não passam pela invalidação)
+BUDGET_CACHE_TTL = int(os.getenv("BUDGET_CACHE_TTL", "900"))
+BUDGET_CACHE_PREFIX = "budget_status:"
+BUDGET_GENERATION_PREFIX = "budget_gen:"
+
+# Grava o resultado só se a geração do usuário não mudou desde a leitura
+# KEYS: [hash do cache, geração]; ARGV: [geração lida ('' = nenhuma), campo, resultado, ttl]
+STORE_STATUS_SCRIPT = """
+local generation = redis.call('GET', KEYS[2]) or ''
+if generation ~= ARGV[1] then
+    return 0
+end
+redis.call('HSET', KEYS[1], ARGV[2], ARGV[3])
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[4]))
+return 1
+"""
+
+PERIOD_TYPES = ("weekly", "monthly", "yearly")
+
+
+def budget_period(period_type: str, today: date = None) -> Tuple[date, date]:
+    """Início e fim do período atual do orçamento (semana de segunda a domingo, mês ou ano)"""
+    today = today or date.today()
+    if period_type == "weekly":
+        start = today - timedelta(days=today.weekday())
+        return start, start + timedelta(days=6)
+    if period_type == "yearly":
+        return today.replace(month=1, day=1), today.replace(month=12, day=31)
+
+    start = today.replace(day=1)
+    next_month = (start + timedelta(days=32)).replace(day=1)
+    return start, next_month - timedelta(days=1)
+
+
+def _fetch_budgets(user_id: str, period_type: str) -> list:
+    resp = supabase.table("category_budgets").select(
+        "category_id, budget_amount, categories(name, category_type)"
+    ).eq("user_id", user_id).eq("is_active", True).eq("period_type", period_type).execute()
+    return resp.data or []
+
+
+def _fetch_spend(user_id: str, start: date, end: date) -> Dict[Optional[str], float]:
+    """Gasto por category_id no período (despesas pelo paid_date ou, pendentes, pelo due_date)"""
+    try:
+        resp = supabase.rpc("budget_spend", {
+            "p_user_id": user_id,
+            "p_start": start.isoformat(),
+            "p_end": end.isoformat()
+        }).execute()
+        rows = resp.data or []
+    except Exception as e:
+        print(f"Aviso: RPC budget_spend indisponível, usando consulta direta: {e}")
+        # Fallback: uma única consulta para todas as categorias, somada em Python
+        resp = supabase.table("transactions").select("category_id, amount").eq(
+            "user_id", user_id
+        ).eq("transaction_type", "expense").or_(
+            f"and(paid_date.gte.{start.isoformat()},paid_date.lte.{end.isoformat()}),"
+            f"and(paid_date.is.null,due_date.gte.{start.isoformat()},due_date.lte.{end.isoformat()})"
+        ).execute()
+        rows = [{"category_id": t["category_id"], "total": t["amount"]} for t in resp.data or []]
+
+    spend = {}
+    for row in rows:
+        spend[row["category_id"]] = spend.get(row["category_id"], 0.0) + float(row["total"])
+    return spend
+
+
+class BudgetEngine:
+    """
+    Status dos orçamentos de um usuário num período.
+
+    O resultado (todos os orçamentos do período) é guardado num hash do Redis
+    por usuário; invalidate() incrementa a geração do usuário e apaga o hash
+    inteiro, e deve ser chamado a cada escrita em transactions ou category_budgets.
+    Um resultado só é gravado se a geração ainda é a lida antes do cálculo.
+    """
+
+    def __init__(self, ttl_seconds: int = BUDGET_CACHE_TTL):
+        """
+        Args:
+            ttl_seconds: Validade máxima do resultado em cache
+        """
+        self.ttl_seconds = ttl_seconds
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "invalidations": 0,
+            "stale_writes": 0,
+            "redis_errors": 0
+        }
+
+    def _get_key(self, user_id: str) -> str:
+        return f"{BUDGET_CACHE_PREFIX}{user_id}"
+
+    def _get_generation_key(self, user_id: str) -> str:
+        return f"{BUDGET_GENERATION_PREFIX}{user_id}"
+
+    async def evaluate(self, user_id: str, period_type: str = "monthly", category_id: str = None) -> dict:
+        """
+        Avalia os orçamentos ativos do usuário no período atual
+
+        Args:
+            user_id: ID do usuário
+            period_type: "weekly", "monthly" ou "yearly"
+            category_id: Limita o resultado a uma categoria (opcional)
+
+        Returns:
+            dict: {"period_type", "period_start", "period_end", "budgets", "total_budget",
+                   "total_spent", "total_percentage"}; cada orçamento tem
+                   {"category_id", "category_name", "budget_amount", "spent", "remaining", "percentage"}
+        """
+        if period_type not in PERIOD_TYPES:
+            raise ValueError(f"Período de orçamento inválido: {period_type}")
+
+        period_start, period_end = budget_period(period_type)
+        field = f"{period_type}:{period_start.isoformat()}"
+
+        key = self._get_key(user_id)
+        generation_key = self._get_generation_key(user_id)
+
+        result = None
+        generation = None
+        try:
+            # Geração lida junto com o cache: é ela que autoriza gravar o cálculo
+            async with get_async_redis_client().pipeline(transaction=True) as pipe:
+                pipe.hget(key, field)
+                pipe.get(generation_key)
+                cached, generation = await pipe.execute()
+            if cached:
+                result = json.loads(cached)
+                self.stats["hits"] += 1
+        except Exception as e:
+            self.stats["redis_errors"] += 1
+            print(f"⚠️ Erro ao ler cache de orçamentos: {e}")
+
+        if result is None:
+            self.stats["misses"] += 1
+            result = await self._compute(user_id, period_type, period_start, period_end)
+            await self._store(key, generation_key, generation, field, result)
+
+        if category_id:
+            budgets = [b for b in result["budgets"] if b["category_id"] == category_id]
+            return {**result, **self._totals(budgets), "budgets": budgets}
+        return result
+
+    async def _store(self, key: str, generation_key: str, generation, field: str, result: dict):
+        """Grava o resultado se nenhuma invalidação ocorreu durante o cálculo"""
+        if isinstance(generation, bytes):
+            generation = generation.decode()
+        try:
+            client = get_async_redis_client()
+            stored = await client.register_script(STORE_STATUS_SCRIPT)(
+                keys=[key, generation_key],
+                args=[generation or "", field, json.dumps(result), self.ttl_seconds]
+            )
+            if not stored:
+                self.stats["stale_writes"] += 1
+        except Exception as e:
+            self.stats["redis_errors"] += 1
+            print(f"⚠️ Erro ao gravar cache de orçamentos: {e}")
+
+    async def _compute(self, user_id: str, period_type: str, period_start: date, period_end: date) -> dict:
+        from functions_database_async import run_db
+
+        # Orçamentos e gastos em paralelo: duas consultas, independente da quantidade de categorias
+        budget_rows, spend = await asyncio.gather(
+            run_db(_fetch_budgets, user_id, period_type),
+            run_db(_fetch_spend, user_id, period_start, period_end)
+        )
+
+        budgets = []
+        for row in budget_rows:
+            budget_amount = float(row["budget_amount"])
+            spent = spend.get(row["category_id"], 0.0)
+            budgets.append({
+                "category_id": row["category_id"],
+                "category_name": (row.get("categories") or {}).get("name"),
+                "budget_amount": budget_amount,
+                "spent": spent,
+                "remaining": budget_amount - spent,
+                "percentage": spent / budget_amount * 100 if budget_amount > 0 else 0
+            })
+
+        return {
+            "period_type": period_type,
+            "period_start": period_start.isoformat(),
+            "period_end": period_end.isoformat(),
+            "budgets": budgets,
+            **self._totals(budgets)
+        }
+
+    @staticmethod
+    def _totals(budgets: list) -> dict:
+        total_budget = sum(b["budget_amount"] for b in budgets)
+        total_spent = sum(b["spent"] for b in budgets)
+        return {
+            "total_budget": total_budget,
+            "total_spent": total_spent,
+            "total_percentage": total_spent / total_budget * 100 if total_budget > 0 else 0
+        }
+
+    async def invalidate(self, user_id: str):
+        """Descarta os resultados em cache do usuário (após escrita em transações ou orçamentos)"""
+        if not user_id:
+            return
+        self.stats["invalidations"] += 1
+        try:
+            generation_key = self._get_generation_key(user_id)
+            async with get_async_redis_client().pipeline(transaction=True) as pipe:
+                pipe.incr(generation_key)
+                pipe.expire(generation_key, self.ttl_seconds)
+                pipe.delete(self._get_key(user_id))
+                await pipe.execute()
+        except Exception as e:
+            self.stats["redis_errors"] += 1
+            print(f"⚠️ Erro ao invalidar cache de orçamentos: {e}")
+
+    def get_stats(self) -> dict:
+        """Retorna contadores do cache de orçamentos"""
+        return dict(self.stats)
+
+
+# Instância global
+budget_engine = BudgetEngine()
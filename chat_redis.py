@@ -1,5 +1,7 @@
 import json
+import time
 import redis
+from collections import OrderedDict
 from typing import List, Optional
 from pydantic_ai.messages import ModelMessage, ModelMessagesTypeAdapter
 import os
@@ -8,6 +10,275 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+# Limites do histórico de chat no Redis
+CHAT_HISTORY_MAX_MESSAGES = 100
+CHAT_HISTORY_TTL = 7 * 24 * 3600
+
+# Canal opcional para publicar o novo tamanho do histórico a cada gravação (vazio = desligado)
+CHAT_HISTORY_CHANNEL = os.getenv("CHAT_HISTORY_CHANNEL", "")
+
+# Limite de memória do cache de mensagens já decodificadas (por processo)
+CHAT_DECODED_CACHE_MAX_BYTES = int(os.getenv("CHAT_DECODED_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+# Grava o histórico em um único round trip: LPUSH variádico, LTRIM, EXPIRE e PUBLISH opcional.
+# Também avança a sequência do histórico (total de entradas já gravadas), que começa
+# numa base derivada do relógio para nunca repetir um valor depois de um clear_chat
+# Sem entradas (lote só com mensagens descartadas) ainda aplica LTRIM e renova o EXPIRE
+# KEYS[1] = chave do chat, KEYS[2] = chave da sequência
+# ARGV = [máximo, ttl, canal, base da sequência, entradas...]
+APPEND_HISTORY_SCRIPT = """
+local added = #ARGV - 4
+local length
+if added > 0 then
+    length = redis.call('LPUSH', KEYS[1], unpack(ARGV, 5))
+else
+    length = redis.call('LLEN', KEYS[1])
+end
+local max_messages = tonumber(ARGV[1])
+local ttl = tonumber(ARGV[2])
+redis.call('LTRIM', KEYS[1], 0, max_messages - 1)
+redis.call('EXPIRE', KEYS[1], ttl)
+if added > 0 then
+    if redis.call('EXISTS', KEYS[2]) == 0 then
+        redis.call('SET', KEYS[2], ARGV[4])
+    end
+    redis.call('INCRBY', KEYS[2], added)
+end
+redis.call('EXPIRE', KEYS[2], ttl)
+length = math.min(length, max_messages)
+if added > 0 and ARGV[3] ~= '' then
+    redis.call('PUBLISH', ARGV[3], cjson.encode({key = KEYS[1], length = length}))
+end
+return length
+"""
+
+# Lê a sequência do histórico e só as entradas gravadas depois da sequência em cache
+# KEYS[1] = chave do chat, KEYS[2] = chave da sequência
+# ARGV = [sequência em cache (0 = nenhuma), limite]
+READ_HISTORY_SCRIPT = """
+local seq = tonumber(redis.call('GET', KEYS[2]) or '0')
+local cached_seq = tonumber(ARGV[1])
+local count = tonumber(ARGV[2])
+if cached_seq > 0 and seq >= cached_seq and seq - cached_seq < count then
+    count = seq - cached_seq
+end
+if count == 0 then
+    return {seq, {}}
+end
+return {seq, redis.call('LRANGE', KEYS[1], 0, count - 1)}
+"""
+
+# Cliente Redis assíncrono compartilhado pelo processo
+_async_redis_client = None
+
+def get_async_redis_client(redis_url: str = None):
+    """
+    Retorna o cliente Redis assíncrono compartilhado (um pool de conexões por processo)
+    
+    Args:
+        redis_url: URL de conexão Redis (padrão: REDIS_URL)
+    """
+    global _async_redis_client
+    
+    if _async_redis_client is None:
+        import redis.asyncio as aioredis
+        
+        if redis_url is None:
+            redis_url = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+        
+        _async_redis_client = aioredis.from_url(
+            redis_url,
+            decode_responses=True,
+            socket_connect_timeout=5,
+            socket_timeout=15,
+            retry_on_timeout=True,
+            max_connections=int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+        )
+    
+    return _async_redis_client
+
+async def close_async_redis_client():
+    """Fecha o pool do cliente Redis assíncrono compartilhado"""
+    global _async_redis_client
+    
+    if _async_redis_client is not None:
+        try:
+            await _async_redis_client.aclose()
+            print("✅ Conexão Redis assíncrona fechada")
+        except Exception as e:
+            print(f"⚠️ Erro ao fechar Redis assíncrono: {e}")
+        _async_redis_client = None
+
+def _filter_valid_messages(messages_json) -> list:
+    """
+    Converte as mensagens do Pydantic AI (JSON bytes/str/lista) em lista de dicts,
+    descartando mensagens de tool órfãs
+    """
+    # Converter bytes para string se necessário
+    if isinstance(messages_json, bytes):
+        messages_str = messages_json.decode('utf-8')
+    else:
+        messages_str = json.dumps(messages_json) if not isinstance(messages_json, str) else messages_json
+    
+    # Parse das mensagens
+    messages_list = json.loads(messages_str)
+    
+    # Filtrar mensagens válidas (evita problemas com tool calls órfãs)
+    valid_messages = []
+    for message in messages_list:
+        # Não salvar mensagens de tool sem contexto adequado
+        if isinstance(message, dict):
+            # Verificar se é mensagem de tool órfã
+            parts = message.get('parts', [])
+            if parts and isinstance(parts[0], dict) and parts[0].get('role') == 'tool':
+                print(f"⚠️ Pulando mensagem de tool órfã")
+                continue  # Pular mensagens de tool órfãs
+            
+        valid_messages.append(message)
+    
+    return valid_messages
+
+def _build_history_entries(valid_messages: list) -> List[str]:
+    """Serializa as mensagens no formato gravado na lista do Redis (com timestamp)"""
+    timestamp = datetime.now().isoformat()
+    return [json.dumps({"timestamp": timestamp, "data": message}) for message in valid_messages]
+
+def _append_history_args(entries: List[str]) -> list:
+    """Monta os argumentos do APPEND_HISTORY_SCRIPT"""
+    seq_base = int(time.time() * 1000)
+    return [CHAT_HISTORY_MAX_MESSAGES, CHAT_HISTORY_TTL, CHAT_HISTORY_CHANNEL, seq_base, *entries]
+
+def _decode_stored_message(raw_msg: str) -> ModelMessage:
+    """Converte uma entrada da lista do Redis de volta para mensagem do Pydantic AI"""
+    msg_data = json.loads(raw_msg)
+    message_content = msg_data.get("data")
+    
+    # Usar o ModelMessagesTypeAdapter para deserializar
+    if isinstance(message_content, str):
+        return ModelMessagesTypeAdapter.validate_json(message_content)[0]
+    return ModelMessagesTypeAdapter.validate_python([message_content])[0]
+
+def _decode_local_message(message_data) -> ModelMessage:
+    """Converte uma entrada do fallback em memória para mensagem do Pydantic AI"""
+    if isinstance(message_data, str):
+        return ModelMessagesTypeAdapter.validate_json(message_data)[0]
+    return ModelMessagesTypeAdapter.validate_python([message_data])[0]
+
+class DecodedHistoryCache:
+    """
+    Cache em memória das mensagens já decodificadas de cada usuário.
+
+    Cada entrada guarda a sequência do histórico no Redis (`chat:{user}:seq`,
+    avançada a cada gravação) e as mensagens decodificadas da janela mais
+    recente. Numa leitura só as entradas gravadas depois da sequência em cache
+    passam pelo ModelMessagesTypeAdapter. A LRU é limitada pelo tamanho total
+    (em bytes do JSON armazenado) das entradas.
+    """
+    def __init__(self, max_bytes: int = CHAT_DECODED_CACHE_MAX_BYTES):
+        """
+        Args:
+            max_bytes: Tamanho máximo somado das entradas em cache
+        """
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # user_id -> {"seq", "window", "items", "bytes"}
+        self._bytes = 0
+        
+        self.stats = {
+            "hits": 0,
+            "partial_hits": 0,
+            "misses": 0,
+            "stale": 0,
+            "decoded": 0,
+            "evictions": 0
+        }
+    
+    def cached_seq(self, user_id: str, limit: int) -> int:
+        """Sequência em cache que pode atender uma leitura de `limit` mensagens (0 = nenhuma)"""
+        entry = self._entries.get(user_id)
+        if entry is None or entry["window"] < limit:
+            return 0
+        return entry["seq"]
+    
+    def _decode(self, raw_msg: str) -> tuple:
+        """Decodifica uma entrada do Redis, guardando None quando ela é inválida"""
+        self.stats["decoded"] += 1
+        try:
+            return len(raw_msg), _decode_stored_message(raw_msg)
+        except Exception as parse_error:
+            print(f"⚠️ Erro ao processar mensagem: {parse_error}")
+            return len(raw_msg), None
+    
+    def apply(self, user_id: str, limit: int, cached_seq: int, seq: int,
+              raw_messages: List[str]) -> Optional[List[ModelMessage]]:
+        """
+        Incorpora o resultado do READ_HISTORY_SCRIPT e retorna o histórico
+        
+        Args:
+            user_id: ID do usuário
+            limit: Limite usado na leitura
+            cached_seq: Sequência em cache enviada ao script
+            seq: Sequência atual do histórico no Redis
+            raw_messages: Entradas lidas (da mais recente para a mais antiga)
+            
+        Returns:
+            Até `limit` mensagens em ordem cronológica, ou None quando o script
+            leu só as entradas novas mas a entrada em cache mudou durante a
+            leitura (o chamador deve ler de novo com cached_seq=0)
+        """
+        entry = self._entries.get(user_id)
+        
+        # Mesma condição do script: só as entradas novas foram lidas
+        if cached_seq and seq >= cached_seq and seq - cached_seq < limit:
+            if entry is None or entry["seq"] != cached_seq or entry["window"] < limit:
+                self.stats["stale"] += 1
+                return None
+            items, window = entry["items"], entry["window"]
+            self.stats["hits" if seq == cached_seq else "partial_hits"] += 1
+        else:
+            items, window = [], limit
+            self.stats["misses"] += 1
+        
+        if raw_messages:
+            new_items = [self._decode(raw_msg) for raw_msg in reversed(raw_messages)]
+            items = (items + new_items)[-window:]
+        
+        if not seq:
+            self.invalidate(user_id)
+        elif entry is None or entry["seq"] <= seq:
+            # Outra leitura pode ter gravado uma sequência mais nova enquanto o script rodava
+            self._store(user_id, seq, window, items)
+        
+        return [message for _, message in items[-limit:] if message is not None]
+    
+    def _store(self, user_id: str, seq: int, window: int, items: list):
+        """Grava a entrada do usuário e descarta as menos usadas acima do limite de memória"""
+        self.invalidate(user_id)
+        size = sum(item_size for item_size, _ in items)
+        self._entries[user_id] = {"seq": seq, "window": window, "items": items, "bytes": size}
+        self._bytes += size
+        
+        while self._bytes > self.max_bytes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted["bytes"]
+            self.stats["evictions"] += 1
+    
+    def invalidate(self, user_id: str):
+        """Remove o histórico em cache do usuário"""
+        entry = self._entries.pop(user_id, None)
+        if entry is not None:
+            self._bytes -= entry["bytes"]
+    
+    def get_stats(self) -> dict:
+        """Retorna contadores e ocupação do cache"""
+        total = self.stats["hits"] + self.stats["partial_hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_rate": round((self.stats["hits"] + self.stats["partial_hits"]) / total, 4) if total else 0.0,
+            "users": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes
+        }
+
 class ChatRedisDatabase:
     """
     Gerenciador de histórico de chat usando Redis para melhor performance
@@ -21,6 +292,7 @@ class ChatRedisDatabase:
             key_prefix: Prefixo para chaves no Redis
         """
         self.key_prefix = key_prefix
+        self.history_cache = DecodedHistoryCache()
         
         # Configuração do Redis
         if redis_url is None:
@@ -37,6 +309,8 @@ class ChatRedisDatabase:
             
             # Testar conexão
             self.redis_client.ping()
+            self._append_history = self.redis_client.register_script(APPEND_HISTORY_SCRIPT)
+            self._read_history = self.redis_client.register_script(READ_HISTORY_SCRIPT)
             print("✅ Conectado ao Redis com sucesso!")
             
         except (redis.ConnectionError, redis.TimeoutError) as e:
@@ -49,6 +323,10 @@ class ChatRedisDatabase:
         """Gera chave única para o chat do usuário"""
         return f"{self.key_prefix}{user_id}"
     
+    def _get_seq_key(self, user_id: str) -> str:
+        """Gera a chave da sequência do histórico (versão usada pelo cache decodificado)"""
+        return f"{self._get_chat_key(user_id)}:seq"
+    
     def _get_confirmation_key(self, user_id: str) -> str:
         """Gera chave única para dados de confirmação do usuário"""
         return f"confirmation:{user_id}"
@@ -144,46 +422,19 @@ class ChatRedisDatabase:
         try:
             chat_key = self._get_chat_key(user_id)
             
-            # Converter bytes para string se necessário
-            if isinstance(messages_json, bytes):
-                messages_str = messages_json.decode('utf-8')
-            else:
-                messages_str = json.dumps(messages_json) if not isinstance(messages_json, str) else messages_json
-            
-            # Parse das mensagens
-            messages_list = json.loads(messages_str)
-            
-            # Filtrar mensagens válidas (evita problemas com tool calls órfãs)
-            valid_messages = []
-            for message in messages_list:
-                # Não salvar mensagens de tool sem contexto adequado
-                if isinstance(message, dict):
-                    # Verificar se é mensagem de tool órfã
-                    parts = message.get('parts', [])
-                    if parts and isinstance(parts[0], dict) and parts[0].get('role') == 'tool':
-                        print(f"⚠️ Pulando mensagem de tool órfã")
-                        continue  # Pular mensagens de tool órfãs
-                    
-                valid_messages.append(message)
+            valid_messages = _filter_valid_messages(messages_json)
             
             if self.redis_client:
-                # Adicionar apenas mensagens válidas ao Redis
-                for message in valid_messages:
-                    message_with_timestamp = {
-                        "timestamp": datetime.now().isoformat(),
-                        "data": message
-                    }
-                    
-                    # Adicionar mensagem ao início da lista (LPUSH)
-                    self.redis_client.lpush(chat_key, json.dumps(message_with_timestamp))
-                
-                # Manter apenas as últimas 100 mensagens
-                self.redis_client.ltrim(chat_key, 0, 99)
-                
-                # Definir expiração de 7 dias
-                self.redis_client.expire(chat_key, 7 * 24 * 3600)
+                # LPUSH + LTRIM (últimas 100) + EXPIRE (7 dias) em um único round trip
+                # (sem mensagens válidas o script só renova o EXPIRE)
+                entries = _build_history_entries(valid_messages)
+                self._append_history(
+                    keys=[chat_key, self._get_seq_key(user_id)],
+                    args=_append_history_args(entries)
+                )
                 
-                print(f"💾 {len(valid_messages)} mensagens válidas adicionadas ao Redis para usuário {user_id}")
+                if valid_messages:
+                    print(f"💾 {len(valid_messages)} mensagens válidas adicionadas ao Redis para usuário {user_id}")
                 
             else:
                 # Fallback: memória local
@@ -194,8 +445,8 @@ class ChatRedisDatabase:
                     self._local_cache[user_id].insert(0, json.dumps(message))
                 
                 # Manter apenas últimas 100 mensagens
-                if len(self._local_cache[user_id]) > 100:
-                    self._local_cache[user_id] = self._local_cache[user_id][:100]
+                if len(self._local_cache[user_id]) > CHAT_HISTORY_MAX_MESSAGES:
+                    self._local_cache[user_id] = self._local_cache[user_id][:CHAT_HISTORY_MAX_MESSAGES]
                 
         except Exception as e:
             print(f"❌ Erro ao adicionar mensagens no Redis: {e}")
@@ -216,30 +467,24 @@ class ChatRedisDatabase:
             chat_key = self._get_chat_key(user_id)
             
             if self.redis_client:
-                # Buscar mensagens do Redis (LRANGE pega da mais recente para mais antiga)
-                raw_messages = self.redis_client.lrange(chat_key, 0, limit - 1)
+                # Buscar só as entradas gravadas depois do que já está decodificado em cache
+                cached_seq = self.history_cache.cached_seq(user_id, limit)
+                seq, raw_messages = self._read_history(
+                    keys=[chat_key, self._get_seq_key(user_id)],
+                    args=[cached_seq, limit]
+                )
+                messages = self.history_cache.apply(user_id, limit, cached_seq, int(seq), raw_messages)
+                if messages is None:
+                    # O cache mudou durante a leitura: reler a janela inteira
+                    seq, raw_messages = self._read_history(
+                        keys=[chat_key, self._get_seq_key(user_id)],
+                        args=[0, limit]
+                    )
+                    messages = self.history_cache.apply(user_id, limit, 0, int(seq), raw_messages)
                 
-                if not raw_messages:
+                if not messages:
                     return []
                 
-                # Converter de volta para objetos de mensagem do Pydantic AI
-                messages = []
-                for raw_msg in reversed(raw_messages):  # Reverter para ordem cronológica
-                    try:
-                        msg_data = json.loads(raw_msg)
-                        message_content = msg_data.get("data")
-                        
-                        # Usar o ModelMessagesTypeAdapter para deserializar
-                        if isinstance(message_content, str):
-                            parsed_message = ModelMessagesTypeAdapter.validate_json(message_content)[0]
-                        else:
-                            parsed_message = ModelMessagesTypeAdapter.validate_python([message_content])[0]
-                        messages.append(parsed_message)
-                        
-                    except Exception as parse_error:
-                        print(f"⚠️ Erro ao processar mensagem: {parse_error}")
-                        continue
-                
                 print(f"📚 {len(messages)} mensagens recuperadas do Redis para usuário {user_id}")
                 return messages
                 
@@ -251,11 +496,7 @@ class ChatRedisDatabase:
                 messages = []
                 for message_data in reversed(self._local_cache[user_id][:limit]):
                     try:
-                        if isinstance(message_data, str):
-                            parsed_message = ModelMessagesTypeAdapter.validate_json(message_data)[0]
-                        else:
-                            parsed_message = ModelMessagesTypeAdapter.validate_python([message_data])[0]
-                        messages.append(parsed_message)
+                        messages.append(_decode_local_message(message_data))
                     except Exception as e:
                         print(f"⚠️ Erro ao processar mensagem: {e}")
                         continue
@@ -276,8 +517,10 @@ class ChatRedisDatabase:
         try:
             chat_key = self._get_chat_key(user_id)
             
+            self.history_cache.invalidate(user_id)
+            
             if self.redis_client:
-                self.redis_client.delete(chat_key)
+                self.redis_client.delete(chat_key, self._get_seq_key(user_id))
                 print(f"✅ Histórico do usuário {user_id} limpo do Redis")
             else:
                 if user_id in self._local_cache:
@@ -332,6 +575,248 @@ class ChatRedisDatabase:
                 print(f"⚠️ Erro ao fechar Redis: {e}")
 
 
+class AsyncChatRedisDatabase:
+    """
+    Versão assíncrona do ChatRedisDatabase (redis.asyncio)
+    
+    Mesma interface, mas todos os métodos são awaitable e usam o pool de
+    conexões compartilhado do processo, sem bloquear o event loop.
+    """
+    def __init__(self, key_prefix: str = "chat:"):
+        """
+        Args:
+            key_prefix: Prefixo para chaves no Redis
+        """
+        self.key_prefix = key_prefix
+        self.history_cache = DecodedHistoryCache()
+        self.redis_client = get_async_redis_client()
+        self._append_history = self.redis_client.register_script(APPEND_HISTORY_SCRIPT)
+        self._read_history = self.redis_client.register_script(READ_HISTORY_SCRIPT)
+        self._local_cache = {}  # Fallback para memória local
+    
+    async def connect(self) -> bool:
+        """
+        Testa a conexão com o Redis (chamado na inicialização da aplicação)
+        
+        Returns:
+            True se conectado; False se passou a usar o fallback em memória
+        """
+        try:
+            await self.redis_client.ping()
+            print("✅ Conectado ao Redis (async) com sucesso!")
+            return True
+        except Exception as e:
+            print(f"⚠️ Erro ao conectar Redis: {e}")
+            print("🔄 Usando modo fallback (memória local)")
+            self.redis_client = None
+            return False
+    
+    def _get_chat_key(self, user_id: str) -> str:
+        """Gera chave única para o chat do usuário"""
+        return f"{self.key_prefix}{user_id}"
+    
+    def _get_seq_key(self, user_id: str) -> str:
+        """Gera a chave da sequência do histórico (versão usada pelo cache decodificado)"""
+        return f"{self._get_chat_key(user_id)}:seq"
+    
+    def _get_confirmation_key(self, user_id: str) -> str:
+        """Gera chave única para dados de confirmação do usuário"""
+        return f"confirmation:{user_id}"
+    
+    async def save_pending_confirmation(self, user_id: str, data: dict, expires_in: int = 300) -> bool:
+        """
+        Salva dados pendentes de confirmação (válidos por 5 minutos)
+        
+        Args:
+            user_id: ID do usuário
+            data: Dados da transação pendente 
+            expires_in: Tempo de expiração em segundos (padrão: 300s = 5min)
+        """
+        try:
+            key = self._get_confirmation_key(user_id)
+            
+            if self.redis_client:
+                await self.redis_client.setex(key, expires_in, json.dumps(data, ensure_ascii=False))
+            else:
+                self._local_cache[key] = data
+            return True
+                
+        except Exception as e:
+            print(f"❌ Erro ao salvar confirmação pendente: {e}")
+            return False
+    
+    async def get_pending_confirmation(self, user_id: str) -> Optional[dict]:
+        """
+        Recupera dados pendentes de confirmação
+        
+        Args:
+            user_id: ID do usuário
+            
+        Returns:
+            Dados da transação pendente ou None se não existir
+        """
+        try:
+            key = self._get_confirmation_key(user_id)
+            
+            if self.redis_client:
+                data = await self.redis_client.get(key)
+                return json.loads(data) if data else None
+            return self._local_cache.get(key)
+                
+        except Exception as e:
+            print(f"❌ Erro ao recuperar confirmação pendente: {e}")
+            return None
+    
+    async def clear_pending_confirmation(self, user_id: str) -> bool:
+        """
+        Remove dados pendentes de confirmação
+        
+        Args:
+            user_id: ID do usuário
+        """
+        try:
+            key = self._get_confirmation_key(user_id)
+            
+            if self.redis_client:
+                await self.redis_client.delete(key)
+            else:
+                self._local_cache.pop(key, None)
+            return True
+                
+        except Exception as e:
+            print(f"❌ Erro ao limpar confirmação pendente: {e}")
+            return False
+    
+    async def add_messages(self, user_id: str, messages_json: bytes):
+        """
+        Adiciona novas mensagens ao histórico do usuário no Redis.
+        
+        Args:
+            user_id: ID do usuário
+            messages_json: Mensagens em formato JSON bytes (do Pydantic AI)
+        """
+        try:
+            chat_key = self._get_chat_key(user_id)
+            valid_messages = _filter_valid_messages(messages_json)
+            
+            if self.redis_client:
+                # LPUSH + LTRIM (últimas 100) + EXPIRE (7 dias) em um único round trip
+                # (sem mensagens válidas o script só renova o EXPIRE)
+                entries = _build_history_entries(valid_messages)
+                await self._append_history(
+                    keys=[chat_key, self._get_seq_key(user_id)],
+                    args=_append_history_args(entries)
+                )
+                
+                if valid_messages:
+                    print(f"💾 {len(valid_messages)} mensagens válidas adicionadas ao Redis para usuário {user_id}")
+                
+            else:
+                history = self._local_cache.setdefault(user_id, [])
+                for message in valid_messages:
+                    history.insert(0, json.dumps(message))
+                del history[CHAT_HISTORY_MAX_MESSAGES:]
+                
+        except Exception as e:
+            print(f"❌ Erro ao adicionar mensagens no Redis: {e}")
+            raise e
+    
+    async def get_messages(self, user_id: str, limit: int = 50) -> List[ModelMessage]:
+        """
+        Recupera mensagens do histórico do usuário.
+        
+        Args:
+            user_id: ID do usuário
+            limit: Número máximo de mensagens para retornar
+            
+        Returns:
+            Lista de mensagens no formato do Pydantic AI
+        """
+        try:
+            if self.redis_client:
+                # Buscar só as entradas gravadas depois do que já está decodificado em cache
+                keys = [self._get_chat_key(user_id), self._get_seq_key(user_id)]
+                cached_seq = self.history_cache.cached_seq(user_id, limit)
+                seq, raw_messages = await self._read_history(keys=keys, args=[cached_seq, limit])
+                messages = self.history_cache.apply(user_id, limit, cached_seq, int(seq), raw_messages)
+                if messages is None:
+                    # O cache mudou durante a leitura: reler a janela inteira
+                    seq, raw_messages = await self._read_history(keys=keys, args=[0, limit])
+                    messages = self.history_cache.apply(user_id, limit, 0, int(seq), raw_messages)
+            else:
+                messages = []
+                for raw_msg in reversed(self._local_cache.get(user_id, [])[:limit]):  # Ordem cronológica
+                    try:
+                        messages.append(_decode_local_message(raw_msg))
+                    except Exception as parse_error:
+                        print(f"⚠️ Erro ao processar mensagem: {parse_error}")
+                        continue
+            
+            if messages:
+                print(f"📚 {len(messages)} mensagens recuperadas do Redis para usuário {user_id}")
+            return messages
+                
+        except Exception as e:
+            print(f"❌ Erro ao carregar mensagens: {e}")
+            return []
+    
+    async def clear_chat(self, user_id: str):
+        """
+        Limpa histórico de chat de um usuário específico
+        
+        Args:
+            user_id: ID único do usuário
+        """
+        try:
+            self.history_cache.invalidate(user_id)
+            
+            if self.redis_client:
+                await self.redis_client.delete(self._get_chat_key(user_id), self._get_seq_key(user_id))
+                print(f"✅ Histórico do usuário {user_id} limpo do Redis")
+            else:
+                self._local_cache.pop(user_id, None)
+                print(f"✅ Histórico do usuário {user_id} limpo da memória local")
+                
+        except Exception as e:
+            print(f"❌ Erro ao limpar chat: {e}")
+    
+    async def get_chat_stats(self, user_id: str) -> dict:
+        """
+        Retorna estatísticas do chat do usuário
+        
+        Args:
+            user_id: ID único do usuário
+            
+        Returns:
+            Dicionário com estatísticas
+        """
+        try:
+            if self.redis_client:
+                chat_key = self._get_chat_key(user_id)
+                async with self.redis_client.pipeline(transaction=False) as pipe:
+                    message_count, ttl = await pipe.llen(chat_key).ttl(chat_key).execute()
+                
+                return {
+                    "message_count": message_count,
+                    "ttl_seconds": ttl,
+                    "storage": "redis"
+                }
+            
+            return {
+                "message_count": len(self._local_cache.get(user_id, [])),
+                "ttl_seconds": -1,
+                "storage": "local_memory"
+            }
+                
+        except Exception as e:
+            print(f"❌ Erro ao obter estatísticas: {e}")
+            return {"message_count": 0, "ttl_seconds": -1, "storage": "error"}
+    
+    async def close(self):
+        """Fecha o pool de conexões compartilhado"""
+        await close_async_redis_client()
+
+
 # Manter compatibilidade com código existente
 class ChatDatabase(ChatRedisDatabase):
     """
@@ -5,7 +5,10 @@ O agente pode construir queries SQL flexíveis baseado nas necessidades do usuá
 from typing import Dict, List, Any, Optional, Tuple
 from datetime import datetime, timedelta, date
 import json
-from functions_database import supabase
+from functions_database import supabase, get_transaction_totals, get_category_totals
+from functions_database_async import run_db
+from trend_engine import get_trend
+from recurrence_scheduler import expand_virtual
 
 class DynamicQueryBuilder:
     """Construtor de queries dinâmicas para dados financeiros"""
@@ -387,6 +390,10 @@ class DynamicQueryBuilder:
                 date_range['start_date'] = period_start
             if period_end:
                 date_range['end_date'] = period_end
+            
+            # Tendências usam o agrupamento para escolher semana/mês e o detalhamento por categoria
+            if query_type == "trends" and grouping:
+                filters = {**filters, "grouping": grouping}
                 
             # Executar a query dinâmica
             results = await execute_dynamic_query(
@@ -563,11 +570,49 @@ async def _execute_supabase_native_query(
             if limit:
                 query = query.limit(limit)
             
-            resp = query.execute()
-            return resp.data or []
+            resp = await run_db(query.execute)
+            transactions = resp.data or []
+            
+            # Ocorrências futuras de recorrências ainda não gravadas (pendentes)
+            end_date = date_range.get("end_date") if date_range else None
+            if end_date and filters.get("is_paid") is not True:
+                start_date = date_range.get("start_date") or date.today().replace(day=1).isoformat()
+                virtual = await run_db(expand_virtual, user_id, start_date, end_date, filters.get("transaction_type"))
+                virtual = [
+                    t for t in virtual
+                    if (not filters.get("payment_method") or t.get("payment_method") == filters["payment_method"])
+                    and (not filters.get("description") or filters["description"].lower() in t["description"].lower())
+                    and (not filters.get("valor_min") or t["amount"] >= filters["valor_min"])
+                    and (not filters.get("valor_max") or t["amount"] <= filters["valor_max"])
+                ]
+                if virtual:
+                    transactions = sorted(transactions + virtual, key=lambda t: t.get("due_date") or "")
+                    if limit:
+                        transactions = transactions[:limit]
+            
+            return transactions
             
         elif query_type == "summary":
-            # Para resumo, precisamos fazer query manual e agrupar
+            start_date = date_range.get("start_date") if date_range else None
+            end_date = date_range.get("end_date") if date_range else None
+            
+            # Agrupar por categoria no banco
+            category_rows = await run_db(
+                get_category_totals, user_id, start_date, end_date,
+                date_field="due_date", transaction_type=filters.get("transaction_type")
+            )
+            if category_rows is not None:
+                return [
+                    {
+                        "category_name": row["category_name"] or "Sem categoria",
+                        "total_amount": row["total"],
+                        "count_transactions": row["count"],
+                        "transaction_type": row["transaction_type"],
+                        "avg_amount": row["total"] / row["count"]
+                    } for row in category_rows
+                ]
+            
+            # Fallback: buscar as transações e agrupar em Python
             query = supabase.table("transactions").select("""
                 amount, transaction_type,
                 categories(name),
@@ -584,7 +629,7 @@ async def _execute_supabase_native_query(
                 if date_range.get("end_date"):
                     query = query.lte("due_date", date_range["end_date"])
             
-            resp = query.execute()
+            resp = await run_db(query.execute)
             transactions = resp.data or []
             
             # Agrupar por categoria
@@ -610,7 +655,24 @@ async def _execute_supabase_native_query(
             return list(summary_by_category.values())
             
         elif query_type == "balance":
-            # Para balance, buscar receitas e despesas separadamente
+            start_date = date_range.get("start_date") if date_range else None
+            end_date = date_range.get("end_date") if date_range else None
+            
+            # Somar receitas e despesas no banco
+            totals = await run_db(
+                get_transaction_totals, user_id, start_date, end_date,
+                date_field="due_date", is_paid=filters.get("is_paid")
+            )
+            if totals is not None:
+                return [{
+                    "total_income": totals["income"]["total"],
+                    "total_expenses": totals["expense"]["total"],
+                    "balance": totals["income"]["total"] - totals["expense"]["total"],
+                    "income_count": totals["income"]["count"],
+                    "expense_count": totals["expense"]["count"]
+                }]
+            
+            # Fallback: buscar receitas e despesas separadamente
             
             # Receitas
             income_query = supabase.table("transactions").select("amount").eq("user_id", user_id).eq("transaction_type", "income")
@@ -627,7 +689,7 @@ async def _execute_supabase_native_query(
                 else:
                     income_query = income_query.is_("paid_date", "null")
             
-            income_resp = income_query.execute()
+            income_resp = await run_db(income_query.execute)
             
             # Despesas 
             expense_query = supabase.table("transactions").select("amount").eq("user_id", user_id).eq("transaction_type", "expense")
@@ -644,7 +706,7 @@ async def _execute_supabase_native_query(
                 else:
                     expense_query = expense_query.is_("paid_date", "null")
                     
-            expense_resp = expense_query.execute()
+            expense_resp = await run_db(expense_query.execute)
             
             # Calcular totais
             total_income = sum(float(t["amount"]) for t in (income_resp.data or []))
@@ -659,6 +721,21 @@ async def _execute_supabase_native_query(
                 "expense_count": len(expense_resp.data or [])
             }]
             
+        elif query_type == "trends":
+            granularity = "week" if filters.get("grouping") == "week" else "month"
+            start_date = date_range.get("start_date") if date_range else None
+            end_date = date_range.get("end_date") if date_range else None
+            
+            return await run_db(
+                get_trend,
+                user_id,
+                periods=limit or 6,
+                granularity=granularity,
+                by_category=filters.get("grouping") == "category",
+                start_date=date.fromisoformat(start_date) if start_date else None,
+                end_date=date.fromisoformat(end_date) if end_date else None
+            )
+            
         else:
             return []
             
@@ -0,0 +1,143 @@
+"""
+Cliente HTTP compartilhado para a Evolution API
+Um único httpx.AsyncClient por processo, com pool keep-alive e HTTP/2 quando disponível
+"""
+import os
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Configurações Evolution API
+EVOLUTION_BASE_URL = os.getenv("EVOLUTION_API_URL", "http://localhost:8080")
+EVOLUTION_API_KEY = os.getenv("EVOLUTION_TOKEN", "")
+EVOLUTION_INSTANCE = os.getenv("EVOLUTION_INSTANCE", "assistente-financeiro")
+
+# Configurações do pool de conexões
+EVOLUTION_MAX_CONNECTIONS = int(os.getenv("EVOLUTION_MAX_CONNECTIONS", "50"))
+EVOLUTION_MAX_KEEPALIVE = int(os.getenv("EVOLUTION_MAX_KEEPALIVE", "20"))
+EVOLUTION_KEEPALIVE_EXPIRY = float(os.getenv("EVOLUTION_KEEPALIVE_EXPIRY", "60"))
+EVOLUTION_CONNECT_TIMEOUT = float(os.getenv("EVOLUTION_CONNECT_TIMEOUT", "5"))
+EVOLUTION_TIMEOUT = float(os.getenv("EVOLUTION_TIMEOUT", "30"))
+EVOLUTION_HTTP2 = os.getenv("EVOLUTION_HTTP2", "true").lower() == "true"
+
+# HTTP/2 depende do pacote h2 (httpx[http2])
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class EvolutionClient:
+    """Cliente da Evolution API com ciclo de vida ligado à aplicação"""
+
+    def __init__(self, base_url: str = EVOLUTION_BASE_URL, api_key: str = EVOLUTION_API_KEY):
+        """
+        Args:
+            base_url: URL base da Evolution API
+            api_key: Chave de API enviada no header `apikey`
+        """
+        self.base_url = base_url
+        self.api_key = api_key
+        self._client: Optional[httpx.AsyncClient] = None
+
+    async def startup(self):
+        """Abre o pool de conexões (chamado na inicialização da aplicação)"""
+        if self._client is not None:
+            return
+
+        http2 = EVOLUTION_HTTP2 and HTTP2_AVAILABLE
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers={"apikey": self.api_key},
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=EVOLUTION_MAX_CONNECTIONS,
+                max_keepalive_connections=EVOLUTION_MAX_KEEPALIVE,
+                keepalive_expiry=EVOLUTION_KEEPALIVE_EXPIRY
+            ),
+            timeout=httpx.Timeout(EVOLUTION_TIMEOUT, connect=EVOLUTION_CONNECT_TIMEOUT)
+        )
+        print(f"✅ Cliente Evolution API iniciado ({'HTTP/2' if http2 else 'HTTP/1.1'})")
+
+    async def shutdown(self):
+        """Fecha o pool de conexões (chamado no encerramento da aplicação)"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            print("✅ Cliente Evolution API encerrado")
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            raise RuntimeError("EvolutionClient não iniciado - chame startup() antes de usar")
+        return self._client
+
+    async def send_text(self, number: str, text: str, instance: str = EVOLUTION_INSTANCE) -> httpx.Response:
+        """
+        Envia mensagem de texto
+
+        Args:
+            number: Número no formato internacional (ex: 5548999999999)
+            text: Texto da mensagem
+            instance: Nome da instância
+
+        Returns:
+            Resposta HTTP da Evolution API
+        """
+        return await self.client.post(
+            f"/message/sendText/{instance}",
+            json={"number": number, "text": text}
+        )
+
+    async def get_base64_from_media(self, instance: str, message_id: str, convert_to_mp4: bool = False) -> httpx.Response:
+        """
+        Solicita o conteúdo de uma mídia recebida em base64
+
+        Args:
+            instance: Nome da instância
+            message_id: ID da mensagem com a mídia
+            convert_to_mp4: Se deve converter áudio para MP4
+
+        Returns:
+            Resposta HTTP da Evolution API
+        """
+        return await self.client.post(
+            f"/chat/getBase64FromMediaMessage/{instance}",
+            json=self._media_request(message_id, convert_to_mp4)
+        )
+
+    @asynccontextmanager
+    async def stream_base64_from_media(self, instance: str, message_id: str,
+                                       convert_to_mp4: bool = False) -> AsyncIterator[httpx.Response]:
+        """
+        Como get_base64_from_media, mas sem ler o corpo: o JSON é consumido aos
+        pedaços com `response.aiter_bytes()` dentro do bloco `async with`
+
+        Returns:
+            Resposta HTTP da Evolution API (corpo ainda não lido)
+        """
+        async with self.client.stream(
+            "POST",
+            f"/chat/getBase64FromMediaMessage/{instance}",
+            json=self._media_request(message_id, convert_to_mp4)
+        ) as response:
+            yield response
+
+    @staticmethod
+    def _media_request(message_id: str, convert_to_mp4: bool) -> dict:
+        return {
+            "convertToMp4": "true" if convert_to_mp4 else "false",
+            "message": {
+                "key": {
+                    "id": message_id
+                }
+            }
+        }
+
+
+# Instância global compartilhada pela aplicação
+evolution_client = EvolutionClient()
@@ -1,4 +1,7 @@
 from database import supabase
+from invoice_engine import add_to_invoice
+from billing_cycle import schedule_purchase, split_amount
+from keyset_pagination import fetch_page
 from datetime import datetime, date
 import calendar
 
@@ -90,54 +93,17 @@ def create_or_update_invoice(user_id: str, credit_card_id: str, bill_month: int,
         bill_month: Mês da fatura
         bill_year: Ano da fatura
         amount: Valor a ser adicionado na fatura
+    
+    As compras gravadas em transactions já entram nas faturas pelos triggers do banco;
+    esta função é para ajustes avulsos (o RPC só é aceito com a chave service_role)
     """
     if not supabase:
         print(f"Mock: Criando/atualizando fatura - Cartão: {credit_card_id}, Mês: {bill_month}/{bill_year}, Valor: R$ {amount:.2f}")
         return {"success": True}
     
     try:
-        # Buscar fatura existente (usando nomes corretos dos campos)
-        existing_invoice = supabase.table("invoices").select("*").eq("user_id", user_id).eq("credit_card_id", credit_card_id).eq("month", bill_month).eq("year", bill_year).execute()
-        
-        if existing_invoice.data:
-            # Atualizar fatura existente
-            current_amount = existing_invoice.data[0]["total_amount"] or 0
-            new_amount = current_amount + amount
-            
-            resp = supabase.table("invoices").update({
-                "total_amount": new_amount
-            }).eq("id", existing_invoice.data[0]["id"]).execute()
-            
-            return {"success": True, "invoice_id": existing_invoice.data[0]["id"], "new_amount": new_amount}
-        else:
-            # Buscar detalhes do cartão para obter as datas
-            card_details = get_credit_card_details(user_id, credit_card_id)
-            if not card_details:
-                return {"success": False, "message": "Cartão não encontrado"}
-            
-            # Calcular datas da fatura
-            due_date = date(bill_year, bill_month, card_details["due_day"])
-            
-            # Criar nova fatura
-            invoice_data = {
-                "user_id": user_id,
-                "credit_card_id": credit_card_id,
-                "total_amount": amount,
-                "month": bill_month,
-                "year": bill_year,
-                "due_date": due_date.isoformat(),
-                "close_day": card_details["close_day"],
-                "is_paid": False,
-                "paid_date": None
-            }
-            
-            resp = supabase.table("invoices").insert(invoice_data).execute()
-            
-            if resp.data:
-                return {"success": True, "invoice_id": resp.data[0]["id"], "new_amount": amount}
-            else:
-                return {"success": False, "message": "Erro ao criar fatura"}
-                
+        # Incremento atômico no banco (sem ler e regravar o total)
+        return add_to_invoice(user_id, credit_card_id, bill_month, bill_year, amount)
     except Exception as e:
         print(f"Erro ao criar/atualizar fatura: {e}")
         return {"success": False, "message": str(e)}
@@ -219,8 +185,13 @@ def get_user_categories(user_id: str):
 def save_expense_transaction(user_id: str, amount: float, description: str, category_id: str, 
                            payment_method: str = "pix", credit_card_id: str = None, 
                            installments: int = 1, recurrence: bool = False, due_day: int = None, 
-                           recurring_months: int = None):
-    """Salva uma despesa na tabela transactions"""
+                           recurring_months: int = None, credit_card: dict = None):
+    """
+    Salva uma despesa na tabela transactions
+    
+    credit_card: linha do cartão já carregada (ex: do contexto do usuário), evita buscá-la de novo.
+    A fatura do cartão é atualizada pelo banco ao inserir a transação.
+    """
     if not supabase:
         print(f"Mock: Salvando despesa - Usuário: {user_id}, Valor: R$ {amount:.2f}, Descrição: {description}, Categoria: {category_id}")
         return {"success": True, "message": "Despesa salva com sucesso! (modo desenvolvimento)"}
@@ -229,6 +200,7 @@ def save_expense_transaction(user_id: str, amount: float, description: str, cate
         # Definir datas baseado no método de pagamento e recorrência
         from datetime import date
         today = date.today()
+        installment_schedule = None
         
         # Lógica para despesas recorrentes
         if recurrence and due_day is not None:
@@ -253,29 +225,23 @@ def save_expense_transaction(user_id: str, amount: float, description: str, cate
                 paid_date = today_str
             # Para cartão de crédito: calcular data de vencimento baseada no ciclo
             elif payment_method == "cartao_credito" and credit_card_id:
-                # Buscar detalhes do cartão
-                card_details = get_credit_card_details(user_id, credit_card_id)
+                # Buscar detalhes do cartão (se não vieram do contexto)
+                card_details = None
+                if credit_card and credit_card.get("id") == credit_card_id and "close_day" in credit_card and "due_day" in credit_card:
+                    card_details = credit_card
+                if not card_details:
+                    card_details = get_credit_card_details(user_id, credit_card_id)
                 if card_details:
-                    # Calcular data de vencimento baseada no ciclo do cartão
-                    due_date_obj, close_date_obj = calculate_credit_card_due_date(
+                    # Vencimento de cada parcela baseado no ciclo do cartão
+                    installment_schedule = schedule_purchase(
                         today, 
                         card_details["close_day"], 
-                        card_details["due_day"]
+                        card_details["due_day"],
+                        installments
                     )
-                    due_date = due_date_obj.isoformat()
+                    due_date = installment_schedule[0]["due_date"].isoformat()
                     paid_date = None  # Cartão não é pago imediatamente
-                    
-                    # Atualizar/criar fatura do cartão
-                    bill_result = create_or_update_invoice(
-                        user_id, 
-                        credit_card_id, 
-                        due_date_obj.month, 
-                        due_date_obj.year, 
-                        amount
-                    )
-                    
-                    if not bill_result["success"]:
-                        print(f"Aviso: Erro ao atualizar fatura: {bill_result.get('message', 'Erro desconhecido')}")
+                    # Cada parcela entra na fatura do seu mês pelo trigger do banco
                 else:
                     # Cartão não encontrado, usar lógica padrão
                     due_date = None
@@ -303,55 +269,42 @@ def save_expense_transaction(user_id: str, amount: float, description: str, cate
         # Remove campos None para evitar erros
         transaction_data = {k: v for k, v in transaction_data.items() if v is not None}
         
-        # Para despesas recorrentes, criar o número especificado de parcelas (padrão 6 meses)
+        # Despesas recorrentes viram uma regra; as ocorrências são gravadas só até o horizonte
+        # do agendador e os meses seguintes são gerados por ele (ver recurrence_scheduler)
         if recurrence and due_day is not None:
-            transactions_to_insert = []
+            from recurrence_scheduler import create_rule
             
-            # Definir número de meses (padrão 6 se não informado)
-            months_to_create = recurring_months if recurring_months is not None else 6
+            result = create_rule(
+                user_id, "expense", amount, description, category_id, due_day,
+                payment_method=payment_method, credit_card_id=credit_card_id, months=recurring_months
+            )
+            period_text = f"pelos próximos {recurring_months} meses" if recurring_months else "todo mês, até ser cancelada"
+            return {
+                "success": True, 
+                "message": f"Despesa recorrente criada com sucesso! Repete {period_text}.",
+                "data": result["transactions"],
+                "recurring_count": len(result["transactions"]),
+                "rule_id": result["rule"]["id"]
+            }
+        elif installment_schedule and len(installment_schedule) > 1:
+            # Compra parcelada: uma transação por parcela, inseridas de uma vez
+            transactions_to_insert = []
+            parts = split_amount(abs(amount), len(installment_schedule))
             
-            # Criar as parcelas mensais
-            for month_offset in range(months_to_create):
+            for installment, part in zip(installment_schedule, parts):
                 transaction_copy = transaction_data.copy()
-                
-                # Calcular a data de vencimento para cada mês
-                target_year = today.year
-                target_month = today.month + month_offset
-                
-                # Ajustar ano se necessário
-                while target_month > 12:
-                    target_month -= 12
-                    target_year += 1
-                
-                # Criar a data de vencimento
-                try:
-                    due_date_obj = date(target_year, target_month, due_day)
-                except ValueError:
-                    # Se o dia não existe no mês (ex: dia 31 em fevereiro), usar último dia do mês
-                    import calendar
-                    last_day = calendar.monthrange(target_year, target_month)[1]
-                    due_date_obj = date(target_year, target_month, min(due_day, last_day))
-                
-                transaction_copy["due_date"] = due_date_obj.isoformat()
-                
-                # Adicionar sufixo na descrição para identificar o mês/ano
-                month_year = due_date_obj.strftime("%m/%Y")
-                transaction_copy["description"] = f"{description} - {month_year}"
-                
+                transaction_copy["amount"] = part
+                transaction_copy["due_date"] = installment["due_date"].isoformat()
+                transaction_copy["installment_number"] = installment["installment"]
+                transaction_copy["description"] = f"{description} ({installment['installment']}/{len(installment_schedule)})"
                 transactions_to_insert.append(transaction_copy)
             
-            # Inserir todas as parcelas de uma vez
             resp = supabase.table("transactions").insert(transactions_to_insert).execute()
-            
-            if resp.data:
-                return {
-                    "success": True, 
-                    "message": f"Despesa recorrente criada com sucesso! Geradas {len(transactions_to_insert)} parcelas para os próximos 6 meses.",
-                    "data": resp.data,
-                    "recurring_count": len(transactions_to_insert)
-                }
-            else:
-                return {"success": False, "message": "Erro ao criar despesas recorrentes"}
+            return {
+                "success": True,
+                "message": f"Despesa salva com sucesso! {len(transactions_to_insert)} parcelas registradas.",
+                "data": resp.data
+            }
         else:
             # Despesa normal (não recorrente)
             resp = supabase.table("transactions").insert(transaction_data).execute()
@@ -390,9 +343,107 @@ def get_recent_transactions(user_id: str, limit: int = 10):
         print(f"Erro ao buscar transações: {e}")
         return []
 
-def search_transactions(user_id: str, filters: dict = None):
+# Tamanho de página padrão e máximo das buscas de transações
+SEARCH_DEFAULT_LIMIT = 50
+SEARCH_MAX_LIMIT = 500
+
+
+def _escape_like(value: str) -> str:
+    """Escapa curingas para usar o texto literal em ilike"""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _plan_search_query(user_id: str, filters: dict):
+    """
+    Converte os filtros de search_transactions em predicados do PostgREST
+    
+    Categoria e cartão usam join interno (categories!inner / credit_cards!inner) para
+    filtrar no banco; dia e mês do vencimento usam as colunas geradas due_day/due_month.
     """
-    Busca transações com filtros avançados
+    category_join = "categories!inner" if filters.get("category_name") else "categories"
+    card_join = "credit_cards!inner" if filters.get("credit_card_name") else "credit_cards"
+    
+    query = supabase.table("transactions").select(f"""
+        id, amount, description, transaction_type, payment_method, 
+        due_date, paid_date, recurrence, installments, created_at,
+        {category_join}(id, name),
+        {card_join}(id, name)
+    """).eq("user_id", user_id)
+    
+    # Filtros de data
+    if filters.get("start_date"):
+        query = query.gte("created_at", f"{filters['start_date']}T00:00:00")
+    if filters.get("end_date"):
+        query = query.lte("created_at", f"{filters['end_date']}T23:59:59")
+    
+    if filters.get("payment_method"):
+        query = query.eq("payment_method", filters["payment_method"])
+    
+    if filters.get("recurrence"):
+        query = query.eq("recurrence", filters["recurrence"])
+    
+    # Categoria e cartão (comparação sem diferenciar maiúsculas)
+    if filters.get("category_name"):
+        query = query.ilike("categories.name", _escape_like(filters["category_name"]))
+    if filters.get("credit_card_name"):
+        query = query.ilike("credit_cards.name", _escape_like(filters["credit_card_name"]))
+    
+    # Status de pagamento
+    if filters.get("is_paid") is not None:
+        if filters["is_paid"]:
+            query = query.not_.is_("paid_date", "null")
+        else:
+            query = query.is_("paid_date", "null")
+    
+    # Dia e mês do vencimento (colunas geradas a partir de due_date)
+    if filters.get("due_day"):
+        query = query.eq("due_day", filters["due_day"])
+    if filters.get("due_month"):
+        query = query.eq("due_month", filters["due_month"])
+    
+    if filters.get("description_contains"):
+        query = query.ilike("description", f"%{_escape_like(filters['description_contains'])}%")
+    
+    if filters.get("min_amount"):
+        query = query.gte("amount", filters["min_amount"])
+    if filters.get("max_amount"):
+        query = query.lte("amount", filters["max_amount"])
+    
+    return query
+
+
+def search_transactions_page(user_id: str, filters: dict = None, limit: int = SEARCH_DEFAULT_LIMIT, cursor: str = None):
+    """
+    Busca uma página de transações com filtros avançados (paginação por keyset)
+    
+    Args:
+        user_id: ID do usuário
+        filters: Mesmos filtros de search_transactions
+        limit: Tamanho da página (máximo SEARCH_MAX_LIMIT)
+        cursor: next_cursor retornado pela página anterior
+    
+    Returns:
+        dict: {"transactions": [...], "next_cursor": str ou None}
+    """
+    if not supabase:
+        return {"transactions": [], "next_cursor": None}
+    
+    try:
+        limit = max(1, min(limit or SEARCH_DEFAULT_LIMIT, SEARCH_MAX_LIMIT))
+        query = _plan_search_query(user_id, filters or {})
+        
+        transactions, next_cursor = fetch_page(query, limit, cursor)
+        
+        return {"transactions": transactions, "next_cursor": next_cursor}
+        
+    except Exception as e:
+        print(f"Erro ao buscar transações: {e}")
+        return {"transactions": [], "next_cursor": None}
+
+
+def search_transactions(user_id: str, filters: dict = None, limit: int = SEARCH_DEFAULT_LIMIT, cursor: str = None):
+    """
+    Busca transações com filtros avançados (todos aplicados no banco)
     
     Filtros disponíveis:
     - start_date: Data início (YYYY-MM-DD)
@@ -406,98 +457,11 @@ def search_transactions(user_id: str, filters: dict = None):
     - description_contains: Texto que deve estar na descrição
     - min_amount: Valor mínimo
     - max_amount: Valor máximo
-    """
-    if not supabase:
-        return []
     
-    try:
-        # Query base com joins
-        query = supabase.table("transactions").select("""
-            id, amount, description, transaction_type, payment_method, 
-            due_date, paid_date, recurrence, installments, created_at,
-            categories(id, name),
-            credit_cards(id, name)
-        """).eq("user_id", user_id)
-        
-        if not filters:
-            # Sem filtros, retorna todas as transações
-            resp = query.order("created_at", desc=True).execute()
-            return resp.data or []
-        
-        # Aplicar filtros de data
-        if filters.get("start_date"):
-            query = query.gte("created_at", f"{filters['start_date']}T00:00:00")
-        if filters.get("end_date"):
-            query = query.lte("created_at", f"{filters['end_date']}T23:59:59")
-            
-        # Filtro por método de pagamento
-        if filters.get("payment_method"):
-            query = query.eq("payment_method", filters["payment_method"])
-            
-        # Filtro por recorrência
-        if filters.get("recurrence"):
-            query = query.eq("recurrence", filters["recurrence"])
-        
-        # Executar query base
-        resp = query.order("created_at", desc=True).execute()
-        transactions = resp.data or []
-        
-        # Aplicar filtros que precisam ser feitos no Python
-        filtered_transactions = []
-        
-        for transaction in transactions:
-            # Filtro por categoria
-            if filters.get("category_name"):
-                if not transaction.get("categories") or \
-                   transaction["categories"]["name"].lower() != filters["category_name"].lower():
-                    continue
-            
-            # Filtro por cartão de crédito
-            if filters.get("credit_card_name"):
-                if not transaction.get("credit_cards") or \
-                   transaction["credit_cards"]["name"].lower() != filters["credit_card_name"].lower():
-                    continue
-            
-            # Filtro por status de pagamento
-            if filters.get("is_paid") is not None:
-                is_paid = bool(transaction.get("paid_date"))
-                if is_paid != filters["is_paid"]:
-                    continue
-            
-            # Filtro por dia do vencimento
-            if filters.get("due_day"):
-                if not transaction.get("due_date"):
-                    continue
-                due_date = datetime.fromisoformat(transaction["due_date"].replace('Z', '+00:00'))
-                if due_date.day != filters["due_day"]:
-                    continue
-            
-            # Filtro por mês do vencimento
-            if filters.get("due_month"):
-                if not transaction.get("due_date"):
-                    continue
-                due_date = datetime.fromisoformat(transaction["due_date"].replace('Z', '+00:00'))
-                if due_date.month != filters["due_month"]:
-                    continue
-            
-            # Filtro por conteúdo na descrição
-            if filters.get("description_contains"):
-                if filters["description_contains"].lower() not in transaction["description"].lower():
-                    continue
-            
-            # Filtros por valor
-            if filters.get("min_amount") and transaction["amount"] < filters["min_amount"]:
-                continue
-            if filters.get("max_amount") and transaction["amount"] > filters["max_amount"]:
-                continue
-                
-            filtered_transactions.append(transaction)
-        
-        return filtered_transactions
-        
-    except Exception as e:
-        print(f"Erro ao buscar transações: {e}")
-        return []
+    Retorna no máximo `limit` transações, das mais recentes para as mais antigas;
+    use search_transactions_page para obter o cursor da próxima página.
+    """
+    return search_transactions_page(user_id, filters, limit, cursor)["transactions"]
 
 def mark_transaction_as_paid(transaction_id: str, user_id: str, paid_date: str = None):
     """
@@ -692,47 +656,20 @@ def save_income_transaction(user_id: str, amount: float, description: str, categ
         # Remove campos None para evitar erros
         transaction_data = {k: v for k, v in transaction_data.items() if v is not None}
         
-        # Para receitas recorrentes, criar o número especificado de parcelas (padrão 6 meses)
+        # Receitas recorrentes viram uma regra (ver recurrence_scheduler)
         if recurrence and due_day is not None:
-            transactions_to_insert = []
-            
-            # Definir número de meses (padrão 6 se não informado)
-            months_to_create = recurring_months if recurring_months is not None else 6
-            
-            # Criar as parcelas mensais
-            for month_offset in range(months_to_create):
-                transaction_copy = transaction_data.copy()
-                
-                # Calcular a data de vencimento para cada mês
-                target_year = today.year
-                target_month = today.month + month_offset
-                
-                # Ajustar ano se necessário
-                while target_month > 12:
-                    target_month -= 12
-                    target_year += 1
-                
-                # Calcular data de vencimento
-                try:
-                    due_date_obj = date(target_year, target_month, due_day)
-                except ValueError:
-                    # Se o dia não existe no mês, usar último dia
-                    import calendar
-                    last_day = calendar.monthrange(target_year, target_month)[1]
-                    due_date_obj = date(target_year, target_month, min(due_day, last_day))
-                
-                transaction_copy["due_date"] = due_date_obj.isoformat()
-                transaction_copy["paid_date"] = None  # Receitas recorrentes aguardam confirmação
-                
-                transactions_to_insert.append(transaction_copy)
-            
-            # Inserir todas as parcelas
-            resp = supabase.table("transactions").insert(transactions_to_insert).execute()
+            from recurrence_scheduler import create_rule
             
+            result = create_rule(
+                user_id, "income", amount, description, category_id, due_day,
+                payment_method=payment_method, months=recurring_months
+            )
+            period_text = f"pelos próximos {recurring_months} meses" if recurring_months else "todo mês, até ser cancelada"
             return {
                 "success": True, 
-                "message": f"Receita recorrente criada com sucesso! {months_to_create} parcelas mensais registradas.",
-                "transactions": resp.data
+                "message": f"Receita recorrente criada com sucesso! Repete {period_text}.",
+                "transactions": result["transactions"],
+                "rule_id": result["rule"]["id"]
             }
         else:
             # Inserir receita única
@@ -896,6 +833,139 @@ def mark_expense_as_paid(transaction_id: str, user_id: str, paid_date: str = Non
 
 # ==================== FUNÇÕES DE SALDO E ANÁLISES ====================
 
+def _rpc(function_name: str, params: dict):
+    """
+    Executa uma função SQL (supabase/migrations) via RPC
+    
+    Returns:
+        list: Linhas retornadas, ou None se o RPC falhar (ex: migração ainda não aplicada)
+    """
+    try:
+        resp = supabase.rpc(function_name, params).execute()
+        return resp.data or []
+    except Exception as e:
+        print(f"Aviso: RPC {function_name} indisponível, usando consulta direta: {e}")
+        return None
+
+
+def _period_rollups(user_id: str, start_date: str, end_date: str, date_field: str,
+                    is_paid: bool, transaction_type: str = None):
+    """
+    Linhas de monthly_rollups equivalentes ao filtro, ou None se ele não puder ser
+    atendido pelos rollups (período que corta meses ou combinação de data/situação
+    diferente de paid_date+pagas ou due_date+pendentes)
+    """
+    if (date_field, is_paid) not in (("paid_date", True), ("due_date", False)):
+        return None
+    
+    from rollups import get_period_rollups
+    return get_period_rollups(user_id, start_date, end_date, is_paid, transaction_type)
+
+
+def _virtual_recurrences(user_id: str, start_date: str, end_date: str, date_field: str,
+                         is_paid: bool, transaction_type: str = None):
+    """
+    Ocorrências de recorrências ainda não gravadas em transactions no período
+    (são pendentes, então só entram em filtros por due_date que incluem pendentes)
+    """
+    if date_field != "due_date" or is_paid is True or not end_date:
+        return []
+    
+    from recurrence_scheduler import expand_virtual
+    return expand_virtual(user_id, start_date or date.today().replace(day=1).isoformat(), end_date, transaction_type)
+
+
+def get_transaction_totals(user_id: str, start_date: str = None, end_date: str = None,
+                           date_field: str = "paid_date", is_paid: bool = None):
+    """
+    Totais de receitas e despesas de um período, somados no banco (RPC transaction_totals)
+    
+    Args:
+        user_id: ID do usuário
+        start_date: Data inicial (YYYY-MM-DD) ou None
+        end_date: Data final (YYYY-MM-DD) ou None
+        date_field: Coluna do filtro de período ("paid_date" ou "due_date")
+        is_paid: True só pagas, False só pendentes, None todas
+    
+    Returns:
+        dict: {"income": {"total", "count"}, "expense": {"total", "count"}} ou None se o RPC falhar
+    """
+    totals = {
+        "income": {"total": 0.0, "count": 0},
+        "expense": {"total": 0.0, "count": 0}
+    }
+    
+    # Períodos de meses inteiros saem dos rollups mensais (pagas por paid_date, pendentes por due_date)
+    rows = _period_rollups(user_id, start_date, end_date, date_field, is_paid)
+    if rows is None:
+        rows = _rpc("transaction_totals", {
+            "p_user_id": user_id,
+            "p_start": start_date,
+            "p_end": end_date,
+            "p_date_field": date_field,
+            "p_is_paid": is_paid
+        })
+        if rows is None:
+            return None
+    
+    for row in rows:
+        if row["transaction_type"] in totals:
+            totals[row["transaction_type"]]["total"] += float(row["total"])
+            totals[row["transaction_type"]]["count"] += int(row["count"])
+    
+    # Meses futuros de recorrências (expandidos sem gravar)
+    for transaction in _virtual_recurrences(user_id, start_date, end_date, date_field, is_paid):
+        if transaction["transaction_type"] in totals:
+            totals[transaction["transaction_type"]]["total"] += transaction["amount"]
+            totals[transaction["transaction_type"]]["count"] += 1
+    return totals
+
+
+def get_category_totals(user_id: str, start_date: str = None, end_date: str = None,
+                        date_field: str = "paid_date", is_paid: bool = None, transaction_type: str = None):
+    """
+    Totais por categoria de um período, somados no banco (RPC category_totals)
+    
+    Returns:
+        list: [{"category_name", "transaction_type", "total", "count"}] ordenada pelo total,
+              ou None se o RPC falhar. category_name é None para transações sem categoria
+    """
+    rows = _period_rollups(user_id, start_date, end_date, date_field, is_paid, transaction_type)
+    if rows is None:
+        rows = _rpc("category_totals", {
+            "p_user_id": user_id,
+            "p_start": start_date,
+            "p_end": end_date,
+            "p_date_field": date_field,
+            "p_is_paid": is_paid,
+            "p_transaction_type": transaction_type
+        })
+        if rows is None:
+            return None
+    
+    # Meses futuros de recorrências (expandidos sem gravar) entram como linhas de uma transação
+    virtual_rows = [
+        {
+            "category_name": (transaction.get("categories") or {}).get("name"),
+            "transaction_type": transaction["transaction_type"],
+            "total": transaction["amount"],
+            "count": 1
+        } for transaction in _virtual_recurrences(user_id, start_date, end_date, date_field, is_paid, transaction_type)
+    ]
+    
+    by_category = {}
+    for row in list(rows) + virtual_rows:
+        category = by_category.setdefault(row["category_name"], {
+            "category_name": row["category_name"],
+            "transaction_type": row["transaction_type"],
+            "total": 0.0,
+            "count": 0
+        })
+        category["total"] += float(row["total"])
+        category["count"] += int(row["count"])
+    return sorted(by_category.values(), key=lambda x: x["total"], reverse=True)
+
+
 def calculate_user_balance(user_id: str, start_date: str = None, end_date: str = None):
     """
     Calcula o saldo do usuário baseado em receitas e despesas em um período
@@ -928,7 +998,19 @@ def calculate_user_balance(user_id: str, start_date: str = None, end_date: str =
             start_date = today.replace(day=1).isoformat()
             end_date = today.isoformat()
         
-        # Buscar todas as transações do período (receitas e despesas pagas)
+        # Somar no banco (receitas e despesas pagas no período)
+        totals = get_transaction_totals(user_id, start_date, end_date, date_field="paid_date", is_paid=True)
+        if totals is not None:
+            return {
+                "total_income": totals["income"]["total"],
+                "total_expenses": totals["expense"]["total"],
+                "balance": totals["income"]["total"] - totals["expense"]["total"],
+                "income_count": totals["income"]["count"],
+                "expense_count": totals["expense"]["count"],
+                "period": {"start": start_date, "end": end_date}
+            }
+        
+        # Fallback: buscar todas as transações do período (receitas e despesas pagas)
         query = supabase.table("transactions").select("""
             transaction_type, amount, paid_date
         """).eq("user_id", user_id).not_.is_("paid_date", "null")
@@ -1005,7 +1087,22 @@ def get_category_analysis(user_id: str, start_date: str = None, end_date: str =
             start_date = today.replace(day=1).isoformat()
             end_date = today.isoformat()
         
-        # Buscar despesas pagas com categorias
+        # Agrupar no banco (despesas pagas no período)
+        category_rows = get_category_totals(
+            user_id, start_date, end_date, date_field="paid_date", is_paid=True, transaction_type="expense"
+        )
+        if category_rows is not None:
+            total_expenses = sum(row["total"] for row in category_rows)
+            return [
+                {
+                    "category": row["category_name"] or "Outros",
+                    "total": row["total"],
+                    "count": row["count"],
+                    "percentage": round(row["total"] / total_expenses * 100, 1) if total_expenses > 0 else 0
+                } for row in category_rows
+            ]
+        
+        # Fallback: buscar despesas pagas com categorias
         query = supabase.table("transactions").select("""
             amount,
             categories(name)
@@ -1082,37 +1179,18 @@ def get_monthly_trend(user_id: str, months: int = 6):
         ]
     
     try:
-        from datetime import date, timedelta
-        import calendar
+        from trend_engine import get_trend
         
-        today = date.today()
+        # Toda a janela numa única consulta, em meses de calendário
         result = []
-        
-        # Iterar pelos últimos N meses
-        for month_offset in range(months - 1, -1, -1):
-            # Calcular mês e ano
-            target_date = today.replace(day=1) - timedelta(days=month_offset * 30)
-            year = target_date.year
-            month = target_date.month
-            
-            # Primeiro e último dia do mês
-            first_day = date(year, month, 1)
-            last_day_num = calendar.monthrange(year, month)[1]
-            last_day = date(year, month, last_day_num)
-            
-            # Buscar transações do mês
-            balance_data = calculate_user_balance(
-                user_id, 
-                first_day.isoformat(), 
-                last_day.isoformat()
-            )
-            
+        for bucket in get_trend(user_id, periods=months, granularity="month"):
+            month = int(bucket["period"][5:7])
             result.append({
-                "month": f"{year}-{month:02d}",
+                "month": bucket["period"],
                 "month_name": calendar.month_name[month],
-                "income": balance_data["total_income"],
-                "expenses": balance_data["total_expenses"],
-                "balance": balance_data["balance"]
+                "income": bucket["income"],
+                "expenses": bucket["expenses"],
+                "balance": bucket["balance"]
             })
         
         return result
@@ -1154,6 +1232,11 @@ def get_pending_commitments(user_id: str):
         
         pending_transactions = resp.data or []
         
+        # Recorrências dos próximos meses ainda não gravadas (expandidas sem gravar)
+        from recurrence_scheduler import expand_virtual, add_months, RECURRENCE_VIRTUAL_MONTHS
+        virtual_end = add_months(current_month_start, RECURRENCE_VIRTUAL_MONTHS) - timedelta(days=1)
+        pending_transactions += expand_virtual(user_id, current_month_start, virtual_end, "expense")
+        
         # Agrupar por período
         this_month = {"total": 0, "count": 0, "items": []}
         next_month_data = {"total": 0, "count": 0, "items": []}
@@ -0,0 +1,87 @@
+"""
+Versões assíncronas das funções de functions_database
+O cliente Supabase é síncrono; cada chamada roda num pool de threads dedicado e
+limitado, para que uma consulta lenta ao PostgREST não trave o event loop do worker
+"""
+import asyncio
+import functools
+import inspect
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+from dotenv import load_dotenv
+
+import functions_database
+
+load_dotenv()
+
+# Máximo de consultas ao Supabase em paralelo por processo
+DB_MAX_WORKERS = int(os.getenv("DB_MAX_WORKERS", "16"))
+
+_executor = ThreadPoolExecutor(max_workers=DB_MAX_WORKERS, thread_name_prefix="supabase")
+
+
+async def run_db(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Executa uma função bloqueante de acesso ao banco no pool de threads do Supabase
+
+    Args:
+        func: Função síncrona (ex: `query.execute` ou uma função de functions_database)
+        *args, **kwargs: Argumentos repassados para a função
+
+    Returns:
+        O retorno da função
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+
+def _to_async(func: Callable[..., Any]) -> Callable[..., Any]:
+    """Cria a versão awaitable de uma função de functions_database"""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_db(func, *args, **kwargs)
+    return wrapper
+
+
+def _to_async_write(func: Callable[..., Any]) -> Callable[..., Any]:
+    """Como _to_async, para funções que gravam transações: invalida o cache de orçamentos do usuário"""
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        result = await run_db(func, *args, **kwargs)
+        from budget_engine import budget_engine
+        await budget_engine.invalidate(signature.bind(*args, **kwargs).arguments.get("user_id"))
+        return result
+    return wrapper
+
+
+# Mesmos nomes e argumentos de functions_database (calculate_credit_card_due_date não acessa o banco)
+get_credit_card_details = _to_async(functions_database.get_credit_card_details)
+create_or_update_invoice = _to_async(functions_database.create_or_update_invoice)
+get_user_by_phone = _to_async(functions_database.get_user_by_phone)
+get_user_categories = _to_async(functions_database.get_user_categories)
+save_expense_transaction = _to_async_write(functions_database.save_expense_transaction)
+get_user_credit_cards = _to_async(functions_database.get_user_credit_cards)
+get_recent_transactions = _to_async(functions_database.get_recent_transactions)
+search_transactions = _to_async(functions_database.search_transactions)
+search_transactions_page = _to_async(functions_database.search_transactions_page)
+mark_transaction_as_paid = _to_async_write(functions_database.mark_transaction_as_paid)
+find_unpaid_transactions_by_description = _to_async(functions_database.find_unpaid_transactions_by_description)
+get_current_invoice = _to_async(functions_database.get_current_invoice)
+get_next_invoice = _to_async(functions_database.get_next_invoice)
+get_credit_card_transactions_by_period = _to_async(functions_database.get_credit_card_transactions_by_period)
+save_income_transaction = _to_async_write(functions_database.save_income_transaction)
+search_income_transactions = _to_async(functions_database.search_income_transactions)
+mark_income_as_received = _to_async_write(functions_database.mark_income_as_received)
+find_pending_income_by_description = _to_async(functions_database.find_pending_income_by_description)
+find_pending_expenses_by_description = _to_async(functions_database.find_pending_expenses_by_description)
+mark_expense_as_paid = _to_async_write(functions_database.mark_expense_as_paid)
+get_transaction_totals = _to_async(functions_database.get_transaction_totals)
+get_category_totals = _to_async(functions_database.get_category_totals)
+calculate_user_balance = _to_async(functions_database.calculate_user_balance)
+get_category_analysis = _to_async(functions_database.get_category_analysis)
+get_monthly_trend = _to_async(functions_database.get_monthly_trend)
+get_pending_commitments = _to_async(functions_database.get_pending_commitments)
+edit_transaction = _to_async_write(functions_database.edit_transaction)
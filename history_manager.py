@@ -0,0 +1,270 @@
+"""
+Janela do histórico de chat enviada ao agente
+Limita o histórico a um orçamento de tokens (cortando sempre em início de turno,
+para não separar chamadas e retornos de tools) e resume os turnos antigos numa
+mensagem de resumo acumulado guardada no Redis
+"""
+import asyncio
+import json
+import os
+from datetime import datetime
+from typing import List, Optional
+from dotenv import load_dotenv
+from pydantic_ai import Agent
+from pydantic_ai.messages import ModelMessage, ModelRequest, SystemPromptPart
+
+from chat_redis import get_async_redis_client, CHAT_HISTORY_TTL
+
+load_dotenv()
+
+# Orçamento de tokens do histórico enviado ao agente
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "3000"))
+# Ao estourar o orçamento, corta até esta fração dele (o resumo não é refeito a cada turno)
+HISTORY_TARGET_RATIO = float(os.getenv("HISTORY_TARGET_RATIO", "0.6"))
+HISTORY_CHARS_PER_TOKEN = 4
+
+HISTORY_SUMMARY_ENABLED = os.getenv("HISTORY_SUMMARY_ENABLED", "true").lower() == "true"
+HISTORY_SUMMARY_MODEL = os.getenv("HISTORY_SUMMARY_MODEL", "openai:gpt-4o-mini")
+HISTORY_SUMMARY_TIMEOUT = float(os.getenv("HISTORY_SUMMARY_TIMEOUT", "15"))
+HISTORY_SUMMARY_PREFIX = "chat_summary:"
+
+# Tamanho máximo de cada trecho (retorno de tool, argumentos) no texto enviado ao resumidor
+SUMMARY_PART_MAX_CHARS = 500
+
+summary_agent = Agent(
+    HISTORY_SUMMARY_MODEL,
+    system_prompt="""
+Você resume conversas entre um usuário e um assistente financeiro pessoal no WhatsApp.
+Atualize o resumo existente com os novos trechos da conversa.
+Mantenha apenas o que for útil para continuar o atendimento: valores, datas, categorias,
+cartões, transações registradas/editadas/removidas, metas, orçamentos e pedidos em aberto.
+Escreva em português, em tópicos curtos, com no máximo 15 linhas.
+"""
+)
+
+
+def _part_text(part) -> str:
+    """Texto de uma parte da mensagem (conteúdo ou argumentos da tool)"""
+    if part.part_kind == "tool-call":
+        args = part.args if isinstance(part.args, str) else json.dumps(part.args, ensure_ascii=False, default=str)
+        return f"{part.tool_name}({args})"
+
+    content = getattr(part, "content", "")
+    if isinstance(content, str):
+        return content
+    return json.dumps(content, ensure_ascii=False, default=str)
+
+
+def estimate_tokens(messages: List[ModelMessage]) -> int:
+    """Estimativa de tokens (caracteres / 4) de uma lista de mensagens"""
+    chars = sum(len(_part_text(part)) for message in messages for part in message.parts)
+    return chars // HISTORY_CHARS_PER_TOKEN
+
+
+def _turn_start(message: ModelMessage) -> Optional[datetime]:
+    """Timestamp do prompt do usuário se a mensagem inicia um turno"""
+    if not isinstance(message, ModelRequest):
+        return None
+    for part in message.parts:
+        if part.part_kind == "user-prompt":
+            return part.timestamp
+    return None
+
+
+def split_turns(messages: List[ModelMessage]) -> List[List[ModelMessage]]:
+    """
+    Agrupa o histórico em turnos (prompt do usuário + chamadas de tool + resposta)
+
+    Mensagens antes do primeiro prompt do usuário (ex: retornos de tool órfãos
+    deixados pelo corte do Redis) são descartadas.
+    """
+    turns = []
+    for message in messages:
+        if _turn_start(message) is not None:
+            turns.append([message])
+        elif turns:
+            turns[-1].append(message)
+    return turns
+
+
+def _render_for_summary(messages: List[ModelMessage]) -> str:
+    """Converte mensagens em texto corrido para o resumidor"""
+    labels = {
+        "user-prompt": "Usuário",
+        "text": "Assistente",
+        "tool-call": "Chamada de tool",
+        "tool-return": "Retorno de tool"
+    }
+    lines = []
+    for message in messages:
+        for part in message.parts:
+            label = labels.get(part.part_kind)
+            if label:
+                lines.append(f"{label}: {_part_text(part)[:SUMMARY_PART_MAX_CHARS]}")
+    return "\n".join(lines)
+
+
+class HistoryManager:
+    """
+    Monta o histórico enviado ao agente dentro de um orçamento de tokens.
+
+    O resumo acumulado fica em `chat_summary:{user_id}` junto com a fronteira
+    (timestamp do primeiro turno mantido). Enquanto os turnos depois da
+    fronteira couberem no orçamento, o resumo é reaproveitado; quando não
+    couberem mais, a janela anda até HISTORY_TARGET_RATIO do orçamento e só
+    os turnos que saíram são incorporados ao resumo.
+    """
+
+    def __init__(self, token_budget: int = HISTORY_TOKEN_BUDGET, target_ratio: float = HISTORY_TARGET_RATIO):
+        """
+        Args:
+            token_budget: Máximo estimado de tokens do histórico
+            target_ratio: Fração do orçamento mantida quando a janela anda
+        """
+        self.token_budget = token_budget
+        self.target_tokens = int(token_budget * target_ratio)
+
+        self.stats = {
+            "turns": 0,
+            "tokens_before": 0,
+            "tokens_after": 0,
+            "tokens_saved": 0,
+            "last_tokens_saved": 0,
+            "summaries_generated": 0,
+            "summaries_reused": 0,
+            "summary_errors": 0
+        }
+
+    def _get_summary_key(self, user_id: str) -> str:
+        return f"{HISTORY_SUMMARY_PREFIX}{user_id}"
+
+    async def _load_summary(self, user_id: str) -> Optional[dict]:
+        try:
+            raw = await get_async_redis_client().get(self._get_summary_key(user_id))
+            if raw:
+                state = json.loads(raw)
+                state["boundary"] = datetime.fromisoformat(state["boundary"])
+                return state
+        except Exception as e:
+            print(f"⚠️ Erro ao carregar resumo do histórico: {e}")
+        return None
+
+    async def _save_summary(self, user_id: str, summary: str, boundary: datetime):
+        try:
+            await get_async_redis_client().set(
+                self._get_summary_key(user_id),
+                json.dumps({"summary": summary, "boundary": boundary.isoformat()}, ensure_ascii=False),
+                ex=CHAT_HISTORY_TTL
+            )
+        except Exception as e:
+            print(f"⚠️ Erro ao salvar resumo do histórico: {e}")
+
+    async def _summarize(self, previous_summary: str, folded: List[ModelMessage]) -> Optional[str]:
+        """Incorpora os turnos que saíram da janela ao resumo anterior"""
+        prompt = (
+            f"Resumo atual:\n{previous_summary or '(vazio)'}\n\n"
+            f"Novos trechos da conversa:\n{_render_for_summary(folded)}"
+        )
+        try:
+            result = await asyncio.wait_for(summary_agent.run(prompt), timeout=HISTORY_SUMMARY_TIMEOUT)
+            self.stats["summaries_generated"] += 1
+            return result.output
+        except Exception as e:
+            print(f"⚠️ Erro ao gerar resumo do histórico: {e}")
+            self.stats["summary_errors"] += 1
+            return None
+
+    def _cut(self, turns: List[List[ModelMessage]], max_tokens: int) -> int:
+        """Índice do primeiro turno mantido para caber em `max_tokens` (mantém ao menos o último)"""
+        total = 0
+        index = len(turns)
+        while index > 0:
+            tokens = estimate_tokens(turns[index - 1])
+            if total + tokens > max_tokens and index < len(turns):
+                break
+            total += tokens
+            index -= 1
+        return index
+
+    async def prepare(self, user_id: str, messages: List[ModelMessage]) -> List[ModelMessage]:
+        """
+        Recorta o histórico para o orçamento de tokens e adiciona o resumo dos turnos antigos
+
+        Args:
+            user_id: ID do usuário
+            messages: Histórico completo em ordem cronológica
+
+        Returns:
+            Histórico a ser passado para agent.run
+        """
+        if not messages:
+            return messages
+
+        tokens_before = estimate_tokens(messages)
+        turns = split_turns(messages)
+
+        # Prompts de sistema gravados no histórico não podem se perder no corte
+        system_parts = [
+            part for message in messages if isinstance(message, ModelRequest)
+            for part in message.parts if part.part_kind == "system-prompt"
+        ]
+
+        state = await self._load_summary(user_id) if HISTORY_SUMMARY_ENABLED else None
+        summary = state["summary"] if state else ""
+        if state:
+            # Turnos anteriores à fronteira já estão no resumo
+            turns = [turn for turn in turns if _turn_start(turn[0]) >= state["boundary"]]
+
+        kept_turns = turns
+        if estimate_tokens([m for turn in turns for m in turn]) > self.token_budget:
+            cut = self._cut(turns, self.target_tokens)
+            kept_turns = turns[cut:]
+            folded = [m for turn in turns[:cut] for m in turn]
+
+            if HISTORY_SUMMARY_ENABLED and folded:
+                new_summary = await self._summarize(summary, folded)
+                if new_summary:
+                    summary = new_summary
+                    await self._save_summary(user_id, summary, _turn_start(kept_turns[0][0]))
+        elif state:
+            self.stats["summaries_reused"] += 1
+
+        kept = [m for turn in kept_turns for m in turn]
+        kept_system_parts = {id(part) for m in kept if isinstance(m, ModelRequest) for part in m.parts}
+        leading_parts = [part for part in system_parts if id(part) not in kept_system_parts]
+        if summary:
+            leading_parts.append(SystemPromptPart(content=f"Resumo da conversa anterior com o usuário:\n{summary}"))
+
+        history = ([ModelRequest(parts=leading_parts)] if leading_parts else []) + kept
+
+        tokens_after = estimate_tokens(history)
+        saved = max(tokens_before - tokens_after, 0)
+        self.stats["turns"] += 1
+        self.stats["tokens_before"] += tokens_before
+        self.stats["tokens_after"] += tokens_after
+        self.stats["tokens_saved"] += saved
+        self.stats["last_tokens_saved"] = saved
+
+        if saved:
+            print(f"✂️ Histórico de {user_id}: ~{tokens_before} → ~{tokens_after} tokens ({len(kept_turns)} turnos)")
+        return history
+
+    async def clear(self, user_id: str):
+        """Apaga o resumo acumulado do usuário (usado junto com clear_chat)"""
+        try:
+            await get_async_redis_client().delete(self._get_summary_key(user_id))
+        except Exception as e:
+            print(f"⚠️ Erro ao apagar resumo do histórico: {e}")
+
+    def get_stats(self) -> dict:
+        """Retorna os tokens economizados pelo recorte do histórico"""
+        turns = self.stats["turns"]
+        return {
+            **self.stats,
+            "avg_tokens_saved": round(self.stats["tokens_saved"] / turns, 1) if turns else 0.0,
+            "token_budget": self.token_budget
+        }
+
+
+# Instância global usada pelo processamento de mensagens
+history_manager = HistoryManager()
@@ -0,0 +1,87 @@
+"""
+Faturas de cartão de crédito
+Os totais são somados no banco por incremento atômico (RPC apply_invoice_deltas,
+um upsert por cartão, mês e ano), sem ler e regravar a fatura. As compras gravadas em
+transactions entram nas faturas pelos triggers da migração 20261016000500_invoice_engine.sql
+(parcelas distribuídas nos meses seguintes, edições e exclusões descontadas); aqui ficam
+os ajustes avulsos e o recálculo
+
+Uso: python invoice_engine.py [user_id]   (sem user_id recalcula todos os usuários)
+Os RPCs (ajustes avulsos e recálculo) só são aceitos com a chave service_role
+(SUPABASE_ANON_KEY=<service_role> python invoice_engine.py)
+"""
+import sys
+from typing import List
+
+from database import supabase
+
+
+def apply_invoice_deltas(deltas: List[dict]) -> List[dict]:
+    """
+    Soma valores nas faturas numa única chamada, criando as que faltarem
+
+    Args:
+        deltas: [{"user_id", "credit_card_id", "month", "year", "amount"}]
+                (amount negativo desconta da fatura)
+
+    Returns:
+        Faturas alteradas: [{"id", "credit_card_id", "month", "year", "total_amount"}]
+    """
+    if not deltas:
+        return []
+
+    resp = supabase.rpc("apply_invoice_deltas", {"p_deltas": deltas}).execute()
+    return resp.data or []
+
+
+def add_to_invoice(user_id: str, credit_card_id: str, month: int, year: int, amount: float) -> dict:
+    """
+    Soma um valor na fatura do cartão no mês/ano
+
+    Returns:
+        dict: {"success", "invoice_id", "new_amount"} ou {"success": False, "message"}
+    """
+    invoices = apply_invoice_deltas([{
+        "user_id": user_id,
+        "credit_card_id": credit_card_id,
+        "month": month,
+        "year": year,
+        "amount": amount
+    }])
+
+    if not invoices:
+        # O RPC só não devolve a fatura quando o cartão não existe (ou o valor é zero)
+        return {"success": False, "message": "Cartão não encontrado"}
+
+    invoice = invoices[0]
+    return {"success": True, "invoice_id": invoice["id"], "new_amount": float(invoice["total_amount"])}
+
+
+def rebuild_invoice_totals(user_id: str = None, credit_card_id: str = None) -> int:
+    """
+    Recalcula os totais das faturas em aberto a partir das compras no cartão
+    (faturas pagas mantêm o total e não recebem parcelas)
+
+    Args:
+        user_id: Usuário a recalcular (None = todos)
+        credit_card_id: Cartão a recalcular (None = todos do usuário)
+
+    Returns:
+        Quantidade de parcelas somadas
+    """
+    if not supabase:
+        print("Mock: Recálculo das faturas ignorado (banco indisponível)")
+        return 0
+
+    resp = supabase.rpc("rebuild_invoice_totals", {
+        "p_user_id": user_id,
+        "p_credit_card_id": credit_card_id
+    }).execute()
+    return int(resp.data or 0)
+
+
+if __name__ == "__main__":
+    target = sys.argv[1] if len(sys.argv) > 1 else None
+    print(f"🔄 Recalculando faturas ({target or 'todos os usuários'})...")
+    installments = rebuild_invoice_totals(target)
+    print(f"✅ {installments} parcelas somadas nas faturas")
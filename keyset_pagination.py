@@ -0,0 +1,57 @@
+"""
+Paginação por keyset das transações (ordem created_at desc, id desc)
+Usada pela busca (search_transactions_page) e pela exportação
+(WebDatabaseService.get_transactions_page). O cursor é opaco para quem chama:
+(created_at, id) da última linha da página em base64 url-safe
+"""
+import base64
+import binascii
+import uuid
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+
+def encode_cursor(created_at: str, row_id: str) -> str:
+    """Cursor que continua depois da linha (created_at, id)"""
+    return base64.urlsafe_b64encode(f"{created_at}|{row_id}".encode()).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """
+    (created_at, id) de um cursor gerado por encode_cursor
+
+    Raises:
+        ValueError: Se o cursor não for válido
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, row_id = raw.rsplit("|", 1)
+        # Os valores entram no filtro do PostgREST: só timestamp e UUID válidos
+        datetime.fromisoformat(created_at)
+        uuid.UUID(row_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise ValueError(f"Cursor inválido: {cursor}") from e
+    return created_at, row_id
+
+
+def fetch_page(query, limit: int, cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+    """
+    Executa uma página da consulta do PostgREST em ordem (created_at, id) decrescente
+
+    Args:
+        query: Consulta já filtrada (o select precisa incluir created_at e id)
+        limit: Tamanho da página
+        cursor: Cursor retornado pela página anterior
+
+    Returns:
+        Linhas da página e o cursor da próxima (None na última página)
+    """
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        query = query.or_(f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{row_id})')
+
+    result = query.order("created_at", desc=True).order("id", desc=True).limit(limit).execute()
+    rows = result.data or []
+
+    next_cursor = encode_cursor(rows[-1]["created_at"], rows[-1]["id"]) if len(rows) == limit else None
+    return rows, next_cursor
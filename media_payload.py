@@ -0,0 +1,163 @@
+"""
+Conteúdo de mídia baixado da Evolution API
+O JSON {"base64": "..."} é lido aos pedaços e o base64 é decodificado à medida que
+chega, direto para um SpooledTemporaryFile (em memória até MEDIA_SPOOL_MEMORY bytes,
+depois em disco), sem montar a string base64 inteira nem uma segunda cópia decodificada
+"""
+import binascii
+import hashlib
+import os
+import tempfile
+from typing import BinaryIO, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Tamanho máximo da mídia decodificada (limite de upload do Whisper: 25 MB)
+MEDIA_MAX_BYTES = int(os.getenv("MEDIA_MAX_BYTES", str(25 * 1024 * 1024)))
+# Acima deste tamanho o arquivo temporário vai para o disco
+MEDIA_SPOOL_MEMORY = int(os.getenv("MEDIA_SPOOL_MEMORY", str(1024 * 1024)))
+
+_BASE64_KEY = b'"base64"'
+_WHITESPACE = b" \t\r\n"
+
+
+class MediaTooLargeError(Exception):
+    """Mídia maior que MEDIA_MAX_BYTES"""
+
+
+class MediaPayload:
+    """
+    Bytes de uma mídia num arquivo temporário
+
+    Use como context manager (ou chame close()) para liberar o arquivo.
+    """
+
+    def __init__(self, filename: str = "media", mimetype: Optional[str] = None,
+                 max_bytes: int = MEDIA_MAX_BYTES, spool_memory: int = MEDIA_SPOOL_MEMORY):
+        """
+        Args:
+            filename: Nome enviado às APIs que dependem da extensão (ex: "audio.mp3")
+            mimetype: Tipo da mídia (ex: "image/jpeg")
+            max_bytes: Tamanho máximo aceito
+            spool_memory: Bytes mantidos em memória antes de ir para o disco
+        """
+        self.filename = filename
+        self.mimetype = mimetype
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._file = tempfile.SpooledTemporaryFile(max_size=spool_memory)
+        self._hash = hashlib.sha256()
+
+    def write(self, data: bytes):
+        """Acrescenta bytes decodificados (MediaTooLargeError acima de max_bytes)"""
+        if self.size + len(data) > self.max_bytes:
+            raise MediaTooLargeError(f"Mídia maior que {self.max_bytes} bytes")
+        self._file.write(data)
+        self._hash.update(data)
+        self.size += len(data)
+
+    def open(self) -> BinaryIO:
+        """Arquivo posicionado no início, para envio em streaming"""
+        self._file.seek(0)
+        return self._file
+
+    def read_bytes(self) -> bytes:
+        """Conteúdo inteiro em memória (uma única cópia)"""
+        return self.open().read()
+
+    @property
+    def sha256(self) -> str:
+        """SHA-256 (hex) dos bytes decodificados, calculado durante a escrita"""
+        return self._hash.hexdigest()
+
+    @property
+    def on_disk(self) -> bool:
+        return bool(getattr(self._file, "_rolled", False))
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self) -> "MediaPayload":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Base64JsonDecoder:
+    """
+    Extrai e decodifica o campo "base64" de um JSON recebido aos pedaços
+
+    O valor pode vir como data URL ("data:audio/mp3;base64,....") e com "\\/"
+    escapado; o restante do JSON é ignorado.
+    """
+
+    def __init__(self, payload: MediaPayload):
+        self.payload = payload
+        self._state = "key"
+        self._buffer = b""
+        self._pending = b""
+
+    @property
+    def done(self) -> bool:
+        return self._state == "done"
+
+    def feed(self, chunk: bytes):
+        """Processa mais um pedaço do corpo da resposta"""
+        if self.done:
+            return
+        data = self._buffer + chunk
+        self._buffer = b""
+
+        if self._state == "key":
+            index = data.find(_BASE64_KEY)
+            if index < 0:
+                # A chave pode estar dividida entre dois pedaços
+                self._buffer = data[-(len(_BASE64_KEY) - 1):]
+                return
+            data = data[index + len(_BASE64_KEY):]
+            self._state = "open"
+
+        if self._state == "open":
+            data = data.lstrip(_WHITESPACE + b":")
+            if not data:
+                return
+            if data[:1] != b'"':
+                raise ValueError("Campo base64 não é uma string")
+            data = data[1:]
+            self._state = "prefix"
+
+        if self._state == "prefix":
+            # Um prefixo de data URL termina na primeira vírgula; base64 puro nunca tem "data:"
+            if len(data) < 5 and b'"' not in data:
+                self._buffer = data
+                return
+            if data.startswith(b"data:"):
+                comma = data.find(b",")
+                if comma < 0:
+                    self._buffer = data
+                    return
+                data = data[comma + 1:]
+            self._state = "value"
+
+        if self._state == "value":
+            end = data.find(b'"')
+            if end >= 0:
+                data = data[:end]
+                self._state = "done"
+            elif data.endswith(b"\\"):
+                # Escape dividido entre dois pedaços
+                self._buffer = data[-1:]
+                data = data[:-1]
+            self._decode(data.replace(b"\\/", b"/").replace(b"\\n", b"").replace(b"\\r", b""))
+
+    def _decode(self, text: bytes):
+        # Decodifica só blocos completos de 4 caracteres; o resto espera o próximo pedaço
+        text = self._pending + text.translate(None, _WHITESPACE)
+        if self.done:
+            text += b"=" * (-len(text) % 4)
+        usable = len(text) - len(text) % 4
+        self._pending = text[usable:]
+        if usable:
+            self.payload.write(binascii.a2b_base64(text[:usable]))
@@ -1,168 +1,338 @@
 """
 Processador de mídia para áudio e imagens usando OpenAI APIs
+As chamadas usam o cliente assíncrono (AsyncOpenAI) com um pool de conexões
+compartilhado, timeout por chamada e limite de chamadas simultâneas por processo,
+para que uma transcrição ou leitura de comprovante não trave o event loop
 """
-import httpx
+import asyncio
 import base64
-import io
+import hashlib
 import os
 from typing import Optional, Dict, Any
-from openai import OpenAI
+import httpx
+from openai import AsyncOpenAI, APITimeoutError
 from dotenv import load_dotenv
 
+from evolution_client import evolution_client
+from media_payload import MediaPayload, Base64JsonDecoder, MediaTooLargeError, MEDIA_MAX_BYTES
+from receipt_preprocess import preprocess_receipt, preprocess_signature
+from media_result_cache import media_result_cache
+from receipt_parser import (
+    fast_path_accepts,
+    parse_receipt_image,
+    RECEIPT_FAST_PATH,
+    RECEIPT_PARSER_VERSION,
+    TESSERACT_AVAILABLE
+)
+
 load_dotenv()
 
 # Configuração OpenAI
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")  # Opcional (ex: servidor local de testes)
+# Máximo de chamadas de mídia em paralelo por processo
+OPENAI_MEDIA_CONCURRENCY = int(os.getenv("OPENAI_MEDIA_CONCURRENCY", "8"))
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "20"))
+OPENAI_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "10"))
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5"))
+# Timeouts por chamada (segundos)
+OPENAI_TRANSCRIBE_TIMEOUT = float(os.getenv("OPENAI_TRANSCRIBE_TIMEOUT", "60"))
+OPENAI_VISION_TIMEOUT = float(os.getenv("OPENAI_VISION_TIMEOUT", "45"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "1"))
+
+# Modelos e prompt da leitura de mídia (fazem parte da chave do cache de resultados)
+TRANSCRIBE_MODEL = "whisper-1"
+TRANSCRIBE_LANGUAGE = "pt"
+RECEIPT_MODEL = "gpt-4o-mini"  # Modelo com capacidade de visão
+
+# Prompt específico para extrair dados de comprovantes
+RECEIPT_PROMPT = """
+Analise esta imagem de comprovante/recibo financeiro e extraia as seguintes informações em formato JSON:
+
+{
+    "valor": número (apenas o valor numérico, ex: 50.75),
+    "descricao": "string (nome do estabelecimento ou descrição da compra)",
+    "data": "YYYY-MM-DD (data da transação, se não encontrar use a data atual)",
+    "metodo_pagamento": "pix|cartao_credito|cartao_debito|dinheiro (tente identificar pelo comprovante)",
+    "categoria_sugerida": "string (categoria que melhor se encaixa: Alimentação, Transporte, Saúde, Lazer, Moradia, etc)",
+    "estabelecimento": "string (nome do estabelecimento/loja)",
+    "tipo_comprovante": "string (pix, ted, compra_cartao, etc)",
+    "confianca": número de 0 a 1 (quão confiante está na extração)
+}
+
+Se não conseguir identificar algum campo, coloque null.
+Se a imagem não for um comprovante financeiro, retorne {"erro": "Não é um comprovante financeiro"}.
+
+IMPORTANTE: Retorne APENAS o JSON, sem texto adicional.
+"""
+
+TRANSCRIBE_CACHE_VERSION = f"{TRANSCRIBE_MODEL}-{TRANSCRIBE_LANGUAGE}"
+RECEIPT_CACHE_VERSION = f"{RECEIPT_MODEL}-{hashlib.sha256(RECEIPT_PROMPT.encode()).hexdigest()[:12]}"
+
+_client: Optional[AsyncOpenAI] = None
+_semaphore = asyncio.Semaphore(OPENAI_MEDIA_CONCURRENCY)
+
+media_stats = {
+    "transcriptions": 0,
+    "receipts": 0,
+    "timeouts": 0,
+    "errors": 0,
+    "in_flight": 0
+}
+
+
+def get_openai_client() -> AsyncOpenAI:
+    """Cliente AsyncOpenAI compartilhado (criado no primeiro uso)"""
+    global _client
+    if _client is None:
+        _client = AsyncOpenAI(
+            api_key=OPENAI_API_KEY,
+            base_url=OPENAI_BASE_URL,
+            max_retries=OPENAI_MAX_RETRIES,
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=OPENAI_MAX_CONNECTIONS,
+                    max_keepalive_connections=OPENAI_MAX_KEEPALIVE
+                ),
+                timeout=httpx.Timeout(OPENAI_VISION_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT)
+            )
+        )
+    return _client
+
+
+async def close_openai_client():
+    """Fecha o pool de conexões da OpenAI (chamado no encerramento da aplicação)"""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+        print("✅ Cliente OpenAI encerrado")
+
+
+async def _call_openai(kind: str, timeout: float, create, **kwargs):
+    """
+    Executa uma chamada da OpenAI respeitando o limite de chamadas simultâneas
+
+    Args:
+        kind: Contador em media_stats ("transcriptions" ou "receipts")
+        timeout: Timeout total da chamada (segundos)
+        create: Método do cliente (ex: client.audio.transcriptions.create)
+    """
+    async with _semaphore:
+        media_stats["in_flight"] += 1
+        try:
+            result = await create(timeout=timeout, **kwargs)
+            media_stats[kind] += 1
+            return result
+        except APITimeoutError:
+            media_stats["timeouts"] += 1
+            raise
+        except Exception:
+            media_stats["errors"] += 1
+            raise
+        finally:
+            media_stats["in_flight"] -= 1
+
+
+def get_media_stats() -> dict:
+    """Retorna contadores das chamadas de mídia à OpenAI e das etapas de leitura de comprovantes"""
+    return {**media_stats, "receipt_stages": dict(receipt_stage_stats), "concurrency": OPENAI_MEDIA_CONCURRENCY}
+
+
+async def _local_receipt_stage(image: MediaPayload) -> Optional[Dict[str, Any]]:
+    """OCR local + modelos de layout (receipt_parser), em cache pelo conteúdo da imagem"""
+    if not RECEIPT_FAST_PATH or not TESSERACT_AVAILABLE:
+        return None
+
+    async def parse():
+        data, _ = await preprocess_receipt(image.read_bytes(), image.mimetype or "image/jpeg")
+        return await parse_receipt_image(data)
+
+    return await media_result_cache.get_or_compute(
+        "receipt_ocr", image.sha256, f"{RECEIPT_PARSER_VERSION}-{preprocess_signature()}", parse
+    )
+
+
+# Etapas de leitura de comprovantes, na ordem; a API de visão é a última opção.
+# Cada etapa recebe o MediaPayload e retorna o dict no formato de extract_receipt_data (com "confianca") ou None
+RECEIPT_PIPELINE = [
+    ("ocr_local", _local_receipt_stage)
+]
 
-# Configurações Evolution API
-EVOLUTION_BASE_URL = os.getenv("EVOLUTION_API_URL", "http://localhost:8080")
-EVOLUTION_API_KEY = os.getenv("EVOLUTION_TOKEN", "")
+receipt_stage_stats = {name: 0 for name, _ in RECEIPT_PIPELINE}
+receipt_stage_stats["vision"] = 0
 
 class MediaProcessor:
     """Processador de mídia para áudio e imagem"""
     
     @staticmethod
-    async def get_media_from_evolution(message_id: str, instance: str, convert_to_mp4: str) -> Optional[str]:
+    async def download_media(message_id: str, instance: str, filename: str = "media",
+                             mimetype: Optional[str] = None) -> Optional[MediaPayload]:
         """
-        Baixa mídia da Evolution API e retorna como base64
+        Baixa mídia da Evolution API decodificando o base64 à medida que chega
         
         Args:
             message_id: ID da mensagem
             instance: Nome da instância
-            convert_to_mp4: Se deve converter áudio para MP4 (para áudio usar False para MP3)
+            filename: Nome do arquivo (a extensão é usada pelo Whisper)
+            mimetype: Tipo da mídia (padrão image/jpeg para imagens)
             
         Returns:
-            String base64 do arquivo ou None se houver erro
+            MediaPayload (feche após o uso) ou None se houver erro ou a mídia passar de MEDIA_MAX_BYTES
         """
+        payload = MediaPayload(filename=filename, mimetype=mimetype)
         try:
-            print(f"🔍 INICIANDO DOWNLOAD DE MÍDIA:")
-            print(f"   📧 Message ID: {message_id}")
-            print(f"   🏢 Instance: {instance}")
-            print(f"   🎬 Convert to MP4: {convert_to_mp4}")
-            
-            # Usar o formato correto do endpoint
-            url = f"{EVOLUTION_BASE_URL}chat/getBase64FromMediaMessage/{instance}"
-            
-            payload = {
-                "convertToMp4": "false",
-                "message": {
-                    "key": {
-                        "id": message_id
-                    }
-                }
-            }
+            async with evolution_client.stream_base64_from_media(instance, message_id) as response:
+                if response.status_code not in [200, 201]:
+                    body = await response.aread()
+                    print(f"❌ Erro ao baixar mídia: {response.status_code} - {body[:500]!r}")
+                    payload.close()
+                    return None
+                
+                # O JSON tem ~4/3 do tamanho da mídia; rejeitar antes de baixar quando o tamanho é conhecido
+                content_length = int(response.headers.get("content-length") or 0)
+                if content_length * 3 // 4 > payload.max_bytes + 1024:
+                    raise MediaTooLargeError(f"Mídia de ~{content_length * 3 // 4} bytes")
+                
+                # A Evolution API geralmente retorna {"base64": "data:audio/mp3;base64,xxxxx"}
+                decoder = Base64JsonDecoder(payload)
+                async for chunk in response.aiter_bytes():
+                    decoder.feed(chunk)
+                    if decoder.done:
+                        break
             
-            headers = {
-                "apikey": "429683C4C977415CAAFCCE10F7D57E11"
-            }
+            if not decoder.done or not payload.size:
+                print("❌ Resposta da Evolution sem campo base64")
+                payload.close()
+                return None
             
-            print(f"📥 Baixando mídia - URL: {url}")
-            print(f"📦 Payload: {payload}")
-            print(f"🔑 Headers: {headers}")
-            print(f"🏢 Instance: {instance}")
-            print(f"🆔 Message ID: {message_id}")
+            print(f"📥 Mídia baixada: {payload.size} bytes{' (em disco)' if payload.on_disk else ''}")
+            return payload
             
-            async with httpx.AsyncClient(timeout=30.0) as http_client:
-                response = await http_client.post(url, json=payload, headers=headers)
-                
-                print(f"📋 Response status: {response.status_code}")
-                
-                if response.status_code in [200, 201]:
-                    data = response.json()
-                    print(f"📄 Response data keys: {list(data.keys()) if isinstance(data, dict) else 'not dict'}")
-                    
-                    # A Evolution API geralmente retorna {"base64": "data:audio/mp3;base64,xxxxx"}
-                    if "base64" in data:
-                        base64_data = data["base64"]
-                        # Remove o prefixo se existir (data:audio/mp3;base64,)
-                        if "," in base64_data:
-                            base64_data = base64_data.split(",")[1]
-                        return base64_data
-                    return None
-                else:
-                    print(f"❌ Erro ao baixar mídia: {response.status_code} - {response.text}")
-                    return None
-                    
+        except MediaTooLargeError as e:
+            print(f"❌ Mídia muito grande (limite {MEDIA_MAX_BYTES} bytes): {e}")
+            payload.close()
+            return None
         except Exception as e:
             print(f"❌ Erro ao baixar mídia da Evolution: {e}")
+            payload.close()
             return None
     
     @staticmethod
-    async def transcribe_audio(base64_audio: str) -> Optional[str]:
+    async def transcribe_audio(audio: MediaPayload, use_cache: bool = True) -> Optional[str]:
         """
         Transcreve áudio usando OpenAI Whisper
         
         Args:
-            base64_audio: Áudio em base64
+            audio: Áudio baixado por download_media
+            use_cache: Reaproveitar a transcrição do mesmo áudio (media_result_cache)
             
         Returns:
             Texto transcrito ou None se houver erro
         """
+        if not use_cache:
+            return await MediaProcessor._transcribe(audio)
+        return await media_result_cache.get_or_compute(
+            "transcription", audio.sha256, TRANSCRIBE_CACHE_VERSION,
+            lambda: MediaProcessor._transcribe(audio)
+        )
+    
+    @staticmethod
+    async def _transcribe(audio: MediaPayload) -> Optional[str]:
         try:
-            # Decodificar base64 para bytes
-            audio_bytes = base64.b64decode(base64_audio)
-            
-            # Criar um arquivo temporário em memória
-            audio_file = io.BytesIO(audio_bytes)
-            audio_file.name = "audio.mp3"  # Whisper precisa do nome com extensão
+            # O arquivo temporário vai direto no upload (Whisper precisa do nome com extensão)
+            audio_file = (audio.filename, audio.open())
             
             # Transcrever usando Whisper
-            transcript = client.audio.transcriptions.create(
-                model="whisper-1",
+            client = get_openai_client()
+            transcript = await _call_openai(
+                "transcriptions",
+                OPENAI_TRANSCRIBE_TIMEOUT,
+                client.audio.transcriptions.create,
+                model=TRANSCRIBE_MODEL,
                 file=audio_file,
-                language="pt"  # Português
+                language=TRANSCRIBE_LANGUAGE
             )
             
-            return transcript.text
+            return transcript.text or None
             
         except Exception as e:
             print(f"❌ Erro ao transcrever áudio: {e}")
             return None
     
     @staticmethod
-    async def extract_receipt_data(base64_image: str) -> Optional[Dict[str, Any]]:
+    async def read_receipt(image: MediaPayload) -> Optional[Dict[str, Any]]:
+        """
+        Lê um comprovante pelas etapas de RECEIPT_PIPELINE e só chama a API de visão
+        quando nenhuma é aceita por fast_path_accepts (confiança mínima e campos completos)
+        
+        Args:
+            image: Imagem baixada por download_media
+            
+        Returns:
+            Dicionário com dados extraídos ou None se houver erro
+        """
+        for name, stage in RECEIPT_PIPELINE:
+            try:
+                result = await stage(image)
+            except Exception as e:
+                print(f"⚠️ Erro na etapa {name} da leitura do comprovante: {e}")
+                continue
+            
+            if fast_path_accepts(result):
+                receipt_stage_stats[name] += 1
+                return result
+        
+        receipt_stage_stats["vision"] += 1
+        return await MediaProcessor.extract_receipt_data(image)
+    
+    @staticmethod
+    async def extract_receipt_data(image: MediaPayload, preprocess: bool = True,
+                                   use_cache: bool = True) -> Optional[Dict[str, Any]]:
         """
         Extrai dados de comprovante usando OpenAI Vision
         
         Args:
-            base64_image: Imagem em base64
+            image: Imagem baixada por download_media
+            preprocess: Reduzir e normalizar a imagem antes do envio (receipt_preprocess)
+            use_cache: Reaproveitar a leitura da mesma imagem (media_result_cache)
             
         Returns:
             Dicionário com dados extraídos ou None se houver erro
         """
+        if not use_cache:
+            return await MediaProcessor._extract_receipt(image, preprocess)
+        version = f"{RECEIPT_CACHE_VERSION}-{preprocess_signature() if preprocess else 'raw'}"
+        return await media_result_cache.get_or_compute(
+            "receipt", image.sha256, version,
+            lambda: MediaProcessor._extract_receipt(image, preprocess)
+        )
+    
+    @staticmethod
+    async def _extract_receipt(image: MediaPayload, preprocess: bool) -> Optional[Dict[str, Any]]:
         try:
-            # Prompt específico para extrair dados de comprovantes
-            prompt = """
-            Analise esta imagem de comprovante/recibo financeiro e extraia as seguintes informações em formato JSON:
-
-            {
-                "valor": número (apenas o valor numérico, ex: 50.75),
-                "descricao": "string (nome do estabelecimento ou descrição da compra)",
-                "data": "YYYY-MM-DD (data da transação, se não encontrar use a data atual)",
-                "metodo_pagamento": "pix|cartao_credito|cartao_debito|dinheiro (tente identificar pelo comprovante)",
-                "categoria_sugerida": "string (categoria que melhor se encaixa: Alimentação, Transporte, Saúde, Lazer, Moradia, etc)",
-                "estabelecimento": "string (nome do estabelecimento/loja)",
-                "tipo_comprovante": "string (pix, ted, compra_cartao, etc)",
-                "confianca": número de 0 a 1 (quão confiante está na extração)
-            }
-
-            Se não conseguir identificar algum campo, coloque null.
-            Se a imagem não for um comprovante financeiro, retorne {"erro": "Não é um comprovante financeiro"}.
+            image_bytes, mimetype = image.read_bytes(), image.mimetype or "image/jpeg"
+            if preprocess:
+                image_bytes, mimetype = await preprocess_receipt(image_bytes, mimetype)
             
-            IMPORTANTE: Retorne APENAS o JSON, sem texto adicional.
-            """
+            # Única codificação em base64 da imagem
+            image_url = f"data:{mimetype};base64,{base64.b64encode(image_bytes).decode('ascii')}"
             
-            response = client.chat.completions.create(
-                model="gpt-4o-mini",  # Modelo com capacidade de visão
+            client = get_openai_client()
+            response = await _call_openai(
+                "receipts",
+                OPENAI_VISION_TIMEOUT,
+                client.chat.completions.create,
+                model=RECEIPT_MODEL,
                 messages=[
                     {
                         "role": "user",
                         "content": [
-                            {"type": "text", "text": prompt},
+                            {"type": "text", "text": RECEIPT_PROMPT},
                             {
                                 "type": "image_url",
                                 "image_url": {
-                                    "url": f"data:image/jpeg;base64,{base64_image}"
+                                    "url": image_url
                                 }
                             }
                         ]
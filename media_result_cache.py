@@ -0,0 +1,177 @@
+"""
+Cache dos resultados de transcrição e leitura de comprovantes por conteúdo
+A chave é o SHA-256 dos bytes decodificados da mídia mais a versão do processamento
+(modelo e prompt), então o mesmo áudio ou comprovante reenviado - ou a mesma mídia
+reentregue pela Evolution - não gera outra chamada à OpenAI. Duas camadas: LRU
+local + Redis com TTL
+"""
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional
+from dotenv import load_dotenv
+
+from chat_redis import get_async_redis_client
+
+load_dotenv()
+
+MEDIA_CACHE_TTL = int(os.getenv("MEDIA_CACHE_TTL", str(7 * 24 * 3600)))
+MEDIA_CACHE_LOCAL_TTL = float(os.getenv("MEDIA_CACHE_LOCAL_TTL", "3600"))
+MEDIA_CACHE_LOCAL_MAX_SIZE = int(os.getenv("MEDIA_CACHE_LOCAL_MAX_SIZE", "1000"))
+MEDIA_CACHE_PREFIX = "media_result:"
+
+
+class MediaResultCache:
+    """
+    Resultado do processamento de uma mídia por (tipo, versão, SHA-256).
+
+    Só resultados válidos são guardados (None indica falha e é recalculado).
+    Pedidos simultâneos da mesma mídia esperam a mesma chamada.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: int = MEDIA_CACHE_TTL,
+        local_ttl_seconds: float = MEDIA_CACHE_LOCAL_TTL,
+        local_max_size: int = MEDIA_CACHE_LOCAL_MAX_SIZE
+    ):
+        """
+        Args:
+            ttl_seconds: Validade do resultado no Redis
+            local_ttl_seconds: Validade do resultado na LRU local
+            local_max_size: Máximo de resultados na LRU local
+        """
+        self.ttl_seconds = ttl_seconds
+        self.local_ttl_seconds = local_ttl_seconds
+        self.local_max_size = local_max_size
+        self._local = OrderedDict()
+        self._inflight = {}
+
+        self.stats = {}
+
+    def _get_key(self, kind: str, version: str, digest: str) -> str:
+        return f"{MEDIA_CACHE_PREFIX}{kind}:{version}:{digest}"
+
+    def _count(self, kind: str, counter: str):
+        kind_stats = self.stats.setdefault(kind, {
+            "local_hits": 0,
+            "redis_hits": 0,
+            "coalesced": 0,
+            "misses": 0,
+            "redis_errors": 0
+        })
+        kind_stats[counter] += 1
+
+    def _local_get(self, key: str) -> Optional[Any]:
+        item = self._local.get(key)
+        if item is None:
+            return None
+
+        expires_at, result = item
+        if expires_at < time.monotonic():
+            del self._local[key]
+            return None
+
+        self._local.move_to_end(key)
+        return result
+
+    def _local_set(self, key: str, result: Any):
+        self._local[key] = (time.monotonic() + self.local_ttl_seconds, result)
+        self._local.move_to_end(key)
+        while len(self._local) > self.local_max_size:
+            self._local.popitem(last=False)
+
+    async def get_or_compute(
+        self,
+        kind: str,
+        digest: str,
+        version: str,
+        compute: Callable[[], Awaitable[Optional[Any]]]
+    ) -> Optional[Any]:
+        """
+        Retorna o resultado em cache ou calcula (e guarda) com `compute`
+
+        Args:
+            kind: Tipo de processamento (ex: "transcription", "receipt")
+            digest: SHA-256 dos bytes da mídia
+            version: Modelo e versão do prompt/pré-processamento
+            compute: Corrotina que chama a OpenAI; retorna None em caso de falha
+
+        Returns:
+            Resultado (serializável em JSON) ou None
+        """
+        key = self._get_key(kind, version, digest)
+
+        result = self._local_get(key)
+        if result is not None:
+            self._count(kind, "local_hits")
+            return result
+
+        try:
+            raw = await get_async_redis_client().get(key)
+            if raw:
+                result = json.loads(raw)
+                self._local_set(key, result)
+                self._count(kind, "redis_hits")
+                return result
+        except Exception as e:
+            print(f"⚠️ Erro ao ler resultado de mídia no Redis: {e}")
+            self._count(kind, "redis_errors")
+
+        # A mesma mídia já está sendo processada neste processo: esperar o resultado
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self._count(kind, "coalesced")
+            return await asyncio.shield(pending)
+
+        self._count(kind, "misses")
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await compute()
+            future.set_result(result)
+        except asyncio.CancelledError:
+            # Quem esperava trata como falha (o próximo pedido recalcula)
+            future.set_result(None)
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Evita o aviso de exceção não consumida quando ninguém esperava
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+        if result is None:
+            return None
+
+        self._local_set(key, result)
+        try:
+            await get_async_redis_client().set(
+                key,
+                json.dumps(result, ensure_ascii=False),
+                ex=self.ttl_seconds
+            )
+        except Exception as e:
+            print(f"⚠️ Erro ao salvar resultado de mídia no Redis: {e}")
+            self._count(kind, "redis_errors")
+
+        return result
+
+    def get_stats(self) -> dict:
+        """Retorna contadores e taxa de acerto por tipo de processamento"""
+        result = {"local_size": len(self._local)}
+        for kind, kind_stats in self.stats.items():
+            hits = kind_stats["local_hits"] + kind_stats["redis_hits"] + kind_stats["coalesced"]
+            total = hits + kind_stats["misses"]
+            result[kind] = {
+                **kind_stats,
+                "hit_rate": round(hits / total, 4) if total else 0.0
+            }
+        return result
+
+
+# Instância global compartilhada pelo processo
+media_result_cache = MediaResultCache()
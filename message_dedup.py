@@ -0,0 +1,128 @@
+"""
+Deduplicação de mensagens do webhook
+A Evolution API reenvia `messages.upsert` em timeouts; o ID da mensagem do WhatsApp
+(data.key.id) é usado para descartar reentregas antes de qualquer chamada ao Supabase ou OpenAI
+"""
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
+from dotenv import load_dotenv
+
+from chat_redis import get_async_redis_client
+
+load_dotenv()
+
+DEDUP_TTL_SECONDS = int(os.getenv("DEDUP_TTL_SECONDS", "86400"))
+DEDUP_LOCAL_MAX_SIZE = int(os.getenv("DEDUP_LOCAL_MAX_SIZE", "10000"))
+DEDUP_KEY_PREFIX = "dedup:msg:"
+
+
+class MessageDeduplicator:
+    """
+    Deduplicador em duas camadas.
+
+    A camada local (LRU com TTL em memória) responde reentregas recebidas
+    pelo mesmo processo sem ir à rede. A camada Redis (SET NX EX) é a fonte
+    da verdade entre processos e workers do gunicorn.
+    """
+
+    def __init__(self, ttl_seconds: int = DEDUP_TTL_SECONDS, local_max_size: int = DEDUP_LOCAL_MAX_SIZE):
+        """
+        Args:
+            ttl_seconds: Por quanto tempo um ID de mensagem é lembrado
+            local_max_size: Máximo de IDs mantidos na LRU local
+        """
+        self.ttl_seconds = ttl_seconds
+        self.local_max_size = local_max_size
+        self._local = OrderedDict()
+
+        self.stats = {
+            "hits": 0,
+            "local_hits": 0,
+            "redis_hits": 0,
+            "misses": 0,
+            "redis_errors": 0
+        }
+
+    def _local_seen(self, message_id: str) -> bool:
+        """Verifica (e renova) o ID na LRU local"""
+        expires_at = self._local.get(message_id)
+        if expires_at is None:
+            return False
+
+        if expires_at < time.monotonic():
+            del self._local[message_id]
+            return False
+
+        self._local.move_to_end(message_id)
+        return True
+
+    def _local_add(self, message_id: str):
+        """Registra o ID na LRU local, descartando os mais antigos"""
+        self._local[message_id] = time.monotonic() + self.ttl_seconds
+        self._local.move_to_end(message_id)
+        while len(self._local) > self.local_max_size:
+            self._local.popitem(last=False)
+
+    async def is_duplicate(self, message_id: Optional[str]) -> bool:
+        """
+        Registra o ID da mensagem e informa se ele já tinha sido visto
+
+        Args:
+            message_id: ID da mensagem do WhatsApp (data.key.id)
+
+        Returns:
+            True se a mensagem é uma reentrega e deve ser descartada
+        """
+        if not message_id:
+            return False
+
+        if self._local_seen(message_id):
+            self.stats["hits"] += 1
+            self.stats["local_hits"] += 1
+            return True
+
+        try:
+            created = await get_async_redis_client().set(
+                f"{DEDUP_KEY_PREFIX}{message_id}", "1", nx=True, ex=self.ttl_seconds
+            )
+        except Exception as e:
+            # Redis indisponível: seguir só com a camada local (fail open)
+            print(f"⚠️ Erro no Redis ao deduplicar mensagem: {e}")
+            self.stats["redis_errors"] += 1
+            created = True
+
+        self._local_add(message_id)
+
+        if not created:
+            self.stats["hits"] += 1
+            self.stats["redis_hits"] += 1
+            return True
+
+        self.stats["misses"] += 1
+        return False
+
+    async def release(self, message_id: Optional[str]):
+        """
+        Esquece um ID para que a próxima reentrega seja aceita
+        (usado quando a mensagem foi recusada e não chegou a ser processada)
+        """
+        if not message_id:
+            return
+
+        self._local.pop(message_id, None)
+        try:
+            await get_async_redis_client().delete(f"{DEDUP_KEY_PREFIX}{message_id}")
+        except Exception as e:
+            print(f"⚠️ Erro ao liberar ID de mensagem no Redis: {e}")
+            self.stats["redis_errors"] += 1
+
+    def get_stats(self) -> dict:
+        """Retorna contadores de acertos e falhas"""
+        total = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_rate": round(self.stats["hits"] / total, 4) if total else 0.0,
+            "local_size": len(self._local)
+        }
@@ -0,0 +1,214 @@
+"""
+Despachante de mensagens do WhatsApp
+Fila assíncrona por telefone para processar as mensagens de cada usuário em ordem,
+com limite global de concorrência e encerramento gracioso
+"""
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, Dict, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Configurações do despachante
+DISPATCHER_MAX_CONCURRENCY = int(os.getenv("DISPATCHER_MAX_CONCURRENCY", "8"))
+DISPATCHER_MAX_QUEUE_PER_PHONE = int(os.getenv("DISPATCHER_MAX_QUEUE_PER_PHONE", "20"))
+DISPATCHER_MAX_PENDING = int(os.getenv("DISPATCHER_MAX_PENDING", "500"))
+DISPATCHER_IDLE_TIMEOUT = float(os.getenv("DISPATCHER_IDLE_TIMEOUT", "30"))
+DISPATCHER_DRAIN_TIMEOUT = float(os.getenv("DISPATCHER_DRAIN_TIMEOUT", "25"))
+
+
+class DispatcherFullError(Exception):
+    """Fila cheia - a mensagem não foi aceita (backpressure)"""
+    pass
+
+
+class MessageDispatcher:
+    """
+    Executa tarefas assíncronas em ordem por telefone.
+
+    Cada telefone tem sua própria fila e um worker dedicado, então as mensagens
+    de um mesmo usuário nunca rodam ao mesmo tempo. Um semáforo global limita
+    quantas tarefas (de usuários diferentes) rodam em paralelo no processo.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = DISPATCHER_MAX_CONCURRENCY,
+        max_queue_per_phone: int = DISPATCHER_MAX_QUEUE_PER_PHONE,
+        max_pending: int = DISPATCHER_MAX_PENDING,
+        idle_timeout: float = DISPATCHER_IDLE_TIMEOUT
+    ):
+        """
+        Args:
+            max_concurrency: Máximo de tarefas executando ao mesmo tempo
+            max_queue_per_phone: Máximo de tarefas aguardando por telefone
+            max_pending: Máximo de tarefas aguardando no total
+            idle_timeout: Segundos sem mensagens até o worker do telefone encerrar
+        """
+        self.max_concurrency = max_concurrency
+        self.max_queue_per_phone = max_queue_per_phone
+        self.max_pending = max_pending
+        self.idle_timeout = idle_timeout
+
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._queues: Dict[str, asyncio.Queue] = {}
+        self._workers: Dict[str, asyncio.Task] = {}
+        self._accepting = True
+        self._pending = 0
+        self._running = 0
+
+        # Contadores de backpressure
+        self.stats = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "rejected": 0,
+            "max_pending_seen": 0
+        }
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        """Cria o semáforo dentro do event loop em execução"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def submit(
+        self,
+        phone_number: str,
+        func: Callable[..., Awaitable[Any]],
+        *args,
+        **kwargs
+    ) -> asyncio.Future:
+        """
+        Enfileira uma tarefa para o telefone informado.
+
+        Args:
+            phone_number: Telefone do usuário (define a fila)
+            func: Função assíncrona a executar
+            *args, **kwargs: Argumentos repassados para a função
+
+        Returns:
+            Future resolvido quando a tarefa terminar (pode ser ignorado)
+
+        Raises:
+            DispatcherFullError: Se o despachante estiver encerrando ou as filas estiverem cheias
+        """
+        if not self._accepting:
+            self.stats["rejected"] += 1
+            raise DispatcherFullError("Despachante encerrando")
+
+        if self._pending >= self.max_pending:
+            self.stats["rejected"] += 1
+            raise DispatcherFullError("Limite global de mensagens pendentes atingido")
+
+        queue = self._queues.get(phone_number)
+        if queue is None:
+            queue = asyncio.Queue()
+            self._queues[phone_number] = queue
+
+        if queue.qsize() >= self.max_queue_per_phone:
+            self.stats["rejected"] += 1
+            raise DispatcherFullError(f"Fila do telefone {phone_number} cheia")
+
+        future = asyncio.get_running_loop().create_future()
+        queue.put_nowait((func, args, kwargs, future))
+
+        self._pending += 1
+        self.stats["submitted"] += 1
+        self.stats["max_pending_seen"] = max(self.stats["max_pending_seen"], self._pending)
+
+        worker = self._workers.get(phone_number)
+        if worker is None or worker.done():
+            self._workers[phone_number] = asyncio.create_task(self._worker(phone_number, queue))
+
+        return future
+
+    async def _worker(self, phone_number: str, queue: asyncio.Queue):
+        """Consome a fila de um telefone, uma tarefa por vez"""
+        try:
+            while True:
+                try:
+                    func, args, kwargs, future = await asyncio.wait_for(queue.get(), timeout=self.idle_timeout)
+                except asyncio.TimeoutError:
+                    # Fila ociosa - liberar worker e fila
+                    if queue.empty():
+                        break
+                    continue
+
+                try:
+                    async with self._get_semaphore():
+                        self._running += 1
+                        try:
+                            result = await func(*args, **kwargs)
+                        finally:
+                            self._running -= 1
+
+                    self.stats["completed"] += 1
+                    if not future.done():
+                        future.set_result(result)
+
+                except asyncio.CancelledError:
+                    if not future.done():
+                        future.cancel()
+                    raise
+                except Exception as e:
+                    print(f"❌ Erro na tarefa do telefone {phone_number}: {e}")
+                    self.stats["failed"] += 1
+                    if not future.done():
+                        future.set_exception(e)
+                        # Evita aviso de exceção nunca recuperada quando o future é ignorado
+                        future.exception()
+                finally:
+                    self._pending -= 1
+                    queue.task_done()
+        finally:
+            if self._queues.get(phone_number) is queue and queue.empty():
+                del self._queues[phone_number]
+            if self._workers.get(phone_number) is asyncio.current_task():
+                del self._workers[phone_number]
+
+    async def drain(self, timeout: float = DISPATCHER_DRAIN_TIMEOUT) -> bool:
+        """
+        Para de aceitar novas tarefas e aguarda as pendentes terminarem.
+
+        Args:
+            timeout: Tempo máximo de espera em segundos
+
+        Returns:
+            True se todas as tarefas terminaram dentro do prazo
+        """
+        self._accepting = False
+        queues = list(self._queues.values())
+        print(f"⏳ Drenando despachante - {self._pending} tarefas pendentes em {len(queues)} filas")
+
+        drained = True
+        if queues:
+            try:
+                await asyncio.wait_for(
+                    asyncio.gather(*(queue.join() for queue in queues)),
+                    timeout=timeout
+                )
+            except asyncio.TimeoutError:
+                drained = False
+                print(f"⚠️ Tempo esgotado ao drenar despachante - {self._pending} tarefas descartadas")
+
+        workers = list(self._workers.values())
+        for worker in workers:
+            worker.cancel()
+        if workers:
+            await asyncio.gather(*workers, return_exceptions=True)
+
+        print("✅ Despachante encerrado")
+        return drained
+
+    def get_stats(self) -> dict:
+        """Retorna contadores e estado atual das filas"""
+        return {
+            **self.stats,
+            "pending": self._pending,
+            "running": self._running,
+            "active_phones": len(self._queues),
+            "max_concurrency": self.max_concurrency,
+            "accepting": self._accepting
+        }
@@ -0,0 +1,343 @@
+"""
+Leitura local de comprovantes PIX (caminho rápido antes da API de visão)
+O texto da imagem é obtido com o Tesseract (subprocesso) e os campos são extraídos
+por modelos de layout dos bancos mais comuns, com um modelo genérico de reserva.
+Cada leitura tem uma confiança; abaixo de RECEIPT_FAST_PATH_MIN_CONFIDENCE o
+comprovante segue para extract_receipt_data
+"""
+import asyncio
+import os
+import re
+import shutil
+from datetime import date
+from typing import List, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+RECEIPT_FAST_PATH = os.getenv("RECEIPT_FAST_PATH", "true").lower() == "true"
+RECEIPT_FAST_PATH_MIN_CONFIDENCE = float(os.getenv("RECEIPT_FAST_PATH_MIN_CONFIDENCE", "0.8"))
+TESSERACT_CMD = os.getenv("TESSERACT_CMD", "tesseract")
+TESSERACT_LANG = os.getenv("TESSERACT_LANG", "por")
+RECEIPT_OCR_TIMEOUT = float(os.getenv("RECEIPT_OCR_TIMEOUT", "10"))
+# Máximo de processos do Tesseract em paralelo por processo
+RECEIPT_OCR_CONCURRENCY = int(os.getenv("RECEIPT_OCR_CONCURRENCY", "2"))
+
+# Versão dos modelos abaixo (faz parte da chave do cache de resultados)
+RECEIPT_PARSER_VERSION = "pix-v1"
+
+TESSERACT_AVAILABLE = shutil.which(TESSERACT_CMD) is not None
+
+_ocr_semaphore = asyncio.Semaphore(RECEIPT_OCR_CONCURRENCY)
+
+parser_stats = {
+    "ocr_runs": 0,
+    "ocr_errors": 0,
+    "ocr_timeouts": 0,
+    "parsed": 0,
+    "confident": 0
+}
+
+# Peso de cada campo encontrado na confiança (soma 1.0)
+_CONFIDENCE_WEIGHTS = {
+    "valor": 0.4,
+    "data": 0.2,
+    "estabelecimento": 0.2,
+    "banco": 0.1,
+    "pix": 0.1
+}
+
+_MONTHS = {
+    "jan": 1, "fev": 2, "mar": 3, "abr": 4, "mai": 5, "jun": 6,
+    "jul": 7, "ago": 8, "set": 9, "out": 10, "nov": 11, "dez": 12
+}
+
+_AMOUNT = re.compile(r"R\$\s*(\d{1,3}(?:\.\d{3})*,\d{2}|\d+,\d{2})")
+_NUMERIC_DATE = re.compile(r"\b(\d{2})/(\d{2})/(\d{4})\b")
+_TEXT_DATE = re.compile(r"\b(\d{1,2})\s*(?:de\s+)?(jan|fev|mar|abr|mai|jun|jul|ago|set|out|nov|dez)[a-zç]*\.?\s*(?:de\s+)?(\d{4})\b", re.IGNORECASE)
+_PIX = re.compile(r"\bpix\b", re.IGNORECASE)
+_TED = re.compile(r"\b(ted|doc)\b", re.IGNORECASE)
+
+# Rótulos usados pela maioria dos comprovantes
+_DEFAULT_AMOUNT_LABELS = ["valor da transferência", "valor do pix", "valor pago", "valor enviado", "valor"]
+_DEFAULT_NAME_LABELS = ["nome do recebedor", "nome do favorecido", "quem recebeu", "recebedor", "favorecido",
+                        "destinatário", "destino", "para", "nome"]
+_DEFAULT_DATE_LABELS = ["data da transferência", "data do pagamento", "data e hora", "realizado em", "data"]
+_DEFAULT_DESTINATION = ["destino", "quem recebeu", "dados do recebedor", "recebedor", "favorecido", "para"]
+
+# Modelos por banco: `detect` identifica o layout; rótulos na ordem de preferência.
+# A seção de destino, quando existe, limita a busca do nome às linhas depois dela.
+RECEIPT_TEMPLATES = [
+    {
+        "bank": "nubank",
+        "detect": r"\bnu\s?bank\b|nu pagamentos",
+        "destination": ["destino"],
+        "amount_labels": ["valor"],
+        "name_labels": ["nome"],
+        "date_labels": []
+    },
+    {
+        "bank": "inter",
+        "detect": r"banco inter\b|\binter\s?&?\s?co\b",
+        "destination": ["quem recebeu", "para"],
+        "amount_labels": ["valor"],
+        "name_labels": ["nome"],
+        "date_labels": ["data"]
+    },
+    {
+        "bank": "itau",
+        "detect": r"\bita[uú]\b",
+        "destination": ["dados do recebedor", "recebedor"],
+        "amount_labels": ["valor da transferência", "valor"],
+        "name_labels": ["nome do recebedor", "nome"],
+        "date_labels": ["data da transferência", "data"]
+    },
+    {
+        "bank": "banco_do_brasil",
+        "detect": r"banco do brasil|\bbb\b",
+        "destination": ["pago para", "favorecido"],
+        "amount_labels": ["valor"],
+        "name_labels": ["nome", "favorecido"],
+        "date_labels": ["data"]
+    },
+    {
+        "bank": "caixa",
+        "detect": r"\bcaixa\b(?! postal)",
+        "destination": ["dados do recebedor", "recebedor"],
+        "amount_labels": ["valor"],
+        "name_labels": ["nome"],
+        "date_labels": ["data da operação", "data"]
+    },
+    {
+        "bank": "bradesco",
+        "detect": r"\bbradesco\b",
+        "destination": ["dados de quem recebeu", "favorecido"],
+        "amount_labels": ["valor"],
+        "name_labels": ["nome"],
+        "date_labels": ["data e hora", "data"]
+    },
+    {
+        "bank": "mercado_pago",
+        "detect": r"mercado\s?pago",
+        "destination": ["para"],
+        "amount_labels": ["valor", "você transferiu"],
+        "name_labels": ["para", "nome"],
+        "date_labels": ["data"]
+    },
+    {
+        "bank": "picpay",
+        "detect": r"\bpic\s?pay\b",
+        "destination": ["para", "destino"],
+        "amount_labels": ["valor"],
+        "name_labels": ["nome", "para"],
+        "date_labels": ["data"]
+    }
+]
+
+
+def _parse_amount(text: str) -> float:
+    return float(text.replace(".", "").replace(",", "."))
+
+
+def _parse_date(text: str) -> Optional[str]:
+    """Primeira data do texto (dd/mm/aaaa ou "15 OUT 2026") em ISO"""
+    match = _NUMERIC_DATE.search(text)
+    try:
+        if match:
+            day, month, year = match.groups()
+            return date(int(year), int(month), int(day)).isoformat()
+        match = _TEXT_DATE.search(text)
+        if match:
+            day, month, year = match.groups()
+            return date(int(year), _MONTHS[month[:3].lower()], int(day)).isoformat()
+    except ValueError:
+        return None
+    return None
+
+
+def _label_value(lines: List[str], labels: List[str], start: int = 0) -> Optional[str]:
+    """
+    Valor de um rótulo: o resto da linha depois dele ou, se vazio, a próxima linha não vazia
+    """
+    for label in labels:
+        pattern = re.compile(rf"^\s*{re.escape(label)}\b\s*[:\-]?\s*(.*)$", re.IGNORECASE)
+        for index in range(start, len(lines)):
+            match = pattern.match(lines[index])
+            if not match:
+                continue
+            value = match.group(1).strip()
+            if value:
+                return value
+            for following in lines[index + 1:index + 3]:
+                if following.strip():
+                    return following.strip()
+    return None
+
+
+def _section_start(lines: List[str], headers: List[str]) -> int:
+    for header in headers:
+        for index, line in enumerate(lines):
+            if line.strip().lower().startswith(header):
+                return index
+    return 0
+
+
+def _detect_template(lowered: str) -> Optional[dict]:
+    """Modelo do banco citado primeiro (o emissor vem no topo; outros bancos aparecem nos dados das contas)"""
+    best, best_position = None, None
+    for template in RECEIPT_TEMPLATES:
+        match = re.search(template["detect"], lowered)
+        if match and (best_position is None or match.start() < best_position):
+            best, best_position = template, match.start()
+    return best
+
+
+def _clean_name(value: Optional[str]) -> Optional[str]:
+    if not value:
+        return None
+    # Descarta CPF/CNPJ mascarado, chaves e valores que vêm na mesma linha
+    value = re.split(r"\s{2,}|\bcpf\b|\bcnpj\b|\*\*\*|R\$", value, flags=re.IGNORECASE)[0].strip(" :-•")
+    if len(value) < 3 or not re.search(r"[A-Za-zÀ-ú]{2}", value) or _AMOUNT.search(value):
+        return None
+    return value.title() if value.isupper() else value
+
+
+def parse_receipt_text(text: str) -> Optional[dict]:
+    """
+    Extrai os campos de um comprovante a partir do texto do OCR
+
+    Returns:
+        dict no formato de extract_receipt_data ({"valor", "descricao", "data",
+        "metodo_pagamento", "categoria_sugerida", "estabelecimento",
+        "tipo_comprovante", "confianca"}) mais "banco" e "fonte", ou None sem texto
+    """
+    if not text or not text.strip():
+        return None
+
+    lines = [line for line in text.splitlines() if line.strip()]
+    lowered = text.lower()
+
+    template = _detect_template(lowered)
+    amount_labels = (template["amount_labels"] if template else []) + _DEFAULT_AMOUNT_LABELS
+    name_labels = (template["name_labels"] if template else []) + _DEFAULT_NAME_LABELS
+    date_labels = (template["date_labels"] if template else []) + _DEFAULT_DATE_LABELS
+
+    found = {}
+
+    # Valor: pelo rótulo; sem rótulo, só quando o texto tem um único valor
+    amount = None
+    labelled = _label_value(lines, amount_labels)
+    match = _AMOUNT.search(labelled or "")
+    if match:
+        amount = _parse_amount(match.group(1))
+        found["valor"] = 1.0
+    else:
+        amounts = {_parse_amount(m) for m in _AMOUNT.findall(text)}
+        if len(amounts) == 1:
+            amount = amounts.pop()
+            found["valor"] = 0.6
+
+    # Data: pelo rótulo ou a primeira data do texto
+    transaction_date = _parse_date(_label_value(lines, date_labels) or "") or _parse_date(text)
+    if transaction_date:
+        found["data"] = 1.0
+
+    # Recebedor: procurado depois da seção de destino (o pagador aparece antes)
+    start = _section_start(lines, template["destination"] if template else _DEFAULT_DESTINATION)
+    name = _clean_name(_label_value(lines, name_labels, start))
+    if name:
+        found["estabelecimento"] = 1.0
+
+    if template:
+        found["banco"] = 1.0
+    is_pix = bool(_PIX.search(text))
+    if is_pix:
+        found["pix"] = 1.0
+
+    confidence = sum(_CONFIDENCE_WEIGHTS[field] * weight for field, weight in found.items())
+
+    result = {
+        "valor": amount,
+        "descricao": name,
+        "data": transaction_date,
+        "metodo_pagamento": "pix" if is_pix else None,
+        "categoria_sugerida": "Outras despesas",
+        "estabelecimento": name,
+        "tipo_comprovante": "pix" if is_pix else ("ted" if _TED.search(text) else None),
+        "confianca": round(confidence, 2),
+        "banco": template["bank"] if template else None,
+        "fonte": "ocr_local"
+    }
+
+    parser_stats["parsed"] += 1
+    if fast_path_accepts(result):
+        parser_stats["confident"] += 1
+
+    return result
+
+
+def fast_path_accepts(result: Optional[dict]) -> bool:
+    """
+    Se a leitura local pode substituir a API de visão: confiança mínima e todos os
+    campos que a confirmação ao usuário usa (valor, recebedor, método e tipo PIX)
+    """
+    return bool(
+        result
+        and result.get("valor")
+        and result.get("estabelecimento")
+        and result.get("metodo_pagamento")
+        and result.get("tipo_comprovante")
+        and result.get("confianca", 0) >= RECEIPT_FAST_PATH_MIN_CONFIDENCE
+    )
+
+
+async def ocr_image(data: bytes) -> Optional[str]:
+    """
+    Texto da imagem pelo Tesseract (entrada e saída pelo stdin/stdout do subprocesso)
+
+    Returns:
+        Texto reconhecido, ou None se o Tesseract não estiver instalado, falhar ou exceder o timeout
+    """
+    if not TESSERACT_AVAILABLE:
+        return None
+
+    async with _ocr_semaphore:
+        parser_stats["ocr_runs"] += 1
+        process = await asyncio.create_subprocess_exec(
+            TESSERACT_CMD, "stdin", "stdout", "-l", TESSERACT_LANG, "--psm", "6",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(data), timeout=RECEIPT_OCR_TIMEOUT)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            parser_stats["ocr_timeouts"] += 1
+            print(f"⚠️ OCR do comprovante excedeu {RECEIPT_OCR_TIMEOUT:.0f}s")
+            return None
+
+    if process.returncode != 0:
+        parser_stats["ocr_errors"] += 1
+        print(f"⚠️ Erro no OCR do comprovante: {stderr.decode(errors='replace')[:300]}")
+        return None
+
+    return stdout.decode("utf-8", errors="replace")
+
+
+async def parse_receipt_image(data: bytes) -> Optional[dict]:
+    """OCR + modelos de layout; None quando o caminho rápido está desligado ou não há texto"""
+    if not RECEIPT_FAST_PATH:
+        return None
+    return parse_receipt_text(await ocr_image(data))
+
+
+def get_parser_stats() -> dict:
+    """Retorna contadores do OCR e da leitura local"""
+    return {
+        **parser_stats,
+        "tesseract_available": TESSERACT_AVAILABLE,
+        "enabled": RECEIPT_FAST_PATH,
+        "min_confidence": RECEIPT_FAST_PATH_MIN_CONFIDENCE
+    }
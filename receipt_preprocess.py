@@ -0,0 +1,180 @@
+"""
+Pré-processamento das fotos de comprovante antes da chamada de visão
+Corrige a orientação (EXIF), recorta a região do documento, reduz para um lado
+máximo, converte para tons de cinza com contraste normalizado e regrava em JPEG.
+Roda num pool de processos para não ocupar o event loop; sem Pillow instalado a
+imagem segue sem alterações
+"""
+import asyncio
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Pillow é opcional: sem ele o pré-processamento é ignorado
+try:
+    from PIL import Image, ImageOps
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+RECEIPT_PREPROCESS = os.getenv("RECEIPT_PREPROCESS", "true").lower() == "true"
+# Maior lado da imagem enviada (pixels)
+RECEIPT_MAX_EDGE = int(os.getenv("RECEIPT_MAX_EDGE", "1600"))
+RECEIPT_JPEG_QUALITY = int(os.getenv("RECEIPT_JPEG_QUALITY", "80"))
+RECEIPT_GRAYSCALE = os.getenv("RECEIPT_GRAYSCALE", "true").lower() == "true"
+RECEIPT_CROP = os.getenv("RECEIPT_CROP", "true").lower() == "true"
+RECEIPT_PREPROCESS_WORKERS = int(os.getenv("RECEIPT_PREPROCESS_WORKERS", "2"))
+
+# Detecção do documento: lado da miniatura analisada e fração mínima da imagem que o recorte deve manter
+_CROP_PROBE_EDGE = 256
+_CROP_MIN_AREA = 0.2
+_CROP_MARGIN = 0.02
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+preprocess_stats = {
+    "images": 0,
+    "bytes_in": 0,
+    "bytes_out": 0,
+    "skipped": 0,
+    "errors": 0
+}
+
+
+def _document_box(image) -> Optional[Tuple[int, int, int, int]]:
+    """
+    Caixa da região clara (papel) sobre o fundo, ou None se não houver um recorte útil
+
+    A análise é feita numa miniatura em tons de cinza: os pixels acima do nível médio
+    formam a máscara do papel e o recorte é a caixa que os contém, com uma pequena margem.
+    """
+    probe = ImageOps.autocontrast(image.convert("L"))
+    probe.thumbnail((_CROP_PROBE_EDGE, _CROP_PROBE_EDGE))
+    histogram = probe.histogram()
+    pixels = sum(histogram)
+    mean = sum(level * count for level, count in enumerate(histogram)) / pixels
+
+    box = probe.point(lambda level: 255 if level > mean else 0).getbbox()
+    if not box:
+        return None
+
+    left, top, right, bottom = box
+    area = (right - left) * (bottom - top) / (probe.width * probe.height)
+    if area < _CROP_MIN_AREA or area > 0.95:
+        return None
+
+    scale_x = image.width / probe.width
+    scale_y = image.height / probe.height
+    margin_x = image.width * _CROP_MARGIN
+    margin_y = image.height * _CROP_MARGIN
+    return (
+        max(int(left * scale_x - margin_x), 0),
+        max(int(top * scale_y - margin_y), 0),
+        min(int(right * scale_x + margin_x), image.width),
+        min(int(bottom * scale_y + margin_y), image.height)
+    )
+
+
+def preprocess_image(
+    data: bytes,
+    max_edge: int = RECEIPT_MAX_EDGE,
+    quality: int = RECEIPT_JPEG_QUALITY,
+    grayscale: bool = RECEIPT_GRAYSCALE,
+    crop: bool = RECEIPT_CROP
+) -> bytes:
+    """
+    Prepara a foto de um comprovante para a API de visão
+
+    Args:
+        data: Bytes da imagem original (qualquer formato suportado pelo Pillow)
+        max_edge: Maior lado da imagem final (pixels)
+        quality: Qualidade do JPEG final
+        grayscale: Converter para tons de cinza com contraste normalizado
+        crop: Recortar a região do documento quando detectada
+
+    Returns:
+        JPEG resultante, ou os bytes originais se o JPEG não ficar menor
+    """
+    image = ImageOps.exif_transpose(Image.open(io.BytesIO(data)))
+
+    if crop:
+        box = _document_box(image)
+        if box:
+            image = image.crop(box)
+
+    image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+    if grayscale:
+        image = ImageOps.autocontrast(image.convert("L"), cutoff=1)
+    elif image.mode != "RGB":
+        image = image.convert("RGB")
+
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=quality, optimize=True)
+    result = output.getvalue()
+    return result if len(result) < len(data) else data
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=RECEIPT_PREPROCESS_WORKERS)
+    return _executor
+
+
+async def preprocess_receipt(data: bytes, mimetype: str = "image/jpeg") -> Tuple[bytes, str]:
+    """
+    Pré-processa a imagem no pool de processos
+
+    Returns:
+        (bytes, mimetype) da imagem a enviar; a original quando o pré-processamento
+        está desligado, o Pillow não está instalado ou a imagem não pôde ser lida
+    """
+    if not RECEIPT_PREPROCESS or not PIL_AVAILABLE:
+        preprocess_stats["skipped"] += 1
+        return data, mimetype
+
+    try:
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(_get_executor(), preprocess_image, data)
+    except Exception as e:
+        preprocess_stats["errors"] += 1
+        print(f"⚠️ Erro ao pré-processar comprovante, enviando original: {e}")
+        return data, mimetype
+
+    preprocess_stats["images"] += 1
+    preprocess_stats["bytes_in"] += len(data)
+    preprocess_stats["bytes_out"] += len(result)
+    if len(result) >= len(data):
+        return data, mimetype
+    return result, "image/jpeg"
+
+
+def preprocess_signature() -> str:
+    """Configuração em vigor, para versionar resultados obtidos de imagens pré-processadas"""
+    if not RECEIPT_PREPROCESS or not PIL_AVAILABLE:
+        return "off"
+    return f"e{RECEIPT_MAX_EDGE}q{RECEIPT_JPEG_QUALITY}{'g' if RECEIPT_GRAYSCALE else ''}{'c' if RECEIPT_CROP else ''}"
+
+
+def shutdown_preprocess_pool():
+    """Encerra o pool de processos (chamado no encerramento da aplicação)"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def get_preprocess_stats() -> dict:
+    """Retorna contadores do pré-processamento"""
+    saved = preprocess_stats["bytes_in"] - preprocess_stats["bytes_out"]
+    return {
+        **preprocess_stats,
+        "bytes_saved": saved,
+        "pil_available": PIL_AVAILABLE,
+        "enabled": RECEIPT_PREPROCESS
+    }
@@ -0,0 +1,343 @@
+"""
+Recorrências mensais (tabela recurrence_rules)
+Uma regra por despesa/receita recorrente; as ocorrências são gravadas em transactions
+só até alguns meses à frente, em lotes, por um job periódico (worker). Consultas sobre
+meses mais distantes expandem as regras em memória, sem gravar linhas
+
+Para materializar uma vez: python recurrence_scheduler.py
+"""
+import asyncio
+import calendar
+import os
+from datetime import date
+from typing import Dict, List
+from dotenv import load_dotenv
+
+from database import supabase
+
+load_dotenv()
+
+# Meses à frente do atual que ficam gravados em transactions
+RECURRENCE_HORIZON_MONTHS = int(os.getenv("RECURRENCE_HORIZON_MONTHS", "1"))
+# Intervalo do job de materialização (segundos)
+RECURRENCE_SCHEDULER_INTERVAL = float(os.getenv("RECURRENCE_SCHEDULER_INTERVAL", "3600"))
+# Meses à frente expandidos em memória nas consultas de compromissos futuros
+RECURRENCE_VIRTUAL_MONTHS = int(os.getenv("RECURRENCE_VIRTUAL_MONTHS", "12"))
+# Regras processadas por lote (uma inserção em transactions por lote)
+RECURRENCE_BATCH_SIZE = int(os.getenv("RECURRENCE_BATCH_SIZE", "500"))
+
+
+def add_months(month: date, count: int) -> date:
+    """Primeiro dia do mês `count` meses depois (ou antes) de `month`"""
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def horizon_month(today: date = None) -> date:
+    """Último mês que deve estar gravado em transactions"""
+    return add_months((today or date.today()).replace(day=1), RECURRENCE_HORIZON_MONTHS)
+
+
+def occurrence_date(rule: dict, month: date) -> date:
+    """Vencimento da regra no mês (dia limitado ao último dia do mês)"""
+    last_day = calendar.monthrange(month.year, month.month)[1]
+    return month.replace(day=min(int(rule["due_day"]), last_day))
+
+
+def _month(value) -> date:
+    if value is None or isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10]).replace(day=1)
+
+
+def rule_months(rule: dict, first_month: date, last_month: date) -> List[date]:
+    """Meses da regra dentro do intervalo (inclusive), respeitando início e fim da regra"""
+    start = max(_month(rule["start_month"]), first_month)
+    end_month = _month(rule.get("end_month"))
+    end = min(end_month, last_month) if end_month else last_month
+
+    months = []
+    current = start
+    while current <= end:
+        months.append(current)
+        current = add_months(current, 1)
+    return months
+
+
+def _instance(rule: dict, month: date) -> dict:
+    """Linha de transactions de uma ocorrência da regra"""
+    instance = {
+        "user_id": rule["user_id"],
+        "amount": float(rule["amount"]),
+        "description": rule["description"],
+        "category_id": rule.get("category_id"),
+        "payment_method": rule.get("payment_method"),
+        "transaction_type": rule["transaction_type"],
+        "type": rule["transaction_type"],  # Campo legado
+        "recurrence": True,
+        "credit_card_id": rule.get("credit_card_id"),
+        "installments": 1,
+        "due_date": occurrence_date(rule, month).isoformat(),
+        "recurrence_rule_id": rule["id"]
+    }
+    return {k: v for k, v in instance.items() if v is not None}
+
+
+def materialize_rules(rules: List[dict], through: date = None) -> List[dict]:
+    """
+    Grava as ocorrências que faltam das regras até o mês `through`
+
+    Todas as ocorrências vão numa única inserção (ocorrências já gravadas são
+    ignoradas pelo índice único de recurrence_rule_id + due_date) e
+    materialized_through é atualizado com um comando por mês final.
+
+    Returns:
+        Transações inseridas
+    """
+    through = through or horizon_month()
+
+    rows = []
+    advanced: Dict[date, List[str]] = {}
+    finished = []
+    for rule in rules:
+        done = _month(rule.get("materialized_through"))
+        first = add_months(done, 1) if done else _month(rule["start_month"])
+        months = rule_months(rule, first, through)
+        rows.extend(_instance(rule, month) for month in months)
+
+        end_month = _month(rule.get("end_month"))
+        last = min(end_month, through) if end_month else through
+        if done is None or last > done:
+            advanced.setdefault(last, []).append(rule["id"])
+        if end_month and end_month <= through:
+            finished.append(rule["id"])
+
+    inserted = []
+    if rows:
+        resp = supabase.table("transactions").upsert(
+            rows, on_conflict="recurrence_rule_id,due_date", ignore_duplicates=True
+        ).execute()
+        inserted = resp.data or []
+
+    for last, rule_ids in advanced.items():
+        supabase.table("recurrence_rules").update({
+            "materialized_through": last.isoformat()
+        }).in_("id", rule_ids).execute()
+
+    if finished:
+        supabase.table("recurrence_rules").update({"is_active": False}).in_("id", finished).execute()
+
+    return inserted
+
+
+def materialize_due(through: date = None) -> dict:
+    """
+    Materializa todas as regras ativas atrasadas em relação ao horizonte, em lotes
+
+    Returns:
+        dict: {"rules", "transactions"} processados e "user_ids" com transações gravadas
+    """
+    if not supabase:
+        return {"rules": 0, "transactions": 0, "user_ids": []}
+
+    through = through or horizon_month()
+    totals = {"rules": 0, "transactions": 0}
+    user_ids = set()
+
+    while True:
+        resp = supabase.table("recurrence_rules").select("*").eq("is_active", True).or_(
+            f"materialized_through.is.null,materialized_through.lt.{through.isoformat()}"
+        ).limit(RECURRENCE_BATCH_SIZE).execute()
+        rules = resp.data or []
+        if not rules:
+            break
+
+        inserted = materialize_rules(rules, through)
+        totals["rules"] += len(rules)
+        totals["transactions"] += len(inserted)
+        user_ids.update(row["user_id"] for row in inserted)
+
+        if len(rules) < RECURRENCE_BATCH_SIZE:
+            break
+
+    return {**totals, "user_ids": sorted(user_ids)}
+
+
+def create_rule(user_id: str, transaction_type: str, amount: float, description: str, category_id: str,
+                due_day: int, payment_method: str = None, credit_card_id: str = None,
+                months: int = None, start_month: date = None) -> dict:
+    """
+    Cria uma regra de recorrência mensal e grava as ocorrências até o horizonte
+
+    Args:
+        months: Quantidade de meses (None = até a regra ser cancelada)
+        start_month: Primeiro mês (padrão: mês atual)
+
+    Returns:
+        dict: {"rule", "transactions"} com a regra criada e as ocorrências gravadas
+    """
+    start_month = (start_month or date.today()).replace(day=1)
+    rule_data = {
+        "user_id": user_id,
+        "transaction_type": transaction_type,
+        "amount": abs(amount),
+        "description": description,
+        "category_id": category_id,
+        "payment_method": payment_method,
+        "credit_card_id": credit_card_id,
+        "due_day": due_day,
+        "start_month": start_month.isoformat(),
+        "end_month": add_months(start_month, months - 1).isoformat() if months else None
+    }
+    rule_data = {k: v for k, v in rule_data.items() if v is not None}
+
+    resp = supabase.table("recurrence_rules").insert(rule_data).execute()
+    rule = resp.data[0]
+
+    return {"rule": rule, "transactions": materialize_rules([rule])}
+
+
+def cancel_rules(user_id: str, description_keyword: str) -> List[dict]:
+    """
+    Encerra as recorrências ativas cuja descrição contém a palavra-chave e remove
+    as ocorrências futuras ainda não pagas
+
+    Returns:
+        Regras encerradas
+    """
+    resp = supabase.table("recurrence_rules").select("id, description, amount, transaction_type").eq(
+        "user_id", user_id
+    ).eq("is_active", True).ilike("description", f"%{description_keyword}%").execute()
+    rules = resp.data or []
+    if not rules:
+        return []
+
+    rule_ids = [rule["id"] for rule in rules]
+    supabase.table("recurrence_rules").update({"is_active": False}).in_("id", rule_ids).execute()
+    supabase.table("transactions").delete().in_("recurrence_rule_id", rule_ids).is_(
+        "paid_date", "null"
+    ).gt("due_date", date.today().isoformat()).execute()
+
+    return rules
+
+
+def expand_virtual(user_id: str, start_date, end_date, transaction_type: str = None) -> List[dict]:
+    """
+    Ocorrências das regras ativas no período que ainda não estão gravadas em transactions
+
+    Nada é gravado; as linhas vêm com "virtual": True e sem "id".
+
+    Returns:
+        Transações pendentes no formato de transactions (com categories(name))
+    """
+    if not supabase:
+        return []
+
+    first_month = _month(start_date)
+    last_month = _month(end_date)
+
+    query = supabase.table("recurrence_rules").select("*, categories(name)").eq(
+        "user_id", user_id
+    ).eq("is_active", True).lte("start_month", last_month.isoformat())
+    if transaction_type:
+        query = query.eq("transaction_type", transaction_type)
+    rules = query.execute().data or []
+
+    start = date.fromisoformat(str(start_date)[:10])
+    end = date.fromisoformat(str(end_date)[:10])
+
+    instances = []
+    for rule in rules:
+        done = _month(rule.get("materialized_through"))
+        first = max(first_month, add_months(done, 1)) if done else first_month
+        for month in rule_months(rule, first, last_month):
+            instance = _instance(rule, month)
+            if not start <= date.fromisoformat(instance["due_date"]) <= end:
+                continue
+            instance["categories"] = rule.get("categories")
+            instance["virtual"] = True
+            instances.append(instance)
+
+    return instances
+
+
+class RecurrenceScheduler:
+    """
+    Job periódico que mantém as recorrências gravadas até o horizonte.
+
+    Roda no worker; várias instâncias ao mesmo tempo são seguras, porque a
+    inserção ignora ocorrências já gravadas.
+    """
+
+    def __init__(self, interval: float = RECURRENCE_SCHEDULER_INTERVAL):
+        """
+        Args:
+            interval: Segundos entre execuções
+        """
+        self.interval = interval
+        self._task = None
+        self.stats = {
+            "runs": 0,
+            "rules": 0,
+            "transactions": 0,
+            "errors": 0
+        }
+
+    async def start(self):
+        """Inicia o job em segundo plano"""
+        if self._task:
+            return
+        self._task = asyncio.create_task(self._loop())
+        print(f"🔁 Agendador de recorrências iniciado (a cada {self.interval:.0f}s, {RECURRENCE_HORIZON_MONTHS} meses à frente)")
+
+    async def stop(self):
+        """Para o job"""
+        if not self._task:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        print("✅ Agendador de recorrências encerrado")
+
+    async def run_once(self) -> dict:
+        """Materializa as recorrências atrasadas uma vez"""
+        from functions_database_async import run_db
+
+        result = await run_db(materialize_due)
+        self.stats["runs"] += 1
+        self.stats["rules"] += result["rules"]
+        self.stats["transactions"] += result["transactions"]
+        if result["transactions"]:
+            from budget_engine import budget_engine
+            await asyncio.gather(*(budget_engine.invalidate(user_id) for user_id in result["user_ids"]))
+            print(f"🔁 Recorrências: {result['transactions']} transações gravadas de {result['rules']} regras")
+        return result
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"❌ Erro ao materializar recorrências: {e}")
+            await asyncio.sleep(self.interval)
+
+    def get_stats(self) -> dict:
+        """Retorna contadores do agendador"""
+        return {
+            **self.stats,
+            "running": self._task is not None,
+            "horizon_months": RECURRENCE_HORIZON_MONTHS
+        }
+
+
+# Instância global
+recurrence_scheduler = RecurrenceScheduler()
+
+
+if __name__ == "__main__":
+    print(f"🔁 Materializando recorrências até {horizon_month().strftime('%m/%Y')}...")
+    result = materialize_due()
+    print(f"✅ {result['transactions']} transações gravadas de {result['rules']} regras")
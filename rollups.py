@@ -0,0 +1,115 @@
+"""
+Totais mensais materializados (tabela monthly_rollups)
+Mantidos pelo banco a cada escrita em transactions (triggers da migração
+20261016000400_monthly_rollups.sql); aqui ficam a leitura para as análises
+e o comando de reconstrução
+
+Uso: python rollups.py [user_id]   (sem user_id reconstrói todos os usuários)
+A reconstrução só é aceita com a chave service_role (SUPABASE_ANON_KEY=<service_role> python rollups.py)
+"""
+import calendar
+import sys
+from datetime import date
+from typing import List, Optional, Tuple
+
+from database import supabase
+
+
+def _to_date(value) -> date:
+    return value if isinstance(value, date) else date.fromisoformat(str(value)[:10])
+
+
+def rollup_months(start_date, end_date, is_paid: bool) -> Optional[Tuple[date, date]]:
+    """
+    Primeiro e último mês cobertos por um período, se ele puder ser lido dos rollups
+
+    O período precisa começar no dia 1 e terminar no último dia de um mês. Para
+    transações pagas, terminar hoje também vale (não há pagamentos com data futura).
+
+    Returns:
+        (primeiro mês, último mês) ou None se o período cortar algum mês ao meio
+    """
+    if not start_date or not end_date:
+        return None
+
+    start = _to_date(start_date)
+    end = _to_date(end_date)
+    if start.day != 1 or end < start:
+        return None
+
+    today = date.today()
+    month_end = end.replace(day=calendar.monthrange(end.year, end.month)[1])
+    ends_today = is_paid and end >= today and (end.year, end.month) == (today.year, today.month)
+    if end != month_end and not ends_today:
+        return None
+
+    return start, end.replace(day=1)
+
+
+def get_rollup_rows(user_id: str, first_month: date, last_month: date, is_paid: bool,
+                    transaction_type: str = None) -> Optional[List[dict]]:
+    """
+    Totais por mês, categoria e tipo no intervalo de meses (RPC rollup_totals)
+
+    Returns:
+        [{"month", "category_name", "transaction_type", "total", "count"}],
+        ou None se os rollups não estiverem disponíveis
+    """
+    if not supabase:
+        return None
+
+    try:
+        resp = supabase.rpc("rollup_totals", {
+            "p_user_id": user_id,
+            "p_first_month": first_month.isoformat(),
+            "p_last_month": last_month.isoformat(),
+            "p_is_paid": is_paid,
+            "p_transaction_type": transaction_type
+        }).execute()
+    except Exception as e:
+        print(f"Aviso: rollups indisponíveis, usando agregação direta: {e}")
+        return None
+
+    return [
+        {
+            "month": _to_date(row["month"]),
+            "category_name": row["category_name"],
+            "transaction_type": row["transaction_type"],
+            "total": float(row["total"]),
+            "count": int(row["count"])
+        } for row in resp.data or []
+    ]
+
+
+def get_period_rollups(user_id: str, start_date, end_date, is_paid: bool,
+                       transaction_type: str = None) -> Optional[List[dict]]:
+    """Linhas dos rollups de um período, ou None se o período não for de meses inteiros"""
+    months = rollup_months(start_date, end_date, is_paid)
+    if months is None:
+        return None
+    return get_rollup_rows(user_id, months[0], months[1], is_paid, transaction_type)
+
+
+def rebuild(user_id: str = None) -> int:
+    """
+    Recalcula os rollups a partir de transactions
+
+    Args:
+        user_id: Usuário a reconstruir (None = todos)
+
+    Returns:
+        Quantidade de linhas de rollup geradas
+    """
+    if not supabase:
+        print("Mock: Reconstrução dos rollups ignorada (banco indisponível)")
+        return 0
+
+    resp = supabase.rpc("rebuild_monthly_rollups", {"p_user_id": user_id}).execute()
+    return int(resp.data or 0)
+
+
+if __name__ == "__main__":
+    target = sys.argv[1] if len(sys.argv) > 1 else None
+    print(f"🔄 Reconstruindo rollups mensais ({target or 'todos os usuários'})...")
+    rows = rebuild(target)
+    print(f"✅ {rows} linhas de rollup geradas")
@@ -0,0 +1,56 @@
+-- Agregações de transações calculadas no banco (chamadas via supabase.rpc)
+-- Evitam baixar todas as transações do período para somar em Python
+
+-- Totais por tipo (receita/despesa) em um período
+--   p_date_field: coluna usada no filtro de período ('paid_date' ou 'due_date')
+--   p_is_paid: true = só pagas, false = só pendentes, null = todas
+CREATE OR REPLACE FUNCTION public.transaction_totals(
+  p_user_id uuid,
+  p_start date DEFAULT NULL,
+  p_end date DEFAULT NULL,
+  p_date_field text DEFAULT 'paid_date',
+  p_is_paid boolean DEFAULT NULL
+)
+RETURNS TABLE (transaction_type text, total numeric, count bigint)
+LANGUAGE sql
+STABLE
+AS $$
+  SELECT t.transaction_type::text, COALESCE(SUM(t.amount), 0), COUNT(*)
+  FROM public.transactions t
+  WHERE t.user_id = p_user_id
+    AND (p_is_paid IS NULL OR (t.paid_date IS NOT NULL) = p_is_paid)
+    AND (p_start IS NULL OR (CASE WHEN p_date_field = 'due_date' THEN t.due_date ELSE t.paid_date END) >= p_start)
+    AND (p_end IS NULL OR (CASE WHEN p_date_field = 'due_date' THEN t.due_date ELSE t.paid_date END) <= p_end)
+  GROUP BY t.transaction_type;
+$$;
+
+-- Totais por categoria em um período (category_name nulo = transações sem categoria)
+CREATE OR REPLACE FUNCTION public.category_totals(
+  p_user_id uuid,
+  p_start date DEFAULT NULL,
+  p_end date DEFAULT NULL,
+  p_date_field text DEFAULT 'paid_date',
+  p_is_paid boolean DEFAULT NULL,
+  p_transaction_type text DEFAULT NULL
+)
+RETURNS TABLE (category_name text, transaction_type text, total numeric, count bigint)
+LANGUAGE sql
+STABLE
+AS $$
+  SELECT c.name::text, MIN(t.transaction_type::text), COALESCE(SUM(t.amount), 0), COUNT(*)
+  FROM public.transactions t
+  LEFT JOIN public.categories c ON c.id = t.category_id
+  WHERE t.user_id = p_user_id
+    AND (p_transaction_type IS NULL OR t.transaction_type = p_transaction_type)
+    AND (p_is_paid IS NULL OR (t.paid_date IS NOT NULL) = p_is_paid)
+    AND (p_start IS NULL OR (CASE WHEN p_date_field = 'due_date' THEN t.due_date ELSE t.paid_date END) >= p_start)
+    AND (p_end IS NULL OR (CASE WHEN p_date_field = 'due_date' THEN t.due_date ELSE t.paid_date END) <= p_end)
+  GROUP BY c.name
+  ORDER BY SUM(t.amount) DESC;
+$$;
+
+-- Índices que cobrem os filtros das agregações
+CREATE INDEX IF NOT EXISTS idx_transactions_user_paid_date
+  ON public.transactions (user_id, paid_date);
+CREATE INDEX IF NOT EXISTS idx_transactions_user_due_date
+  ON public.transactions (user_id, due_date);
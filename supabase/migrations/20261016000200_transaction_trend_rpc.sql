@@ -0,0 +1,29 @@
+-- Tendência de receitas e despesas pagas por mês ou semana, com categoria opcional
+--   p_granularity: 'month' (meses de calendário) ou 'week' (semanas começando na segunda)
+--   p_by_category: true = uma linha por período e categoria
+CREATE OR REPLACE FUNCTION public.transaction_trend(
+  p_user_id uuid,
+  p_start date,
+  p_end date,
+  p_granularity text DEFAULT 'month',
+  p_by_category boolean DEFAULT false
+)
+RETURNS TABLE (bucket date, category_name text, income numeric, expenses numeric, count bigint)
+LANGUAGE sql
+STABLE
+AS $$
+  SELECT
+    date_trunc(CASE WHEN p_granularity = 'week' THEN 'week' ELSE 'month' END, t.paid_date::timestamp)::date,
+    CASE WHEN p_by_category THEN c.name::text END,
+    COALESCE(SUM(t.amount) FILTER (WHERE t.transaction_type = 'income'), 0),
+    COALESCE(SUM(t.amount) FILTER (WHERE t.transaction_type = 'expense'), 0),
+    COUNT(*)
+  FROM public.transactions t
+  LEFT JOIN public.categories c ON p_by_category AND c.id = t.category_id
+  WHERE t.user_id = p_user_id
+    AND t.paid_date IS NOT NULL
+    AND t.paid_date >= p_start
+    AND t.paid_date <= p_end
+  GROUP BY 1, 2
+  ORDER BY 1;
+$$;
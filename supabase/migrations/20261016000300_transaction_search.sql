@@ -0,0 +1,14 @@
+-- Filtros de search_transactions executados no banco
+-- Dia e mês do vencimento como colunas geradas (filtráveis pelo PostgREST com eq)
+ALTER TABLE public.transactions
+  ADD COLUMN IF NOT EXISTS due_day smallint
+    GENERATED ALWAYS AS (EXTRACT(DAY FROM due_date)::smallint) STORED,
+  ADD COLUMN IF NOT EXISTS due_month smallint
+    GENERATED ALWAYS AS (EXTRACT(MONTH FROM due_date)::smallint) STORED;
+
+-- Paginação por keyset (created_at desc, id desc)
+CREATE INDEX IF NOT EXISTS idx_transactions_user_created_id
+  ON public.transactions (user_id, created_at DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_transactions_user_due_month_day
+  ON public.transactions (user_id, due_month, due_day);
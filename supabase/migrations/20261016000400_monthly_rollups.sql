@@ -0,0 +1,151 @@
+-- Totais mensais materializados por usuário, categoria, tipo e situação (paga/pendente)
+-- Transações pagas entram no mês do paid_date; pendentes no mês do due_date
+-- (transações sem nenhuma das duas datas não entram em nenhum período)
+CREATE TABLE IF NOT EXISTS public.monthly_rollups (
+  user_id uuid NOT NULL,
+  month date NOT NULL,
+  category_id uuid,
+  transaction_type text NOT NULL,
+  is_paid boolean NOT NULL,
+  total numeric NOT NULL DEFAULT 0,
+  count bigint NOT NULL DEFAULT 0,
+  updated_at timestamptz NOT NULL DEFAULT now(),
+  CONSTRAINT monthly_rollups_key UNIQUE NULLS NOT DISTINCT (user_id, month, category_id, transaction_type, is_paid)
+);
+
+-- Acesso pela API: leitura só dos totais de quem o chamador já enxerga em transactions
+-- (a política de transactions vale na subconsulta); escrita só pelos triggers
+ALTER TABLE public.monthly_rollups ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS monthly_rollups_select ON public.monthly_rollups;
+CREATE POLICY monthly_rollups_select ON public.monthly_rollups
+  FOR SELECT
+  USING (EXISTS (SELECT 1 FROM public.transactions t WHERE t.user_id = monthly_rollups.user_id));
+
+REVOKE INSERT, UPDATE, DELETE, TRUNCATE ON public.monthly_rollups FROM anon, authenticated;
+
+-- Mantém os totais a cada escrita em transactions (um upsert agrupado por comando, não por linha)
+-- SECURITY DEFINER: grava nos rollups com os direitos do dono, qualquer que seja o papel que escreveu a transação
+CREATE OR REPLACE FUNCTION public.monthly_rollups_apply()
+RETURNS trigger
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+  v_source text;
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    v_source := 'SELECT n.*, 1 AS sign FROM new_rows n';
+  ELSIF TG_OP = 'DELETE' THEN
+    v_source := 'SELECT o.*, -1 AS sign FROM old_rows o';
+  ELSE
+    v_source := 'SELECT n.*, 1 AS sign FROM new_rows n UNION ALL SELECT o.*, -1 AS sign FROM old_rows o';
+  END IF;
+
+  EXECUTE format($sql$
+    INSERT INTO public.monthly_rollups AS r (user_id, month, category_id, transaction_type, is_paid, total, count)
+    SELECT
+      d.user_id,
+      date_trunc('month', COALESCE(d.paid_date, d.due_date)::timestamp)::date,
+      d.category_id,
+      d.transaction_type::text,
+      d.paid_date IS NOT NULL,
+      SUM(d.sign * d.amount),
+      SUM(d.sign)
+    FROM (%s) d
+    WHERE COALESCE(d.paid_date, d.due_date) IS NOT NULL
+    GROUP BY 1, 2, 3, 4, 5
+    ON CONFLICT ON CONSTRAINT monthly_rollups_key DO UPDATE
+      SET total = r.total + EXCLUDED.total,
+          count = r.count + EXCLUDED.count,
+          updated_at = now()
+  $sql$, v_source);
+
+  -- Remove as combinações que ficaram sem transações
+  EXECUTE format($sql$
+    DELETE FROM public.monthly_rollups
+    WHERE count = 0 AND user_id IN (SELECT DISTINCT d.user_id FROM (%s) d)
+  $sql$, v_source);
+
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS transactions_rollups_insert ON public.transactions;
+DROP TRIGGER IF EXISTS transactions_rollups_update ON public.transactions;
+DROP TRIGGER IF EXISTS transactions_rollups_delete ON public.transactions;
+
+CREATE TRIGGER transactions_rollups_insert
+  AFTER INSERT ON public.transactions
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION public.monthly_rollups_apply();
+
+CREATE TRIGGER transactions_rollups_update
+  AFTER UPDATE ON public.transactions
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION public.monthly_rollups_apply();
+
+CREATE TRIGGER transactions_rollups_delete
+  AFTER DELETE ON public.transactions
+  REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION public.monthly_rollups_apply();
+
+-- Recalcula os totais a partir de transactions (todos os usuários quando p_user_id é nulo)
+CREATE OR REPLACE FUNCTION public.rebuild_monthly_rollups(p_user_id uuid DEFAULT NULL)
+RETURNS bigint
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_rows bigint;
+BEGIN
+  DELETE FROM public.monthly_rollups WHERE p_user_id IS NULL OR user_id = p_user_id;
+
+  INSERT INTO public.monthly_rollups (user_id, month, category_id, transaction_type, is_paid, total, count)
+  SELECT
+    t.user_id,
+    date_trunc('month', COALESCE(t.paid_date, t.due_date)::timestamp)::date,
+    t.category_id,
+    t.transaction_type::text,
+    t.paid_date IS NOT NULL,
+    SUM(t.amount),
+    COUNT(*)
+  FROM public.transactions t
+  WHERE (p_user_id IS NULL OR t.user_id = p_user_id)
+    AND COALESCE(t.paid_date, t.due_date) IS NOT NULL
+  GROUP BY 1, 2, 3, 4, 5;
+
+  GET DIAGNOSTICS v_rows = ROW_COUNT;
+  RETURN v_rows;
+END;
+$$;
+
+-- Recálculo só com a chave service_role (SQL editor ou python rollups.py)
+REVOKE EXECUTE ON FUNCTION public.rebuild_monthly_rollups(uuid) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.rebuild_monthly_rollups(uuid) TO service_role;
+
+-- Totais por mês (e categoria) de um intervalo de meses, lidos dos rollups
+CREATE OR REPLACE FUNCTION public.rollup_totals(
+  p_user_id uuid,
+  p_first_month date,
+  p_last_month date,
+  p_is_paid boolean,
+  p_transaction_type text DEFAULT NULL
+)
+RETURNS TABLE (month date, category_name text, transaction_type text, total numeric, count bigint)
+LANGUAGE sql
+STABLE
+AS $$
+  SELECT r.month, c.name::text, r.transaction_type, SUM(r.total), SUM(r.count)::bigint
+  FROM public.monthly_rollups r
+  LEFT JOIN public.categories c ON c.id = r.category_id
+  WHERE r.user_id = p_user_id
+    AND r.is_paid = p_is_paid
+    AND r.month >= p_first_month
+    AND r.month <= p_last_month
+    AND (p_transaction_type IS NULL OR r.transaction_type = p_transaction_type)
+  GROUP BY r.month, c.name, r.transaction_type
+  ORDER BY r.month;
+$$;
+
+SELECT public.rebuild_monthly_rollups();
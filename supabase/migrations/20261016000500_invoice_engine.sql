@@ -0,0 +1,180 @@
+-- Faturas de cartão mantidas por incremento atômico (sem ler, somar e regravar)
+-- Cada compra no cartão soma amount / installments nas faturas dos meses seguintes,
+-- a partir do mês do due_date da transação (a última parcela leva o resto dos centavos)
+
+-- Uma fatura por cartão e mês: as duplicatas antigas somam o total na que fica
+-- (a paga, se houver) e são removidas
+UPDATE public.invoices i
+SET total_amount = d.total
+FROM (
+  SELECT
+    id,
+    row_number() OVER (PARTITION BY credit_card_id, month, year ORDER BY is_paid DESC, id) AS rn,
+    COUNT(*) OVER (PARTITION BY credit_card_id, month, year) AS copies,
+    SUM(COALESCE(total_amount, 0)) OVER (PARTITION BY credit_card_id, month, year) AS total
+  FROM public.invoices
+) d
+WHERE i.id = d.id AND d.rn = 1 AND d.copies > 1;
+
+DELETE FROM public.invoices i
+USING (
+  SELECT id, row_number() OVER (PARTITION BY credit_card_id, month, year ORDER BY is_paid DESC, id) AS rn
+  FROM public.invoices
+) d
+WHERE i.id = d.id AND d.rn > 1;
+
+ALTER TABLE public.invoices
+  DROP CONSTRAINT IF EXISTS invoices_card_month_year_key,
+  ADD CONSTRAINT invoices_card_month_year_key UNIQUE (credit_card_id, month, year);
+
+-- Soma valores (positivos ou negativos) nas faturas, criando as que faltarem
+--   p_deltas: [{"user_id", "credit_card_id", "month", "year", "amount"}]
+CREATE OR REPLACE FUNCTION public.apply_invoice_deltas(p_deltas jsonb)
+RETURNS TABLE (id uuid, credit_card_id uuid, month int, year int, total_amount numeric)
+LANGUAGE sql
+AS $$
+  INSERT INTO public.invoices AS inv (user_id, credit_card_id, month, year, total_amount, due_date, close_day, is_paid)
+  SELECT
+    d.user_id,
+    d.credit_card_id,
+    d.month,
+    d.year,
+    SUM(d.amount),
+    make_date(d.year, d.month, LEAST(c.due_day, EXTRACT(DAY FROM make_date(d.year, d.month, 1) + interval '1 month - 1 day')::int)),
+    c.close_day,
+    false
+  FROM jsonb_to_recordset(p_deltas) AS d(user_id uuid, credit_card_id uuid, month int, year int, amount numeric)
+  JOIN public.credit_cards c ON c.id = d.credit_card_id
+  GROUP BY d.user_id, d.credit_card_id, d.month, d.year, c.due_day, c.close_day
+  HAVING SUM(d.amount) <> 0
+  ON CONFLICT ON CONSTRAINT invoices_card_month_year_key DO UPDATE
+    SET total_amount = COALESCE(inv.total_amount, 0) + EXCLUDED.total_amount
+  RETURNING inv.id, inv.credit_card_id, inv.month, inv.year, inv.total_amount;
+$$;
+
+-- Parcelas das compras no cartão de um conjunto de transações, como deltas de fatura
+--   p_source: consulta com as colunas de transactions e uma coluna sign (1 soma, -1 subtrai)
+CREATE OR REPLACE FUNCTION public.invoice_deltas_sql(p_source text)
+RETURNS text
+LANGUAGE sql
+IMMUTABLE
+AS $$
+  SELECT format($sql$
+    SELECT COALESCE(jsonb_agg(jsonb_build_object(
+      'user_id', p.user_id,
+      'credit_card_id', p.credit_card_id,
+      'month', EXTRACT(MONTH FROM p.bill_month)::int,
+      'year', EXTRACT(YEAR FROM p.bill_month)::int,
+      'amount', p.amount
+    )), '[]'::jsonb)
+    FROM (
+      SELECT
+        d.user_id,
+        d.credit_card_id,
+        date_trunc('month', d.due_date::timestamp) + make_interval(months => k.k) AS bill_month,
+        d.sign * CASE
+          WHEN k.k = n.n - 1 THEN d.amount::numeric - round(d.amount::numeric / n.n, 2) * (n.n - 1)
+          ELSE round(d.amount::numeric / n.n, 2)
+        END AS amount
+      FROM (%s) d
+      CROSS JOIN LATERAL (SELECT GREATEST(COALESCE(d.installments, 1), 1) AS n) n
+      CROSS JOIN LATERAL generate_series(0, n.n - 1) AS k(k)
+      WHERE d.credit_card_id IS NOT NULL
+        AND d.payment_method = 'cartao_credito'
+        AND d.transaction_type = 'expense'
+        AND d.due_date IS NOT NULL
+    ) p
+  $sql$, p_source);
+$$;
+
+-- Aplica nas faturas as compras inseridas, editadas ou removidas (um upsert por comando)
+-- SECURITY DEFINER: chama apply_invoice_deltas com os direitos do dono, qualquer que seja o papel que escreveu a transação
+CREATE OR REPLACE FUNCTION public.invoice_totals_apply()
+RETURNS trigger
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+  v_source text;
+  v_deltas jsonb;
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    v_source := 'SELECT n.*, 1 AS sign FROM new_rows n';
+  ELSIF TG_OP = 'DELETE' THEN
+    v_source := 'SELECT o.*, -1 AS sign FROM old_rows o';
+  ELSE
+    v_source := 'SELECT n.*, 1 AS sign FROM new_rows n UNION ALL SELECT o.*, -1 AS sign FROM old_rows o';
+  END IF;
+
+  EXECUTE public.invoice_deltas_sql(v_source) INTO v_deltas;
+  IF jsonb_array_length(v_deltas) > 0 THEN
+    PERFORM public.apply_invoice_deltas(v_deltas);
+  END IF;
+
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS transactions_invoices_insert ON public.transactions;
+DROP TRIGGER IF EXISTS transactions_invoices_update ON public.transactions;
+DROP TRIGGER IF EXISTS transactions_invoices_delete ON public.transactions;
+
+CREATE TRIGGER transactions_invoices_insert
+  AFTER INSERT ON public.transactions
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION public.invoice_totals_apply();
+
+CREATE TRIGGER transactions_invoices_update
+  AFTER UPDATE ON public.transactions
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION public.invoice_totals_apply();
+
+CREATE TRIGGER transactions_invoices_delete
+  AFTER DELETE ON public.transactions
+  REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION public.invoice_totals_apply();
+
+-- Recalcula os totais das faturas em aberto a partir das transações (todos os usuários quando p_user_id é nulo)
+-- Faturas pagas são histórico: mantêm o total e não recebem parcelas
+CREATE OR REPLACE FUNCTION public.rebuild_invoice_totals(p_user_id uuid DEFAULT NULL, p_credit_card_id uuid DEFAULT NULL)
+RETURNS bigint
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_deltas jsonb;
+BEGIN
+  UPDATE public.invoices
+  SET total_amount = 0
+  WHERE NOT is_paid
+    AND (p_user_id IS NULL OR user_id = p_user_id)
+    AND (p_credit_card_id IS NULL OR credit_card_id = p_credit_card_id);
+
+  EXECUTE public.invoice_deltas_sql(format(
+    'SELECT t.*, 1 AS sign FROM public.transactions t WHERE (%L::uuid IS NULL OR t.user_id = %L::uuid) AND (%L::uuid IS NULL OR t.credit_card_id = %L::uuid)',
+    p_user_id, p_user_id, p_credit_card_id, p_credit_card_id
+  )) INTO v_deltas;
+
+  SELECT COALESCE(jsonb_agg(d.delta), '[]'::jsonb)
+  INTO v_deltas
+  FROM jsonb_array_elements(v_deltas) AS d(delta)
+  WHERE NOT EXISTS (
+    SELECT 1 FROM public.invoices i
+    WHERE i.is_paid
+      AND i.credit_card_id = (d.delta->>'credit_card_id')::uuid
+      AND i.month = (d.delta->>'month')::int
+      AND i.year = (d.delta->>'year')::int
+  );
+
+  PERFORM public.apply_invoice_deltas(v_deltas);
+  RETURN jsonb_array_length(v_deltas);
+END;
+$$;
+
+-- Ajustes avulsos e recálculo só com a chave service_role (SQL editor ou python invoice_engine.py)
+REVOKE EXECUTE ON FUNCTION public.apply_invoice_deltas(jsonb) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION public.rebuild_invoice_totals(uuid, uuid) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.apply_invoice_deltas(jsonb) TO service_role;
+GRANT EXECUTE ON FUNCTION public.rebuild_invoice_totals(uuid, uuid) TO service_role;
+
+SELECT public.rebuild_invoice_totals();
@@ -0,0 +1,41 @@
+-- Compras parceladas no cartão gravadas como uma transação por parcela
+-- (installment_number = número da parcela, installments = total de parcelas).
+-- Linhas antigas, sem installment_number, continuam representando a compra inteira
+-- e são distribuídas nas faturas como antes
+ALTER TABLE public.transactions
+  ADD COLUMN IF NOT EXISTS installment_number smallint;
+
+CREATE OR REPLACE FUNCTION public.invoice_deltas_sql(p_source text)
+RETURNS text
+LANGUAGE sql
+IMMUTABLE
+AS $$
+  SELECT format($sql$
+    SELECT COALESCE(jsonb_agg(jsonb_build_object(
+      'user_id', p.user_id,
+      'credit_card_id', p.credit_card_id,
+      'month', EXTRACT(MONTH FROM p.bill_month)::int,
+      'year', EXTRACT(YEAR FROM p.bill_month)::int,
+      'amount', p.amount
+    )), '[]'::jsonb)
+    FROM (
+      SELECT
+        d.user_id,
+        d.credit_card_id,
+        date_trunc('month', d.due_date::timestamp) + make_interval(months => k.k) AS bill_month,
+        d.sign * CASE
+          WHEN k.k = n.n - 1 THEN d.amount::numeric - round(d.amount::numeric / n.n, 2) * (n.n - 1)
+          ELSE round(d.amount::numeric / n.n, 2)
+        END AS amount
+      FROM (%s) d
+      CROSS JOIN LATERAL (
+        SELECT CASE WHEN d.installment_number IS NOT NULL THEN 1 ELSE GREATEST(COALESCE(d.installments, 1), 1) END AS n
+      ) n
+      CROSS JOIN LATERAL generate_series(0, n.n - 1) AS k(k)
+      WHERE d.credit_card_id IS NOT NULL
+        AND d.payment_method = 'cartao_credito'
+        AND d.transaction_type = 'expense'
+        AND d.due_date IS NOT NULL
+    ) p
+  $sql$, p_source);
+$$;
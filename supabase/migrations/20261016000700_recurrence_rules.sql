@@ -0,0 +1,31 @@
+-- Regras de recorrência (despesas e receitas mensais)
+-- As ocorrências são gravadas em transactions aos poucos, alguns meses à frente,
+-- pelo recurrence_scheduler; meses além disso são expandidos sem gravar linhas
+CREATE TABLE IF NOT EXISTS public.recurrence_rules (
+  id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+  user_id uuid NOT NULL,
+  transaction_type text NOT NULL,
+  amount numeric NOT NULL,
+  description text NOT NULL,
+  category_id uuid,
+  payment_method text,
+  credit_card_id uuid,
+  due_day smallint NOT NULL CHECK (due_day BETWEEN 1 AND 31),
+  start_month date NOT NULL,
+  end_month date,             -- último mês da recorrência (NULL = sem fim)
+  materialized_through date,  -- último mês já gravado em transactions
+  is_active boolean NOT NULL DEFAULT true,
+  created_at timestamptz NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_recurrence_rules_pending
+  ON public.recurrence_rules (materialized_through) WHERE is_active;
+CREATE INDEX IF NOT EXISTS idx_recurrence_rules_user
+  ON public.recurrence_rules (user_id) WHERE is_active;
+
+-- Cada ocorrência aponta para a regra; o índice único torna a materialização idempotente
+ALTER TABLE public.transactions
+  ADD COLUMN IF NOT EXISTS recurrence_rule_id uuid REFERENCES public.recurrence_rules(id) ON DELETE SET NULL;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_transactions_rule_due_date
+  ON public.transactions (recurrence_rule_id, due_date);
@@ -0,0 +1,34 @@
+-- Gasto por categoria num período, para avaliar todos os orçamentos numa consulta
+-- A despesa conta na data em que foi paga ou, se pendente, no vencimento
+-- (mesma regra de monthly_rollups). Períodos de meses inteiros são lidos dos rollups
+CREATE OR REPLACE FUNCTION public.budget_spend(p_user_id uuid, p_start date, p_end date)
+RETURNS TABLE (category_id uuid, total numeric, count bigint)
+LANGUAGE sql
+STABLE
+AS $$
+  WITH period AS (
+    SELECT p_start = date_trunc('month', p_start)::date
+       AND p_end = (date_trunc('month', p_end) + interval '1 month - 1 day')::date AS whole_months
+  )
+  SELECT r.category_id, SUM(r.total), SUM(r.count)::bigint
+  FROM public.monthly_rollups r, period
+  WHERE period.whole_months
+    AND r.user_id = p_user_id
+    AND r.transaction_type = 'expense'
+    AND r.month >= p_start
+    AND r.month <= p_end
+  GROUP BY r.category_id
+  UNION ALL
+  SELECT t.category_id, SUM(t.amount), COUNT(*)
+  FROM public.transactions t, period
+  WHERE NOT period.whole_months
+    AND t.user_id = p_user_id
+    AND t.transaction_type = 'expense'
+    AND COALESCE(t.paid_date, t.due_date) >= p_start
+    AND COALESCE(t.paid_date, t.due_date) <= p_end
+  GROUP BY t.category_id;
+$$;
+
+CREATE INDEX IF NOT EXISTS idx_transactions_user_effective_date
+  ON public.transactions (user_id, (COALESCE(paid_date, due_date)))
+  WHERE transaction_type = 'expense';
@@ -0,0 +1,8 @@
+"""
+Configuração comum dos testes: os módulos do projeto ficam na raiz do repositório
+Para executar: python -m pytest tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,124 @@
+"""
+Banco Postgres descartável com as migrações de supabase/migrations aplicadas
+
+Criado em TEST_DATABASE_URL (um Postgres 15+ onde o usuário pode criar bancos);
+os testes que o usam são pulados quando a variável não está definida
+"""
+import os
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from urllib.parse import urlsplit, urlunsplit
+
+import psycopg2
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+MIGRATIONS = sorted((Path(__file__).resolve().parent.parent / "supabase" / "migrations").glob("*.sql"))
+
+# Papéis e tabelas que as migrações pressupõem (criados pelo Supabase fora deste repositório)
+BASE_SCHEMA = """
+DO $$
+BEGIN
+  IF NOT EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'anon') THEN CREATE ROLE anon NOLOGIN; END IF;
+  IF NOT EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'authenticated') THEN CREATE ROLE authenticated NOLOGIN; END IF;
+  IF NOT EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'service_role') THEN CREATE ROLE service_role NOLOGIN BYPASSRLS; END IF;
+END
+$$;
+ALTER DEFAULT PRIVILEGES IN SCHEMA public GRANT ALL ON TABLES TO anon, authenticated, service_role;
+CREATE TABLE public.categories (
+  id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+  user_id uuid,
+  name text NOT NULL,
+  category_type text
+);
+CREATE TABLE public.credit_cards (
+  id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+  user_id uuid NOT NULL,
+  name text,
+  close_day smallint NOT NULL,
+  due_day smallint NOT NULL
+);
+CREATE TABLE public.invoices (
+  id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+  user_id uuid NOT NULL,
+  credit_card_id uuid NOT NULL,
+  month smallint NOT NULL,
+  year smallint NOT NULL,
+  total_amount numeric DEFAULT 0,
+  due_date date,
+  close_day smallint,
+  is_paid boolean NOT NULL DEFAULT false
+);
+CREATE TABLE public.transactions (
+  id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+  user_id uuid NOT NULL,
+  amount numeric NOT NULL,
+  description text,
+  transaction_type text NOT NULL,
+  category_id uuid REFERENCES public.categories(id),
+  payment_method text,
+  credit_card_id uuid,
+  installments smallint,
+  is_recurring boolean DEFAULT false,
+  due_date date,
+  paid_date date,
+  created_at timestamptz NOT NULL DEFAULT now()
+);
+"""
+
+
+def _database_url(name: str) -> str:
+    parts = urlsplit(TEST_DATABASE_URL)
+    return urlunsplit(parts._replace(path=f"/{name}"))
+
+
+@contextmanager
+def migrated_database(prefix: str, seed=None, seed_before: str = None):
+    """
+    Cria um banco com BASE_SCHEMA e as migrações aplicadas e o remove no fim
+
+    Args:
+        prefix: Prefixo do nome do banco
+        seed: Função chamada com o cursor para popular o banco
+        seed_before: Migração (nome do arquivo) antes da qual seed roda, para
+                     simular dados antigos; None roda seed depois de todas
+
+    Yields:
+        Conexão psycopg2 em autocommit
+    """
+    name = f"{prefix}_{uuid.uuid4().hex[:12]}"
+    admin = psycopg2.connect(TEST_DATABASE_URL)
+    admin.autocommit = True
+    with admin.cursor() as cursor:
+        cursor.execute(f'CREATE DATABASE "{name}"')
+
+    connection = psycopg2.connect(_database_url(name))
+    try:
+        with connection, connection.cursor() as cursor:
+            cursor.execute(BASE_SCHEMA)
+            for migration in MIGRATIONS:
+                if seed and migration.name == seed_before:
+                    seed(cursor)
+                cursor.execute(migration.read_text(encoding="utf-8"))
+            if seed and seed_before is None:
+                seed(cursor)
+        connection.autocommit = True
+        yield connection
+    finally:
+        connection.close()
+        with admin.cursor() as cursor:
+            cursor.execute(f'DROP DATABASE IF EXISTS "{name}"')
+        admin.close()
+
+
+def as_role(connection, role: str, sql: str, params=None):
+    """Executa como o papel (ex: anon, o da chave usada pela API) e desfaz tudo no fim"""
+    with connection.cursor() as cursor:
+        cursor.execute("BEGIN")
+        try:
+            cursor.execute(f"SET LOCAL ROLE {role}")
+            cursor.execute(sql, params)
+            return cursor.fetchall() if cursor.description else None
+        finally:
+            cursor.execute("ROLLBACK")
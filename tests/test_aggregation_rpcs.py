@@ -0,0 +1,262 @@
+"""
+As agregações no banco (RPCs transaction_totals/category_totals e rollups mensais)
+devolvem o mesmo que o caminho de fallback em Python
+
+Aplica supabase/migrations num banco descartável criado em TEST_DATABASE_URL (um
+Postgres 15+ onde o usuário pode criar bancos) e chama calculate_user_balance e
+get_category_analysis com o RPC disponível e indisponível
+"""
+import random
+import re
+import uuid
+from datetime import date, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+
+import pytest
+
+psycopg2 = pytest.importorskip("psycopg2")
+import psycopg2.extras
+
+from migration_db import TEST_DATABASE_URL, as_role, migrated_database
+
+if not TEST_DATABASE_URL:
+    pytest.skip("TEST_DATABASE_URL não definida", allow_module_level=True)
+
+# supabase.client: a pasta supabase/ (migrações) do repositório também é importável como "supabase"
+pytest.importorskip("supabase.client")
+import functions_database
+import recurrence_scheduler
+import rollups
+
+USER_ID = str(uuid.uuid4())
+OTHER_USER_ID = str(uuid.uuid4())
+
+# Chave estrangeira de cada tabela embutida no select (ex: "categories(name)")
+EMBEDDED_KEYS = {"categories": "category_id"}
+
+PERIODS = [
+    ("2026-01-01", "2026-03-31"),   # meses inteiros (rollups)
+    ("2026-02-01", "2026-02-28"),
+    ("2026-01-10", "2026-03-20"),   # corta meses (RPC)
+    ("2025-12-31", "2026-01-01"),
+    ("2026-05-01", "2026-05-31"),   # sem movimento
+]
+
+
+def _jsonable(value):
+    # Mesmos tipos que o PostgREST devolve no JSON
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+class _Response(SimpleNamespace):
+    def execute(self):
+        return self
+
+
+class _TableQuery:
+    """Subconjunto do query builder do PostgREST usado pelos fallbacks"""
+
+    def __init__(self, client, table: str):
+        self.client = client
+        self.table = table
+        self.columns = []
+        self.filters = []
+        self.params = []
+        self._negate = False
+
+    def select(self, columns: str):
+        self.columns = [column for column in re.sub(r"\s+", "", columns).split(",") if column]
+        return self
+
+    @property
+    def not_(self):
+        self._negate = True
+        return self
+
+    def _filter(self, sql: str, *params):
+        self.filters.append(f"NOT ({sql})" if self._negate else sql)
+        self.params.extend(params)
+        self._negate = False
+        return self
+
+    def eq(self, column, value):
+        return self._filter(f"t.{column} = %s", value)
+
+    def gte(self, column, value):
+        return self._filter(f"t.{column} >= %s", value)
+
+    def lte(self, column, value):
+        return self._filter(f"t.{column} <= %s", value)
+
+    def is_(self, column, value):
+        assert value == "null"
+        return self._filter(f"t.{column} IS NULL")
+
+    def execute(self):
+        select, joins, embeds = [], [], []
+        for column in self.columns:
+            embed = re.fullmatch(r"(\w+)\((\w+)\)", column)
+            if embed:
+                table, field = embed.groups()
+                joins.append(f"LEFT JOIN public.{table} {table} ON {table}.id = t.{EMBEDDED_KEYS[table]}")
+                select.append(f"{table}.{field} AS \"{table}.{field}\"")
+                embeds.append((table, field))
+            else:
+                select.append(f"t.{column}")
+
+        sql = f"SELECT {', '.join(select)} FROM public.{self.table} t {' '.join(joins)}"
+        if self.filters:
+            sql += " WHERE " + " AND ".join(self.filters)
+
+        rows = []
+        for row in self.client.fetch(sql, self.params):
+            item = {key: _jsonable(value) for key, value in row.items() if "." not in key}
+            for table, field in embeds:
+                value = row[f"{table}.{field}"]
+                item[table] = {field: value} if value is not None else None
+            rows.append(item)
+        return _Response(data=rows)
+
+
+class PostgresClient:
+    """Cliente com a interface do supabase-py (table/rpc) sobre uma conexão psycopg2"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.rpc_available = True
+
+    def fetch(self, sql: str, params=None) -> list:
+        with self.connection.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def table(self, name: str) -> _TableQuery:
+        return _TableQuery(self, name)
+
+    def rpc(self, name: str, params: dict) -> _Response:
+        if not self.rpc_available:
+            raise RuntimeError(f"function public.{name} does not exist")
+        arguments = ", ".join(f"{key} => %({key})s" for key in params)
+        rows = self.fetch(f"SELECT * FROM public.{name}({arguments})", params)
+        return _Response(data=[{key: _jsonable(value) for key, value in row.items()} for row in rows])
+
+
+def _seed(cursor):
+    rng = random.Random(20261016)
+    categories = []
+    for name in ["Alimentação", "Transporte", "Moradia", "Lazer", "Salário"]:
+        cursor.execute("INSERT INTO public.categories (user_id, name) VALUES (%s, %s) RETURNING id", (USER_ID, name))
+        categories.append(cursor.fetchone()[0])
+    categories.append(None)
+
+    rows = []
+    for user_id in (USER_ID, OTHER_USER_ID):
+        for _ in range(400):
+            due_date = date(2025, 11, 1) + timedelta(days=rng.randrange(200))
+            paid_date = due_date + timedelta(days=rng.randint(-3, 3)) if rng.random() < 0.7 else None
+            rows.append((
+                user_id,
+                Decimal(rng.randint(1, 500_000)) / 100,
+                rng.choice(["income", "expense", "expense", "expense"]),
+                rng.choice(categories),
+                due_date,
+                paid_date
+            ))
+    # Um único INSERT: os triggers de rollup agregam por comando
+    psycopg2.extras.execute_values(
+        cursor,
+        "INSERT INTO public.transactions (user_id, amount, transaction_type, category_id, due_date, paid_date) VALUES %s",
+        rows
+    )
+
+
+@pytest.fixture(scope="module")
+def database():
+    with migrated_database("aggregation_test", seed=_seed) as connection:
+        yield connection
+
+
+@pytest.fixture
+def client(database, monkeypatch):
+    client = PostgresClient(database)
+    monkeypatch.setattr(functions_database, "supabase", client)
+    monkeypatch.setattr(rollups, "supabase", client)
+    monkeypatch.setattr(recurrence_scheduler, "supabase", client)
+    return client
+
+
+def _both_paths(client, function, *args):
+    client.rpc_available = True
+    aggregated = function(*args)
+    client.rpc_available = False
+    fallback = function(*args)
+    return aggregated, fallback
+
+
+@pytest.mark.parametrize("start_date, end_date", PERIODS)
+def test_balance_matches_fallback(client, start_date, end_date):
+    aggregated, fallback = _both_paths(client, functions_database.calculate_user_balance, USER_ID, start_date, end_date)
+
+    for field in ("total_income", "total_expenses", "balance"):
+        assert aggregated[field] == pytest.approx(fallback[field], abs=0.005), field
+    for field in ("income_count", "expense_count", "period"):
+        assert aggregated[field] == fallback[field], field
+
+
+@pytest.mark.parametrize("start_date, end_date", PERIODS)
+def test_category_analysis_matches_fallback(client, start_date, end_date):
+    aggregated, fallback = _both_paths(client, functions_database.get_category_analysis, USER_ID, start_date, end_date)
+
+    by_category = {row["category"]: row for row in fallback}
+    assert {row["category"] for row in aggregated} == set(by_category)
+    for row in aggregated:
+        expected = by_category[row["category"]]
+        assert row["total"] == pytest.approx(expected["total"], abs=0.005), row["category"]
+        assert row["count"] == expected["count"], row["category"]
+        assert row["percentage"] == pytest.approx(expected["percentage"], abs=0.1), row["category"]
+    assert [row["total"] for row in aggregated] == sorted((row["total"] for row in aggregated), reverse=True)
+
+
+@pytest.mark.parametrize("date_field, is_paid", [("paid_date", True), ("due_date", False), ("due_date", None)])
+def test_transaction_totals_match_direct_sum(client, date_field, is_paid):
+    start_date, end_date = "2026-01-10", "2026-03-20"
+    totals = functions_database.get_transaction_totals(USER_ID, start_date, end_date, date_field, is_paid)
+
+    rows = client.table("transactions").select("transaction_type, amount, paid_date").eq("user_id", USER_ID) \
+        .gte(date_field, start_date).lte(date_field, end_date)
+    if is_paid is not None:
+        rows = rows.is_("paid_date", "null") if not is_paid else rows.not_.is_("paid_date", "null")
+    expected = {"income": [0.0, 0], "expense": [0.0, 0]}
+    for row in rows.execute().data:
+        expected[row["transaction_type"]][0] += row["amount"]
+        expected[row["transaction_type"]][1] += 1
+
+    for transaction_type, (total, count) in expected.items():
+        assert totals[transaction_type]["total"] == pytest.approx(total, abs=0.005)
+        assert totals[transaction_type]["count"] == count
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT public.rebuild_monthly_rollups()",
+    "DELETE FROM public.monthly_rollups",
+    "TRUNCATE public.monthly_rollups",
+])
+def test_anon_cannot_rewrite_rollups(database, sql):
+    with pytest.raises(psycopg2.errors.InsufficientPrivilege):
+        as_role(database, "anon", sql)
+
+
+def test_anon_transaction_write_still_updates_rollups(database):
+    user_id = str(uuid.uuid4())
+    rows = as_role(database, "anon", """
+        INSERT INTO public.transactions (user_id, amount, transaction_type, paid_date)
+        VALUES (%(user_id)s, 12.34, 'expense', '2026-02-10');
+        SELECT total, count FROM public.monthly_rollups WHERE user_id = %(user_id)s
+    """, {"user_id": user_id})
+
+    assert rows == [(Decimal("12.34"), 1)]
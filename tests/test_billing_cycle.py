@@ -0,0 +1,95 @@
+"""
+Propriedades do billing_cycle: o agendamento em lote coincide com a regra escalar
+de calculate_credit_card_due_date e split_amount preserva o valor em centavos
+"""
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+
+import pytest
+
+from billing_cycle import TABLE_FIRST_YEAR, schedule_installments, schedule_purchase, split_amount
+
+# supabase.client: a pasta supabase/ (migrações) do repositório também é importável como "supabase"
+pytest.importorskip("supabase.client")
+from functions_database import calculate_credit_card_due_date
+
+SEED = 20261016
+CASES = 5000
+
+
+def _random_purchase(rng: random.Random) -> tuple:
+    purchase = date(TABLE_FIRST_YEAR + 1, 1, 1) + timedelta(days=rng.randrange(365 * 150))
+    return purchase, rng.randint(1, 31), rng.randint(1, 31), rng.randint(1, 24)
+
+
+def _add_months(day: date, months: int) -> date:
+    year, month = divmod(day.year * 12 + day.month - 1 + months, 12)
+    return date(year, month + 1, 1)
+
+
+def _reference_schedule(purchase: date, close_day: int, due_day: int, installments: int) -> list:
+    """Parcela k pela regra escalar: a compra no dia 1 do k-ésimo mês após a primeira fatura"""
+    first_due, first_close = calculate_credit_card_due_date(purchase, close_day, due_day)
+    schedule = [(first_close, first_due)]
+    for number in range(1, installments):
+        due_date, close_date = calculate_credit_card_due_date(_add_months(first_close, number), close_day, due_day)
+        schedule.append((close_date, due_date))
+    return schedule
+
+
+def test_schedule_purchase_matches_scalar_rule():
+    rng = random.Random(SEED)
+    for _ in range(CASES):
+        purchase, close_day, due_day, installments = _random_purchase(rng)
+        schedule = schedule_purchase(purchase, close_day, due_day, installments)
+
+        expected = _reference_schedule(purchase, close_day, due_day, installments)
+        assert [(item["close_date"], item["due_date"]) for item in schedule] == expected, (purchase, close_day, due_day)
+        assert [item["installment"] for item in schedule] == list(range(1, installments + 1))
+        assert all((item["bill_year"], item["bill_month"]) == (item["close_date"].year, item["close_date"].month)
+                   for item in schedule)
+
+
+def test_schedule_installments_batch_matches_single_purchases():
+    rng = random.Random(SEED + 1)
+    purchases = [_random_purchase(rng) for _ in range(CASES)]
+
+    batch = schedule_installments(*(list(column) for column in zip(*purchases)))
+
+    assert batch == [schedule_purchase(*purchase) for purchase in purchases]
+
+
+@pytest.mark.parametrize("purchase, close_day, expected_month", [
+    (date(2026, 1, 31), 30, (2026, 2)),
+    (date(2026, 2, 28), 31, (2026, 2)),
+    (date(2026, 12, 15), 10, (2027, 1)),
+    (date(2024, 2, 29), 29, (2024, 2)),
+])
+def test_month_edges(purchase, close_day, expected_month):
+    first = schedule_purchase(purchase, close_day, 31)[0]
+    due_date, close_date = calculate_credit_card_due_date(purchase, close_day, 31)
+
+    assert (first["bill_year"], first["bill_month"]) == expected_month
+    assert (first["close_date"], first["due_date"]) == (close_date, due_date)
+
+
+def test_schedule_rejects_mismatched_lengths():
+    with pytest.raises(ValueError):
+        schedule_installments([date(2026, 1, 1)], [5], [10, 15])
+
+
+def test_split_amount_preserves_total():
+    rng = random.Random(SEED + 2)
+    for _ in range(CASES):
+        amount = Decimal(rng.randint(1, 10_000_000)) / 100
+        installments = rng.randint(1, 48)
+
+        parts = [Decimal(str(part)) for part in split_amount(float(amount), installments)]
+
+        assert len(parts) == installments
+        assert sum(parts) == amount, (amount, installments)
+        assert all(part == part.quantize(Decimal("0.01")) for part in parts)
+        # Só a última parcela absorve o arredondamento
+        assert len(set(parts[:-1])) <= 1
+        assert abs(parts[-1] - parts[0]) * 100 < installments
@@ -0,0 +1,58 @@
+"""
+APPEND_HISTORY_SCRIPT num Redis real (TEST_REDIS_URL): um lote sem mensagens
+válidas ainda corta a lista e renova o TTL do histórico
+"""
+import os
+import uuid
+
+import pytest
+
+redis = pytest.importorskip("redis")
+
+TEST_REDIS_URL = os.getenv("TEST_REDIS_URL")
+if not TEST_REDIS_URL:
+    pytest.skip("TEST_REDIS_URL não definida", allow_module_level=True)
+
+pytest.importorskip("pydantic_ai")
+from chat_redis import APPEND_HISTORY_SCRIPT, CHAT_HISTORY_MAX_MESSAGES, CHAT_HISTORY_TTL, _append_history_args
+
+
+@pytest.fixture
+def client():
+    client = redis.Redis.from_url(TEST_REDIS_URL, decode_responses=True)
+    prefix = f"test:{uuid.uuid4().hex}"
+    yield client, f"{prefix}:chat", f"{prefix}:seq"
+    client.delete(f"{prefix}:chat", f"{prefix}:seq")
+    client.close()
+
+
+def test_append_advances_sequence(client):
+    redis_client, chat_key, seq_key = client
+    append = redis_client.register_script(APPEND_HISTORY_SCRIPT)
+
+    assert append(keys=[chat_key, seq_key], args=_append_history_args(["a", "b"])) == 2
+    seq = int(redis_client.get(seq_key))
+    assert append(keys=[chat_key, seq_key], args=_append_history_args(["c"])) == 3
+
+    assert int(redis_client.get(seq_key)) == seq + 1
+    assert redis_client.lrange(chat_key, 0, -1) == ["c", "b", "a"]
+
+
+def test_empty_batch_still_trims_and_refreshes_ttl(client):
+    redis_client, chat_key, seq_key = client
+    append = redis_client.register_script(APPEND_HISTORY_SCRIPT)
+    append(keys=[chat_key, seq_key], args=_append_history_args(["a"]))
+    seq = redis_client.get(seq_key)
+
+    # Lista acima do limite e perto de expirar
+    redis_client.rpush(chat_key, *[f"old-{i}" for i in range(CHAT_HISTORY_MAX_MESSAGES)])
+    redis_client.expire(chat_key, 5)
+    redis_client.expire(seq_key, 5)
+
+    assert append(keys=[chat_key, seq_key], args=_append_history_args([])) == CHAT_HISTORY_MAX_MESSAGES
+
+    assert redis_client.llen(chat_key) == CHAT_HISTORY_MAX_MESSAGES
+    assert redis_client.lindex(chat_key, 0) == "a"
+    assert redis_client.ttl(chat_key) > CHAT_HISTORY_TTL - 60
+    assert redis_client.ttl(seq_key) > CHAT_HISTORY_TTL - 60
+    assert redis_client.get(seq_key) == seq
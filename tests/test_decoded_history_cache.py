@@ -0,0 +1,70 @@
+"""
+DecodedHistoryCache.apply com leituras concorrentes: o resultado do script é
+combinado com o cache de acordo com o cached_seq enviado a ele
+"""
+import json
+
+import pytest
+
+pytest.importorskip("redis")
+messages_module = pytest.importorskip("pydantic_ai.messages")
+
+from chat_redis import DecodedHistoryCache
+
+
+def _raw(text: str) -> str:
+    message = messages_module.ModelRequest(parts=[messages_module.UserPromptPart(content=text)])
+    data = messages_module.ModelMessagesTypeAdapter.dump_python([message], mode="json")[0]
+    return json.dumps({"timestamp": "2026-10-16T00:00:00", "data": data})
+
+
+def _texts(messages) -> list:
+    return [message.parts[0].content for message in messages]
+
+
+def _redis_list(*texts) -> list:
+    # O script devolve da mais recente para a mais antiga
+    return [_raw(text) for text in reversed(texts)]
+
+
+def test_partial_read_extends_cached_entry():
+    cache = DecodedHistoryCache()
+    assert _texts(cache.apply("u", 10, 0, 2, _redis_list("a", "b"))) == ["a", "b"]
+
+    result = cache.apply("u", 10, 2, 3, _redis_list("c"))
+
+    assert _texts(result) == ["a", "b", "c"]
+    assert cache.cached_seq("u", 10) == 3
+
+
+def test_partial_read_is_dropped_when_entry_changed_meanwhile():
+    cache = DecodedHistoryCache()
+    cache.apply("u", 10, 0, 2, _redis_list("a", "b"))
+    sent = cache.cached_seq("u", 10)
+
+    # Outra leitura grava uma sequência mais nova enquanto o script rodava
+    cache.apply("u", 10, sent, 3, _redis_list("c"))
+
+    assert cache.apply("u", 10, sent, 3, _redis_list("c")) is None
+    assert _texts(cache.apply("u", 10, 3, 3, [])) == ["a", "b", "c"]
+
+
+def test_full_read_does_not_merge_with_entry_stored_meanwhile():
+    cache = DecodedHistoryCache()
+    # A leitura começou sem cache (cached_seq=0), mas outra gravou a entrada antes do apply
+    cache.apply("u", 10, 0, 2, _redis_list("a", "b"))
+
+    result = cache.apply("u", 10, 0, 2, _redis_list("a", "b"))
+
+    assert _texts(result) == ["a", "b"]
+    assert _texts(cache.apply("u", 10, 2, 2, [])) == ["a", "b"]
+
+
+def test_older_full_read_does_not_replace_newer_entry():
+    cache = DecodedHistoryCache()
+    cache.apply("u", 10, 0, 3, _redis_list("a", "b", "c"))
+
+    result = cache.apply("u", 10, 0, 2, _redis_list("a", "b"))
+
+    assert _texts(result) == ["a", "b"]
+    assert cache.cached_seq("u", 10) == 3
@@ -0,0 +1,109 @@
+"""
+A migração do motor de faturas (20261016000500_invoice_engine.sql) sobre dados antigos:
+duplicatas somadas antes de removidas, faturas pagas intocadas e as em aberto
+recalculadas a partir das compras; os RPCs de fatura ficam restritos à chave service_role
+"""
+import uuid
+from decimal import Decimal
+
+import pytest
+
+psycopg2 = pytest.importorskip("psycopg2")
+import psycopg2.errors
+
+from migration_db import TEST_DATABASE_URL, as_role, migrated_database
+
+if not TEST_DATABASE_URL:
+    pytest.skip("TEST_DATABASE_URL não definida", allow_module_level=True)
+
+USER_ID = str(uuid.uuid4())
+CARD_ID = str(uuid.uuid4())
+
+# (mês, ano, total, paga) das faturas gravadas pelo código antigo
+LEGACY_INVOICES = [
+    (12, 2025, 75, True),     # paga com total diferente das compras: é histórico
+    (1, 2026, 200, True),     # duplicata criada pela corrida do ler-somar-gravar
+    (1, 2026, 100, False),
+    (2, 2026, 999, False),    # em aberto com total desatualizado
+]
+
+# (valor, parcelas, due_date)
+LEGACY_PURCHASES = [
+    (80, 1, "2025-12-10"),
+    (300, 3, "2026-01-10"),   # jan (paga), fev e mar
+    (50, 1, "2026-02-15"),
+]
+
+
+def _seed(cursor):
+    cursor.execute(
+        "INSERT INTO public.credit_cards (id, user_id, name, close_day, due_day) VALUES (%s, %s, 'Nubank', 3, 10)",
+        (CARD_ID, USER_ID)
+    )
+    for month, year, total, is_paid in LEGACY_INVOICES:
+        cursor.execute(
+            "INSERT INTO public.invoices (user_id, credit_card_id, month, year, total_amount, is_paid) VALUES (%s, %s, %s, %s, %s, %s)",
+            (USER_ID, CARD_ID, month, year, total, is_paid)
+        )
+    for amount, installments, due_date in LEGACY_PURCHASES:
+        cursor.execute(
+            """
+            INSERT INTO public.transactions (user_id, amount, transaction_type, payment_method, credit_card_id, installments, due_date)
+            VALUES (%s, %s, 'expense', 'cartao_credito', %s, %s, %s)
+            """,
+            (USER_ID, amount, CARD_ID, installments, due_date)
+        )
+
+
+@pytest.fixture(scope="module")
+def database():
+    with migrated_database("invoice_engine_test", seed=_seed, seed_before="20261016000500_invoice_engine.sql") as connection:
+        yield connection
+
+
+def _invoices(connection):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT month, year, total_amount, is_paid FROM public.invoices WHERE credit_card_id = %s ORDER BY year, month",
+            (CARD_ID,)
+        )
+        return cursor.fetchall()
+
+
+EXPECTED = [
+    (12, 2025, Decimal("75"), True),
+    (1, 2026, Decimal("300"), True),
+    (2, 2026, Decimal("150.00"), False),
+    (3, 2026, Decimal("100.00"), False),
+]
+
+
+def test_backfill_merges_duplicates_and_keeps_paid_history(database):
+    assert _invoices(database) == EXPECTED
+
+
+def test_rebuild_leaves_paid_invoices_alone(database):
+    with database.cursor() as cursor:
+        cursor.execute("SELECT public.rebuild_invoice_totals(%s)", (USER_ID,))
+        assert cursor.fetchone() == (3,)
+
+    assert _invoices(database) == EXPECTED
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT public.rebuild_invoice_totals()",
+    "SELECT * FROM public.apply_invoice_deltas('[]'::jsonb)",
+])
+def test_anon_cannot_call_invoice_rpcs(database, sql):
+    with pytest.raises(psycopg2.errors.InsufficientPrivilege):
+        as_role(database, "anon", sql)
+
+
+def test_anon_purchase_still_updates_invoice(database):
+    rows = as_role(database, "anon", """
+        INSERT INTO public.transactions (user_id, amount, transaction_type, payment_method, credit_card_id, installments, due_date)
+        VALUES (%(user_id)s, 40, 'expense', 'cartao_credito', %(card_id)s, 1, '2026-03-20');
+        SELECT total_amount FROM public.invoices WHERE credit_card_id = %(card_id)s AND month = 3 AND year = 2026
+    """, {"user_id": USER_ID, "card_id": CARD_ID})
+
+    assert rows == [(Decimal("140.00"),)]
@@ -0,0 +1,75 @@
+"""
+Cursor opaco e predicado de keyset compartilhados pela busca e pela exportação
+"""
+import uuid
+from types import SimpleNamespace
+
+import pytest
+
+from keyset_pagination import decode_cursor, encode_cursor, fetch_page
+
+
+class RecordingQuery:
+    """Registra as chamadas do query builder e devolve as linhas dadas"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.calls = []
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+            return self
+        return call
+
+    def execute(self):
+        return SimpleNamespace(data=self.rows)
+
+
+def _row(created_at: str) -> dict:
+    return {"created_at": created_at, "id": str(uuid.uuid4())}
+
+
+def test_cursor_round_trip():
+    row_id = str(uuid.uuid4())
+    cursor = encode_cursor("2026-10-16T19:45:32.123456+00:00", row_id)
+
+    assert "|" not in cursor and "=" not in cursor
+    assert decode_cursor(cursor) == ("2026-10-16T19:45:32.123456+00:00", row_id)
+
+
+@pytest.mark.parametrize("cursor", [
+    "not base64!",
+    encode_cursor("2026-10-16T19:45:32+00:00", "1 or true"),
+    encode_cursor("ontem", str(uuid.uuid4())),
+])
+def test_invalid_cursor_is_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_full_page_returns_cursor_of_last_row():
+    rows = [_row("2026-10-16T10:00:00+00:00"), _row("2026-10-15T10:00:00+00:00")]
+    query = RecordingQuery(rows)
+
+    page, next_cursor = fetch_page(query, limit=2)
+
+    assert page == rows
+    assert decode_cursor(next_cursor) == (rows[-1]["created_at"], rows[-1]["id"])
+    assert query.calls == [
+        ("order", ("created_at",), {"desc": True}),
+        ("order", ("id",), {"desc": True}),
+        ("limit", (2,), {})
+    ]
+
+
+def test_cursor_continues_after_last_row():
+    last = _row("2026-10-15T10:00:00+00:00")
+    query = RecordingQuery([_row("2026-10-14T10:00:00+00:00")])
+
+    page, next_cursor = fetch_page(query, limit=2, cursor=encode_cursor(last["created_at"], last["id"]))
+
+    assert next_cursor is None
+    assert query.calls[0] == ("or_", (
+        f'created_at.lt."{last["created_at"]}",and(created_at.eq."{last["created_at"]}",id.lt.{last["id"]})',
+    ), {})
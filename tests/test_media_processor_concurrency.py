@@ -0,0 +1,109 @@
+"""
+Chamadas à OpenAI não bloqueiam o event loop: com um servidor local (OPENAI_BASE_URL)
+cuja transcrição demora, uma leitura de comprovante simultânea termina antes dela
+"""
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("httpx")
+pytest.importorskip("openai")
+pytest.importorskip("redis")
+
+import media_processor
+from media_payload import MediaPayload
+
+TRANSCRIBE_DELAY = 1.5
+
+CHAT_COMPLETION = {
+    "id": "chatcmpl-test",
+    "object": "chat.completion",
+    "created": 0,
+    "model": media_processor.RECEIPT_MODEL,
+    "choices": [{
+        "index": 0,
+        "message": {"role": "assistant", "content": json.dumps({"valor": 42.5, "tipo_comprovante": "pix"})},
+        "finish_reason": "stop"
+    }]
+}
+
+
+class StubOpenAIHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path.endswith("/audio/transcriptions"):
+            time.sleep(TRANSCRIBE_DELAY)
+            body = {"text": "gastei cinquenta reais no mercado"}
+        elif self.path.endswith("/chat/completions"):
+            body = CHAT_COMPLETION
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_openai(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubOpenAIHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    monkeypatch.setattr(media_processor, "OPENAI_BASE_URL", f"http://127.0.0.1:{server.server_port}/v1")
+    monkeypatch.setattr(media_processor, "OPENAI_API_KEY", "test-key")
+    monkeypatch.setattr(media_processor, "_client", None)
+    yield
+    server.shutdown()
+    server.server_close()
+
+
+def _payload(filename: str, mimetype: str, data: bytes) -> MediaPayload:
+    payload = MediaPayload(filename=filename, mimetype=mimetype)
+    payload.write(data)
+    return payload
+
+
+async def _timed(finished: list, name: str, call):
+    result = await call
+    finished.append((name, time.perf_counter()))
+    return result
+
+
+async def _run_concurrently():
+    finished = []
+    with _payload("audio.ogg", "audio/ogg", b"OggS" + b"\0" * 256) as audio, \
+            _payload("comprovante.jpg", "image/jpeg", b"\xff\xd8\xff" + b"\0" * 256) as image:
+        try:
+            transcription, receipt = await asyncio.gather(
+                _timed(finished, "transcription", media_processor.MediaProcessor.transcribe_audio(audio, use_cache=False)),
+                _timed(finished, "receipt", media_processor.MediaProcessor.extract_receipt_data(
+                    image, preprocess=False, use_cache=False
+                ))
+            )
+        finally:
+            await media_processor.close_openai_client()
+    return finished, transcription, receipt
+
+
+def test_slow_transcription_does_not_block_concurrent_receipt(stub_openai):
+    start = time.perf_counter()
+    finished, transcription, receipt = asyncio.run(_run_concurrently())
+
+    assert transcription == "gastei cinquenta reais no mercado"
+    assert receipt["valor"] == 42.5
+    assert [name for name, _ in finished] == ["receipt", "transcription"]
+    # A leitura do comprovante não esperou a transcrição
+    assert finished[0][1] - start < TRANSCRIBE_DELAY
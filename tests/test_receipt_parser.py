@@ -0,0 +1,57 @@
+"""
+Leitura local de comprovantes (receipt_parser) sobre o corpus de fixtures/receipts
+Cada <nome>.json diz se o comprovante deve ir pelo caminho rápido e os campos esperados
+"""
+import json
+from pathlib import Path
+
+import pytest
+
+from receipt_parser import fast_path_accepts, parse_receipt_text
+
+FIXTURES = Path(__file__).resolve().parent.parent / "fixtures" / "receipts"
+CASES = sorted(FIXTURES.glob("*.json"))
+
+
+@pytest.mark.parametrize("fixture", CASES, ids=[case.stem for case in CASES])
+def test_fixture(fixture):
+    expected = json.loads(fixture.read_text(encoding="utf-8"))
+    result = parse_receipt_text(fixture.with_suffix(".txt").read_text(encoding="utf-8"))
+
+    assert fast_path_accepts(result) == expected["fast_path"]
+    if not expected["fast_path"]:
+        return
+
+    assert result["valor"] == pytest.approx(expected["valor"])
+    assert result["data"] == expected["data"]
+    assert result["estabelecimento"].lower() == expected["estabelecimento"].lower()
+    assert result["tipo_comprovante"] == expected["tipo_comprovante"]
+    assert result["metodo_pagamento"] == "pix"
+
+
+def test_accepted_results_have_every_confirmation_field():
+    # api.py monta a confirmação com valor, descrição e método; nada disso pode faltar
+    for fixture in CASES:
+        result = parse_receipt_text(fixture.with_suffix(".txt").read_text(encoding="utf-8"))
+        if fast_path_accepts(result):
+            assert result["valor"] > 0
+            assert result["descricao"]
+            assert result["metodo_pagamento"]
+
+
+def test_ted_without_pix_goes_to_vision():
+    result = parse_receipt_text((FIXTURES / "nubank_ted.txt").read_text(encoding="utf-8"))
+    assert result["confianca"] >= 0.8
+    assert result["metodo_pagamento"] is None
+    assert not fast_path_accepts(result)
+
+
+def test_missing_recipient_goes_to_vision():
+    result = parse_receipt_text((FIXTURES / "inter_pix_sem_recebedor.txt").read_text(encoding="utf-8"))
+    assert result["estabelecimento"] is None
+    assert not fast_path_accepts(result)
+
+
+def test_empty_text():
+    assert parse_receipt_text("") is None
+    assert not fast_path_accepts(None)
@@ -0,0 +1,111 @@
+"""
+Exportação em streaming: cabeçalho e escape do CSV, NDJSON com os nomes dos joins
+e leitura de todas as páginas do keyset
+"""
+import csv
+import io
+import json
+import re
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("fastapi")
+# supabase.client: a pasta supabase/ (migrações) do repositório também é importável como "supabase"
+pytest.importorskip("supabase.client")
+
+from transaction_export import EXPORT_COLUMNS, iter_csv, iter_ndjson
+from web_database import WebDatabaseService
+
+CURSOR_FILTER = re.compile(r'created_at\.lt\."(?P<created_at>[^"]+)",and\(created_at\.eq\."(?P=created_at)",id\.lt\.(?P<id>[^)]+)\)')
+
+
+def _row(index: int, **fields) -> dict:
+    return {
+        "id": f"00000000-0000-0000-0000-{index:012d}",
+        "created_at": f"2026-10-{index:02d}T12:00:00+00:00",
+        "description": f"Compra {index}",
+        "amount": 10.0 * index,
+        "transaction_type": "expense",
+        "categories": {"name": "Alimentação"},
+        "credit_cards": None,
+        **fields
+    }
+
+
+class PagedTable:
+    """Query builder mínimo do PostgREST: ordem (created_at, id) desc, cursor do keyset e limit"""
+
+    def __init__(self, rows, requests):
+        self.rows = sorted(rows, key=lambda row: (row["created_at"], row["id"]), reverse=True)
+        self.requests = requests
+        self._limit = None
+
+    def select(self, columns):
+        return self
+
+    def eq(self, column, value):
+        return self
+
+    def order(self, column, desc=False):
+        return self
+
+    def or_(self, expression):
+        after = CURSOR_FILTER.fullmatch(expression)
+        self.rows = [row for row in self.rows if (row["created_at"], row["id"]) < (after["created_at"], after["id"])]
+        return self
+
+    def limit(self, limit):
+        self._limit = limit
+        return self
+
+    def execute(self):
+        self.requests.append(self._limit)
+        return SimpleNamespace(data=self.rows[:self._limit])
+
+
+def _service(rows, requests) -> WebDatabaseService:
+    service = WebDatabaseService()
+    service.supabase = SimpleNamespace(table=lambda name: PagedTable(rows, requests))
+    return service
+
+
+def _parse_csv(chunks) -> list:
+    return list(csv.reader(io.StringIO("".join(chunks))))
+
+
+def test_csv_without_rows_is_only_header():
+    assert _parse_csv(iter_csv([])) == [EXPORT_COLUMNS]
+
+
+def test_csv_escapes_separators_quotes_and_newlines():
+    description = 'Mercado, "promoção"\nsegunda linha'
+    lines = _parse_csv(iter_csv([_row(1, description=description)]))
+
+    assert lines[0] == EXPORT_COLUMNS
+    exported = dict(zip(EXPORT_COLUMNS, lines[1]))
+    assert exported["description"] == description
+    assert exported["category"] == "Alimentação"
+    assert exported["credit_card"] == ""
+
+
+def test_ndjson_one_object_per_line_with_join_names():
+    rows = [_row(1, credit_cards={"name": "Nubank"}), _row(2, categories=None)]
+    lines = "".join(iter_ndjson(rows)).splitlines()
+
+    exported = [json.loads(line) for line in lines]
+    assert [list(item) for item in exported] == [EXPORT_COLUMNS, EXPORT_COLUMNS]
+    assert (exported[0]["category"], exported[0]["credit_card"]) == ("Alimentação", "Nubank")
+    assert exported[1]["category"] is None
+    assert "Alimentação" in lines[0]
+
+
+def test_export_reads_every_page_in_order():
+    rows = [_row(index) for index in range(1, 6)]
+    requests = []
+
+    chunks = iter_csv(_service(rows, requests).iter_transactions("user-1", page_size=2))
+    lines = _parse_csv(chunks)
+
+    assert [line[0] for line in lines[1:]] == [row["id"] for row in reversed(rows)]
+    assert requests == [2, 2, 2]
@@ -0,0 +1,56 @@
+"""
+O contexto em cache guarda só as colunas de users usadas pelo agente
+"""
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("redis")
+pytest.importorskip("pydantic_ai")
+
+import user_context_cache as module
+from user_context_cache import USER_CONTEXT_FIELDS, UserContextCache
+
+USER_ROW = {
+    "id": "550e8400-e29b-41d4-a716-446655440000",
+    "name": "Maria",
+    "phone_number": "5511999999999",
+    "email": "maria@example.com",
+    "cpf": "12345678900",
+    "password_hash": "$2b$12$hash",
+    "created_at": "2026-10-16T00:00:00"
+}
+
+
+class FakeRedis:
+    def __init__(self):
+        self.values = {}
+
+    async def get(self, key):
+        return self.values.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.values[key] = value
+
+
+def test_cached_context_keeps_only_agent_fields(monkeypatch):
+    redis = FakeRedis()
+
+    async def get_user_by_phone(phone_number):
+        return dict(USER_ROW)
+
+    async def empty(user_id):
+        return []
+
+    monkeypatch.setattr(module, "get_user_by_phone", get_user_by_phone)
+    monkeypatch.setattr(module, "get_user_categories", empty)
+    monkeypatch.setattr(module, "get_user_credit_cards", empty)
+    monkeypatch.setattr(module, "get_async_redis_client", lambda: redis)
+
+    context = asyncio.run(UserContextCache().get(USER_ROW["phone_number"]))
+
+    assert context["user"] == {field: USER_ROW[field] for field in USER_CONTEXT_FIELDS}
+    stored = next(iter(redis.values.values()))
+    assert "password_hash" not in stored and USER_ROW["cpf"] not in stored
+    assert json.loads(stored)["user"] == context["user"]
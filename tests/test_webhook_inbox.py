@@ -0,0 +1,34 @@
+"""
+O inbox avisa ao iniciar quando outro consumidor ativo lê o mesmo grupo
+(a ordem por telefone só vale dentro de um processo)
+"""
+import asyncio
+
+import pytest
+
+pytest.importorskip("redis")
+
+import webhook_inbox as module
+from webhook_inbox import INBOX_CLAIM_IDLE_MS, WebhookInbox
+
+
+class FakeRedis:
+    def __init__(self, consumers):
+        self.consumers = consumers
+
+    async def xinfo_consumers(self, stream, group):
+        return self.consumers
+
+
+@pytest.mark.parametrize("idle, warns", [(1_000, True), (INBOX_CLAIM_IDLE_MS * 2, False)])
+def test_start_warns_about_other_active_consumer(monkeypatch, capsys, idle, warns):
+    inbox = WebhookInbox(consumer_name="worker-a")
+    redis = FakeRedis([
+        {"name": "worker-a", "pending": 0, "idle": 0},
+        {"name": "worker-b", "pending": 3, "idle": idle}
+    ])
+    monkeypatch.setattr(module, "get_async_redis_client", lambda: redis)
+
+    asyncio.run(inbox._warn_other_consumers())
+
+    assert ("worker-b" in capsys.readouterr().out) is warns
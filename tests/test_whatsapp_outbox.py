@@ -0,0 +1,52 @@
+"""
+drain encerra os workers assim que as filas esvaziam, inclusive o que estava
+no meio de um envio quando a fila foi encerrada
+"""
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("httpx")
+
+import whatsapp_outbox as module
+from whatsapp_outbox import WhatsAppOutbox
+
+
+class SlowEvolutionClient:
+    """Segura cada envio até release ser sinalizado"""
+
+    def __init__(self):
+        self.sending = asyncio.Event()
+        self.release = asyncio.Event()
+
+    async def send_text(self, number, text, instance=None):
+        self.sending.set()
+        await self.release.wait()
+        return SimpleNamespace(status_code=200, text="ok")
+
+
+def test_drain_does_not_wait_idle_timeout_for_busy_worker(monkeypatch):
+    async def scenario():
+        client = SlowEvolutionClient()
+        monkeypatch.setattr(module, "evolution_client", client)
+        outbox = WhatsAppOutbox()
+
+        delivered = outbox.enqueue("11999999999", "Transação registrada")
+        await client.sending.wait()
+
+        # drain acorda os workers enquanto este ainda está enviando
+        drain = asyncio.create_task(outbox.drain(timeout=10))
+        await asyncio.sleep(0)
+        client.release.set()
+
+        started = time.monotonic()
+        await asyncio.wait_for(drain, timeout=2)
+        return time.monotonic() - started, delivered.result(), outbox.get_stats()
+
+    elapsed, delivered, stats = asyncio.run(scenario())
+
+    assert elapsed < 1
+    assert delivered is True
+    assert stats["pending"] == 0 and stats["active_numbers"] == 0
@@ -0,0 +1,87 @@
+"""
+Exportação de transações em streaming (NDJSON e CSV)
+As linhas são lidas página a página por keyset e enviadas conforme chegam,
+com memória constante independente do tamanho do histórico
+"""
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator
+from fastapi.responses import StreamingResponse
+
+from web_database import WebDatabaseService
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8"
+}
+
+EXPORT_COLUMNS = [
+    "id", "created_at", "transaction_date", "description", "amount", "transaction_type",
+    "payment_method", "category", "credit_card", "due_date", "paid_date", "installments", "recurrence"
+]
+
+
+def _flatten(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Troca os objetos de join (categories, credit_cards) pelos nomes"""
+    flat = {column: row.get(column) for column in EXPORT_COLUMNS}
+    flat["category"] = (row.get("categories") or {}).get("name")
+    flat["credit_card"] = (row.get("credit_cards") or {}).get("name")
+    return flat
+
+
+def iter_ndjson(rows: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    """Uma transação JSON por linha"""
+    for row in rows:
+        yield json.dumps(_flatten(row), ensure_ascii=False, default=str) + "\n"
+
+
+def iter_csv(rows: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    """Cabeçalho seguido de uma linha CSV por transação"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(_flatten(row))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+    # Só o cabeçalho quando não há transações
+    if buffer.getvalue():
+        yield buffer.getvalue()
+
+
+def transactions_export_response(
+    db_service: WebDatabaseService,
+    user_id: str,
+    filters: Dict[str, Any],
+    export_format: str = "ndjson"
+) -> StreamingResponse:
+    """
+    Monta a resposta de exportação das transações do usuário
+
+    Args:
+        db_service: Serviço de banco da API web
+        user_id: ID do usuário
+        filters: Filtros aceitos por WebDatabaseService.get_transactions_page
+        export_format: "ndjson" ou "csv"
+
+    Raises:
+        ValueError: Se o formato não for suportado
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Formato de exportação inválido: {export_format}")
+
+    rows = db_service.iter_transactions(user_id, filters)
+    body = iter_csv(rows) if export_format == "csv" else iter_ndjson(rows)
+    filename = f"transacoes-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{export_format}"
+
+    # Gerador síncrono: o Starlette o percorre num thread, sem bloquear o event loop
+    return StreamingResponse(
+        body,
+        media_type=EXPORT_FORMATS[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
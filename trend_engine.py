@@ -0,0 +1,193 @@
+"""
+Tendência de receitas e despesas por período
+Busca a janela inteira numa única consulta (rollups mensais ou RPC transaction_trend)
+e distribui os valores em meses de calendário ou semanas, com detalhamento opcional por categoria
+"""
+import calendar
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from functions_database import supabase, _rpc
+from rollups import get_period_rollups
+
+GRANULARITIES = ("month", "week")
+
+
+def bucket_start(day: date, granularity: str = "month") -> date:
+    """Início do período que contém a data (dia 1 do mês ou segunda-feira da semana)"""
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def bucket_end(start: date, granularity: str = "month") -> date:
+    """Último dia do período iniciado em `start`"""
+    if granularity == "week":
+        return start + timedelta(days=6)
+    return start.replace(day=calendar.monthrange(start.year, start.month)[1])
+
+
+def trend_buckets(periods: int, granularity: str = "month", end_date: date = None) -> List[date]:
+    """
+    Inícios dos últimos `periods` períodos, do mais antigo até o que contém `end_date`
+
+    Meses são contados pelo calendário (sem pular nem repetir meses).
+    """
+    current = bucket_start(end_date or date.today(), granularity)
+    starts = []
+    for _ in range(periods):
+        starts.append(current)
+        if granularity == "week":
+            current -= timedelta(days=7)
+        else:
+            current = (current - timedelta(days=1)).replace(day=1)
+    return starts[::-1]
+
+
+def _period_label(start: date, granularity: str) -> str:
+    if granularity == "week":
+        year, week, _ = start.isocalendar()
+        return f"{year}-W{week:02d}"
+    return f"{start.year}-{start.month:02d}"
+
+
+def _rows_from_rollups(rollup_rows: List[dict], by_category: bool) -> List[dict]:
+    """Converte as linhas de monthly_rollups (mês, categoria, tipo) para o formato de _fetch_rows"""
+    grouped: Dict[Tuple[date, Optional[str]], dict] = {}
+    for rollup in rollup_rows:
+        category = rollup["category_name"] if by_category else None
+        row = grouped.setdefault((rollup["month"], category), {
+            "bucket": rollup["month"].isoformat(), "category_name": category, "income": 0.0, "expenses": 0.0, "count": 0
+        })
+        if rollup["transaction_type"] == "income":
+            row["income"] += rollup["total"]
+        elif rollup["transaction_type"] == "expense":
+            row["expenses"] += rollup["total"]
+        row["count"] += rollup["count"]
+    return list(grouped.values())
+
+
+def _fetch_rows(user_id: str, start: date, end: date, granularity: str, by_category: bool) -> List[dict]:
+    """
+    Totais por período (e categoria) no intervalo, agregados no banco
+
+    Returns:
+        Linhas {"bucket", "category_name", "income", "expenses", "count"}
+    """
+    # Meses inteiros: O(meses × categorias) a partir dos rollups mensais
+    if granularity == "month":
+        rollup_rows = get_period_rollups(user_id, start, end, is_paid=True)
+        if rollup_rows is not None:
+            return _rows_from_rollups(rollup_rows, by_category)
+    
+    rows = _rpc("transaction_trend", {
+        "p_user_id": user_id,
+        "p_start": start.isoformat(),
+        "p_end": end.isoformat(),
+        "p_granularity": granularity,
+        "p_by_category": by_category
+    })
+    if rows is not None:
+        return rows
+
+    # Fallback: uma única consulta por intervalo, agregada em Python
+    select = "amount, transaction_type, paid_date, categories(name)" if by_category else "amount, transaction_type, paid_date"
+    resp = supabase.table("transactions").select(select).eq(
+        "user_id", user_id
+    ).not_.is_("paid_date", "null").gte("paid_date", start.isoformat()).lte("paid_date", end.isoformat()).execute()
+
+    grouped: Dict[Tuple[date, Optional[str]], dict] = {}
+    for transaction in resp.data or []:
+        bucket = bucket_start(date.fromisoformat(transaction["paid_date"][:10]), granularity)
+        category = (transaction.get("categories") or {}).get("name") if by_category else None
+        row = grouped.setdefault((bucket, category), {
+            "bucket": bucket.isoformat(), "category_name": category, "income": 0.0, "expenses": 0.0, "count": 0
+        })
+        if transaction["transaction_type"] == "income":
+            row["income"] += float(transaction["amount"])
+        elif transaction["transaction_type"] == "expense":
+            row["expenses"] += float(transaction["amount"])
+        row["count"] += 1
+    return list(grouped.values())
+
+
+def get_trend(
+    user_id: str,
+    periods: int = 6,
+    granularity: str = "month",
+    by_category: bool = False,
+    start_date: date = None,
+    end_date: date = None
+) -> List[dict]:
+    """
+    Receitas e despesas pagas por período
+
+    Args:
+        user_id: ID do usuário
+        periods: Quantidade de períodos (ignorado se start_date for informado)
+        granularity: "month" (meses de calendário) ou "week" (semanas de segunda a domingo)
+        by_category: Se inclui o detalhamento por categoria em cada período
+        start_date: Início da janela (opcional)
+        end_date: Fim da janela (padrão: hoje)
+
+    Returns:
+        Lista do período mais antigo para o mais recente com
+        {"period", "start", "end", "income", "expenses", "balance", "count"}
+        e "categories" ({nome: {"income", "expenses"}}) quando by_category
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Granularidade inválida: {granularity}")
+
+    end_date = end_date or date.today()
+    if start_date:
+        starts = []
+        current = bucket_start(start_date, granularity)
+        while current <= end_date:
+            starts.append(current)
+            current = bucket_end(current, granularity) + timedelta(days=1)
+    else:
+        starts = trend_buckets(periods, granularity, end_date)
+
+    if not starts:
+        return []
+
+    window_start = max(start_date, starts[0]) if start_date else starts[0]
+    window_end = min(end_date, bucket_end(starts[-1], granularity))
+
+    result = {
+        start: {
+            "period": _period_label(start, granularity),
+            "start": start.isoformat(),
+            "end": bucket_end(start, granularity).isoformat(),
+            "income": 0.0,
+            "expenses": 0.0,
+            "balance": 0.0,
+            "count": 0,
+            **({"categories": {}} if by_category else {})
+        } for start in starts
+    }
+
+    if supabase:
+        rows = _fetch_rows(user_id, window_start, window_end, granularity, by_category)
+    else:
+        rows = []
+
+    # Uma passada pelas linhas agregadas
+    for row in rows:
+        bucket = result.get(date.fromisoformat(str(row["bucket"])[:10]))
+        if bucket is None:
+            continue
+        income = float(row["income"])
+        expenses = float(row["expenses"])
+        bucket["income"] += income
+        bucket["expenses"] += expenses
+        bucket["count"] += int(row["count"])
+        if by_category:
+            category = bucket["categories"].setdefault(row["category_name"] or "Sem categoria", {"income": 0.0, "expenses": 0.0})
+            category["income"] += income
+            category["expenses"] += expenses
+
+    for bucket in result.values():
+        bucket["balance"] = bucket["income"] - bucket["expenses"]
+
+    return [result[start] for start in starts]
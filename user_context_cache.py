@@ -0,0 +1,179 @@
+"""
+Cache do contexto do usuário usado para montar o FinanceDeps
+Guarda usuário, categorias e cartões de crédito por telefone em duas camadas
+(LRU local com TTL curto + Redis), invalidadas pelas rotas que alteram esses dados
+"""
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
+from dotenv import load_dotenv
+
+from chat_redis import get_async_redis_client
+from functions_database_async import get_user_by_phone, get_user_categories, get_user_credit_cards
+
+load_dotenv()
+
+USER_CONTEXT_TTL = int(os.getenv("USER_CONTEXT_TTL", "600"))
+# A camada local não é invalidada por outros processos, então o TTL dela é curto
+USER_CONTEXT_LOCAL_TTL = float(os.getenv("USER_CONTEXT_LOCAL_TTL", "60"))
+USER_CONTEXT_LOCAL_MAX_SIZE = int(os.getenv("USER_CONTEXT_LOCAL_MAX_SIZE", "5000"))
+# v2: entradas anteriores guardavam a linha inteira de users (com password_hash e cpf)
+USER_CONTEXT_PREFIX = "user_ctx:v2:"
+# Colunas de users usadas pelo agente; o restante da linha (senha, CPF, ...) não entra no cache
+USER_CONTEXT_FIELDS = ("id", "name", "phone_number")
+
+
+class UserContextCache:
+    """
+    Contexto do usuário (USER_CONTEXT_FIELDS de `users`, categorias e cartões) por telefone.
+
+    Numa falta, o usuário é buscado primeiro (o ID é necessário) e categorias
+    e cartões em paralelo. Telefones sem cadastro não são guardados, para que
+    o usuário seja reconhecido logo depois do onboarding.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: int = USER_CONTEXT_TTL,
+        local_ttl_seconds: float = USER_CONTEXT_LOCAL_TTL,
+        local_max_size: int = USER_CONTEXT_LOCAL_MAX_SIZE
+    ):
+        """
+        Args:
+            ttl_seconds: Validade do contexto no Redis
+            local_ttl_seconds: Validade do contexto na LRU local
+            local_max_size: Máximo de usuários na LRU local
+        """
+        self.ttl_seconds = ttl_seconds
+        self.local_ttl_seconds = local_ttl_seconds
+        self.local_max_size = local_max_size
+        self._local = OrderedDict()
+
+        self.stats = {
+            "local_hits": 0,
+            "redis_hits": 0,
+            "misses": 0,
+            "invalidations": 0,
+            "redis_errors": 0
+        }
+
+    def _get_key(self, phone_number: str) -> str:
+        return f"{USER_CONTEXT_PREFIX}{phone_number}"
+
+    def _local_get(self, phone_number: str) -> Optional[dict]:
+        item = self._local.get(phone_number)
+        if item is None:
+            return None
+
+        expires_at, context = item
+        if expires_at < time.monotonic():
+            del self._local[phone_number]
+            return None
+
+        self._local.move_to_end(phone_number)
+        return context
+
+    def _local_set(self, phone_number: str, context: dict):
+        self._local[phone_number] = (time.monotonic() + self.local_ttl_seconds, context)
+        self._local.move_to_end(phone_number)
+        while len(self._local) > self.local_max_size:
+            self._local.popitem(last=False)
+
+    async def _load(self, phone_number: str) -> Optional[dict]:
+        """Busca o contexto no Supabase"""
+        user = await get_user_by_phone(phone_number)
+        if not user:
+            return None
+
+        categories, credit_cards = await asyncio.gather(
+            get_user_categories(user["id"]),
+            get_user_credit_cards(user["id"])
+        )
+        return {
+            "user": {field: user.get(field) for field in USER_CONTEXT_FIELDS},
+            "categories": categories,
+            "credit_cards": credit_cards
+        }
+
+    async def get(self, phone_number: str) -> Optional[dict]:
+        """
+        Retorna o contexto do usuário
+
+        Args:
+            phone_number: Telefone do usuário (como recebido no webhook)
+
+        Returns:
+            Dict com "user", "categories" e "credit_cards", ou None se o telefone não tem cadastro
+        """
+        context = self._local_get(phone_number)
+        if context is not None:
+            self.stats["local_hits"] += 1
+            return context
+
+        try:
+            raw = await get_async_redis_client().get(self._get_key(phone_number))
+            if raw:
+                context = json.loads(raw)
+                self._local_set(phone_number, context)
+                self.stats["redis_hits"] += 1
+                return context
+        except Exception as e:
+            print(f"⚠️ Erro ao ler contexto do usuário no Redis: {e}")
+            self.stats["redis_errors"] += 1
+
+        self.stats["misses"] += 1
+        context = await self._load(phone_number)
+        if context is None:
+            return None
+
+        # Categorias padrão indicam falha na consulta - não guardar
+        if any(str(category.get("id", "")).startswith("default") for category in context["categories"]):
+            return context
+
+        self._local_set(phone_number, context)
+        try:
+            await get_async_redis_client().set(
+                self._get_key(phone_number),
+                json.dumps(context, ensure_ascii=False, default=str),
+                ex=self.ttl_seconds
+            )
+        except Exception as e:
+            print(f"⚠️ Erro ao salvar contexto do usuário no Redis: {e}")
+            self.stats["redis_errors"] += 1
+
+        return context
+
+    async def invalidate(self, phone_number: Optional[str]):
+        """
+        Descarta o contexto do usuário (chamado após criar/alterar usuário, categorias ou cartões)
+
+        Args:
+            phone_number: Telefone do usuário
+        """
+        if not phone_number:
+            return
+
+        self._local.pop(phone_number, None)
+        self.stats["invalidations"] += 1
+        try:
+            await get_async_redis_client().delete(self._get_key(phone_number))
+        except Exception as e:
+            print(f"⚠️ Erro ao invalidar contexto do usuário no Redis: {e}")
+            self.stats["redis_errors"] += 1
+
+    def get_stats(self) -> dict:
+        """Retorna contadores de acertos e falhas"""
+        hits = self.stats["local_hits"] + self.stats["redis_hits"]
+        total = hits + self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+            "local_size": len(self._local)
+        }
+
+
+# Instância global compartilhada pelo processo
+user_context_cache = UserContextCache()
@@ -2,7 +2,7 @@
 API REST para Frontend - Assistente Financeiro
 Endpoints para gerenciar usuários, categorias, cartões, transações e orçamentos
 """
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Query, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import ValidationError
@@ -15,6 +15,9 @@ from dotenv import load_dotenv
 # Imports locais
 from web_models import *
 from web_database import WebDatabaseService
+from transaction_export import transactions_export_response, EXPORT_FORMATS
+from user_context_cache import user_context_cache
+from budget_engine import budget_engine
 
 # Carregar variáveis de ambiente
 load_dotenv()
@@ -202,6 +205,8 @@ async def update_profile(
                 detail="Erro ao atualizar perfil"
             )
         
+        await user_context_cache.invalidate(current_user.get("phone_number"))
+        
         return ApiResponse(
             success=True,
             message="Perfil atualizado com sucesso",
@@ -253,6 +258,8 @@ async def create_category(
                 detail="Erro ao criar categoria"
             )
         
+        await user_context_cache.invalidate(current_user.get("phone_number"))
+        
         return ApiResponse(
             success=True,
             message="Categoria criada com sucesso",
@@ -287,6 +294,8 @@ async def update_category(
                 detail="Categoria não encontrada"
             )
         
+        await user_context_cache.invalidate(current_user.get("phone_number"))
+        
         return ApiResponse(
             success=True,
             message="Categoria atualizada com sucesso",
@@ -316,6 +325,8 @@ async def delete_category(
                 detail="Categoria não encontrada"
             )
         
+        await user_context_cache.invalidate(current_user.get("phone_number"))
+        
         return ApiResponse(
             success=True,
             message="Categoria deletada com sucesso"
@@ -363,6 +374,8 @@ async def create_credit_card(
                 detail="Erro ao criar cartão"
             )
         
+        await user_context_cache.invalidate(current_user.get("phone_number"))
+        
         return ApiResponse(
             success=True,
             message="Cartão criado com sucesso",
@@ -397,6 +410,8 @@ async def update_credit_card(
                 detail="Cartão não encontrado"
             )
         
+        await user_context_cache.invalidate(current_user.get("phone_number"))
+        
         return ApiResponse(
             success=True,
             message="Cartão atualizado com sucesso",
@@ -426,6 +441,8 @@ async def delete_credit_card(
                 detail="Cartão não encontrado"
             )
         
+        await user_context_cache.invalidate(current_user.get("phone_number"))
+        
         return ApiResponse(
             success=True,
             message="Cartão deletado com sucesso"
@@ -440,6 +457,35 @@ async def delete_credit_card(
         )
 
 # ENDPOINTS DE TRANSAÇÕES
+@app.get("/transactions/export")
+async def export_transactions(
+    export_format: str = Query("ndjson", alias="format"),
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    category_id: Optional[str] = None,
+    payment_method: Optional[str] = None,
+    transaction_type: Optional[str] = None,
+    credit_card_id: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """Exporta todas as transações do usuário em streaming (format=ndjson ou csv)"""
+    if export_format not in EXPORT_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Formato inválido. Use: {', '.join(EXPORT_FORMATS)}"
+        )
+    
+    filters = {
+        "start_date": start_date,
+        "end_date": end_date,
+        "category_id": category_id,
+        "payment_method": payment_method,
+        "transaction_type": transaction_type,
+        "credit_card_id": credit_card_id
+    }
+    
+    return transactions_export_response(db_service, current_user["id"], filters, export_format)
+
 @app.get("/transactions", response_model=ApiResponse)
 async def get_transactions(
     start_date: Optional[str] = None,
@@ -504,6 +550,8 @@ async def create_transaction(
                 detail="Erro ao criar transação"
             )
         
+        await budget_engine.invalidate(current_user["id"])
+        
         return ApiResponse(
             success=True,
             message="Transação criada com sucesso",
@@ -538,6 +586,8 @@ async def update_transaction(
                 detail="Transação não encontrada"
             )
         
+        await budget_engine.invalidate(current_user["id"])
+        
         return ApiResponse(
             success=True,
             message="Transação atualizada com sucesso",
@@ -567,6 +617,8 @@ async def delete_transaction(
                 detail="Transação não encontrada"
             )
         
+        await budget_engine.invalidate(current_user["id"])
+        
         return ApiResponse(
             success=True,
             message="Transação deletada com sucesso"
@@ -614,6 +666,8 @@ async def create_budget(
                 detail="Erro ao criar orçamento"
             )
         
+        await budget_engine.invalidate(current_user["id"])
+        
         return ApiResponse(
             success=True,
             message="Orçamento criado com sucesso",
@@ -4,10 +4,21 @@ Operações CRUD para todas as entidades do sistema
 """
 import uuid
 from datetime import datetime, date
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Iterator, Tuple
 from database import supabase
+from rollups import get_rollup_rows
+from keyset_pagination import fetch_page
 import hashlib
 
+# Colunas das transações exportadas (categoria e cartão vêm pelo join)
+TRANSACTION_EXPORT_SELECT = """
+    id, created_at, transaction_date, description, amount, transaction_type,
+    payment_method, due_date, paid_date, installments, recurrence,
+    categories(name),
+    credit_cards(name)
+"""
+TRANSACTION_PAGE_SIZE = 500
+
 class WebDatabaseService:
     def __init__(self):
         self.supabase = supabase
@@ -152,6 +163,58 @@ class WebDatabaseService:
             print(f"Database error: {str(e)}")
             return []
     
+    def get_transactions_page(
+        self,
+        user_id: str,
+        filters: Dict[str, Any] = None,
+        limit: int = TRANSACTION_PAGE_SIZE,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Buscar uma página de transações em ordem (created_at, id) decrescente
+        
+        Args:
+            user_id: ID do usuário
+            filters: start_date, end_date (transaction_date), transaction_type,
+                     category_id, payment_method, credit_card_id
+            limit: Tamanho da página
+            cursor: Cursor retornado pela página anterior (keyset_pagination)
+        
+        Returns:
+            Linhas da página e o cursor da próxima (None na última página)
+        
+        Erros do banco são propagados (uma exportação não pode terminar truncada em silêncio)
+        """
+        if not self.supabase:
+            return [], None
+        
+        filters = filters or {}
+        query = self.supabase.table("transactions").select(TRANSACTION_EXPORT_SELECT).eq("user_id", user_id)
+        
+        if filters.get("start_date"):
+            query = query.gte("transaction_date", filters["start_date"])
+        if filters.get("end_date"):
+            query = query.lte("transaction_date", filters["end_date"])
+        for field in ("transaction_type", "category_id", "payment_method", "credit_card_id"):
+            if filters.get(field):
+                query = query.eq(field, filters[field])
+        
+        return fetch_page(query, limit, cursor)
+    
+    def iter_transactions(
+        self,
+        user_id: str,
+        filters: Dict[str, Any] = None,
+        page_size: int = TRANSACTION_PAGE_SIZE
+    ) -> Iterator[Dict[str, Any]]:
+        """Percorre todas as transações do usuário página a página (memória constante)"""
+        cursor = None
+        while True:
+            rows, cursor = self.get_transactions_page(user_id, filters, page_size, cursor)
+            yield from rows
+            if cursor is None:
+                break
+    
     # ======= ORÇAMENTOS =======
     
     def create_budget(self, budget_data: Dict[str, Any]) -> Dict[str, Any]:
@@ -181,4 +244,55 @@ class WebDatabaseService:
             return result.data or []
         except Exception as e:
             print(f"Database error: {str(e)}")
-            return []
\ No newline at end of file
+            return []
+    
+    # ======= DASHBOARD =======
+    
+    def get_dashboard_data(self, user_id: str) -> Dict[str, Any]:
+        """
+        Resumo do dashboard lido dos rollups mensais (monthly_rollups)
+        O custo depende de meses × categorias, não da quantidade de transações
+        """
+        empty = {
+            "total_income": 0.0, "total_expenses": 0.0, "balance": 0.0,
+            "monthly_income": 0.0, "monthly_expenses": 0.0, "monthly_balance": 0.0,
+            "categories_summary": [], "recent_transactions": []
+        }
+        if not self.supabase:
+            return empty
+        
+        current_month = date.today().replace(day=1)
+        rows = get_rollup_rows(user_id, date(1970, 1, 1), current_month, is_paid=True)
+        if rows is None:
+            return empty
+        
+        totals = {"income": 0.0, "expense": 0.0}
+        monthly = {"income": 0.0, "expense": 0.0}
+        categories = {}
+        for row in rows:
+            if row["transaction_type"] not in totals:
+                continue
+            totals[row["transaction_type"]] += row["total"]
+            if row["month"] == current_month:
+                monthly[row["transaction_type"]] += row["total"]
+                if row["transaction_type"] == "expense":
+                    category = categories.setdefault(row["category_name"] or "Outros", {
+                        "category_name": row["category_name"] or "Outros", "total_amount": 0.0, "transaction_count": 0
+                    })
+                    category["total_amount"] += row["total"]
+                    category["transaction_count"] += row["count"]
+        
+        recent = self.supabase.table("transactions").select(TRANSACTION_EXPORT_SELECT).eq(
+            "user_id", user_id
+        ).order("created_at", desc=True).limit(10).execute()
+        
+        return {
+            "total_income": totals["income"],
+            "total_expenses": totals["expense"],
+            "balance": totals["income"] - totals["expense"],
+            "monthly_income": monthly["income"],
+            "monthly_expenses": monthly["expense"],
+            "monthly_balance": monthly["income"] - monthly["expense"],
+            "categories_summary": sorted(categories.values(), key=lambda x: x["total_amount"], reverse=True),
+            "recent_transactions": recent.data or []
+        }
@@ -0,0 +1,284 @@
+"""
+Inbox durável de webhooks usando Redis Streams
+O webhook grava o payload bruto no stream (XADD) e responde na hora;
+consumidores de um consumer group processam e confirmam (XACK) cada entrada
+"""
+import asyncio
+import json
+import os
+import socket
+from typing import Any, Awaitable, Callable, Optional
+from dotenv import load_dotenv
+
+from chat_redis import get_async_redis_client
+
+load_dotenv()
+
+# Modo do inbox:
+#   disabled - webhook processa direto no despachante (padrão)
+#   local    - webhook grava no stream e o próprio processo web consome (um único processo web)
+#   remote   - webhook só grava no stream; o processo `worker` consome (um único worker)
+WEBHOOK_INBOX_MODE = os.getenv("WEBHOOK_INBOX_MODE", "disabled").lower()
+
+INBOX_STREAM = os.getenv("INBOX_STREAM", "webhook:inbox")
+INBOX_GROUP = os.getenv("INBOX_GROUP", "agent-workers")
+INBOX_DEAD_LETTER_STREAM = os.getenv("INBOX_DEAD_LETTER_STREAM", "webhook:inbox:dead")
+INBOX_MAXLEN = int(os.getenv("INBOX_MAXLEN", "100000"))
+INBOX_BATCH_SIZE = int(os.getenv("INBOX_BATCH_SIZE", "10"))
+INBOX_BLOCK_MS = int(os.getenv("INBOX_BLOCK_MS", "5000"))
+INBOX_MAX_IN_FLIGHT = int(os.getenv("INBOX_MAX_IN_FLIGHT", "32"))
+INBOX_CLAIM_IDLE_MS = int(os.getenv("INBOX_CLAIM_IDLE_MS", "300000"))
+INBOX_RECLAIM_INTERVAL = float(os.getenv("INBOX_RECLAIM_INTERVAL", "60"))
+INBOX_MAX_DELIVERIES = int(os.getenv("INBOX_MAX_DELIVERIES", "5"))
+
+
+class WebhookInbox:
+    """
+    Inbox de webhooks no Redis Streams com consumer group.
+
+    Cada processo tem um consumidor que lê o stream em ordem e entrega os
+    payloads ao handler. A entrada só recebe XACK depois que o handler
+    termina; entradas presas (processo morreu no meio) são reassumidas
+    com XAUTOCLAIM e, após muitas tentativas, movidas para um dead-letter.
+
+    A ordem por telefone vem do despachante (MessageDispatcher), que só
+    existe dentro do processo: o consumer group reparte as entradas entre
+    os consumidores sem olhar o telefone. Por isso a implantação deve ter
+    um único consumidor ativo (um `python worker.py` no modo remote, ou um
+    único processo web no modo local); start avisa quando encontra outro.
+    """
+
+    def __init__(
+        self,
+        stream: str = INBOX_STREAM,
+        group: str = INBOX_GROUP,
+        consumer_name: str = None
+    ):
+        """
+        Args:
+            stream: Nome do stream no Redis
+            group: Nome do consumer group
+            consumer_name: Nome deste consumidor (padrão: host-pid)
+        """
+        self.stream = stream
+        self.group = group
+        self.consumer_name = consumer_name or f"{socket.gethostname()}-{os.getpid()}"
+        self.enabled = WEBHOOK_INBOX_MODE in ("local", "remote")
+
+        self._handler: Optional[Callable[[dict], Awaitable[Any]]] = None
+        self._tasks = []
+        self._in_flight = {}
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._running = False
+
+        self.stats = {
+            "published": 0,
+            "processed": 0,
+            "failed": 0,
+            "reclaimed": 0,
+            "dead_lettered": 0
+        }
+
+    @property
+    def redis(self):
+        return get_async_redis_client()
+
+    async def publish(self, webhook_data: dict) -> str:
+        """
+        Grava o payload bruto do webhook no stream
+
+        Returns:
+            ID da entrada criada no stream
+        """
+        entry_id = await self.redis.xadd(
+            self.stream,
+            {"payload": json.dumps(webhook_data, ensure_ascii=False)},
+            maxlen=INBOX_MAXLEN,
+            approximate=True
+        )
+        self.stats["published"] += 1
+        return entry_id
+
+    async def _ensure_group(self):
+        """Cria o consumer group (e o stream) se ainda não existirem"""
+        try:
+            await self.redis.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+            print(f"✅ Consumer group '{self.group}' criado no stream '{self.stream}'")
+        except Exception as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def _warn_other_consumers(self):
+        """Avisa se outro consumidor ativo lê o mesmo grupo (quebra a ordem por telefone)"""
+        try:
+            consumers = await self.redis.xinfo_consumers(self.stream, self.group)
+        except Exception as e:
+            print(f"⚠️ Não foi possível listar os consumidores do inbox: {e}")
+            return
+
+        # Consumidores de processos encerrados ficam no grupo, parados há mais que INBOX_CLAIM_IDLE_MS
+        active = [
+            consumer["name"] for consumer in consumers
+            if consumer["name"] != self.consumer_name and consumer["idle"] < INBOX_CLAIM_IDLE_MS
+        ]
+        if active:
+            print(
+                f"⚠️ Outros consumidores ativos no grupo '{self.group}': {', '.join(active)} - "
+                "mensagens do mesmo telefone podem ser processadas fora de ordem"
+            )
+
+    async def start(self, handler: Callable[[dict], Awaitable[Any]]):
+        """
+        Inicia o consumo do stream
+
+        Args:
+            handler: Função assíncrona que processa um payload de webhook
+        """
+        if self._running:
+            return
+
+        self._handler = handler
+        self._slots = asyncio.Semaphore(INBOX_MAX_IN_FLIGHT)
+        await self._ensure_group()
+        await self._warn_other_consumers()
+
+        self._running = True
+        self._tasks = [
+            asyncio.create_task(self._consume_loop()),
+            asyncio.create_task(self._reclaim_loop())
+        ]
+        print(f"📥 Inbox de webhooks consumindo '{self.stream}' como '{self.consumer_name}'")
+
+    async def stop(self, timeout: float = 25):
+        """Para de ler o stream e aguarda as entradas em processamento"""
+        if not self._running:
+            return
+
+        self._running = False
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        in_flight = list(self._in_flight.values())
+        if in_flight:
+            print(f"⏳ Aguardando {len(in_flight)} entradas do inbox em processamento")
+            done, pending = await asyncio.wait(in_flight, timeout=timeout)
+            if pending:
+                # Sem XACK - outro consumidor reassume depois via XAUTOCLAIM
+                print(f"⚠️ {len(pending)} entradas do inbox ficarão pendentes para reprocessamento")
+                for task in pending:
+                    task.cancel()
+
+        print("✅ Inbox de webhooks encerrado")
+
+    async def _consume_loop(self):
+        """Lê novas entradas do stream e agenda o processamento em ordem"""
+        while self._running:
+            try:
+                response = await self.redis.xreadgroup(
+                    self.group,
+                    self.consumer_name,
+                    {self.stream: ">"},
+                    count=INBOX_BATCH_SIZE,
+                    block=INBOX_BLOCK_MS
+                )
+
+                for _, entries in response or []:
+                    for entry_id, fields in entries:
+                        await self._schedule(entry_id, fields)
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ Erro ao ler inbox de webhooks: {e}")
+                await asyncio.sleep(1)
+
+    async def _reclaim_loop(self):
+        """Reassume entradas presas em consumidores que pararam de responder"""
+        while self._running:
+            try:
+                await asyncio.sleep(INBOX_RECLAIM_INTERVAL)
+
+                start_id = "0-0"
+                while True:
+                    result = await self.redis.xautoclaim(
+                        self.stream,
+                        self.group,
+                        self.consumer_name,
+                        min_idle_time=INBOX_CLAIM_IDLE_MS,
+                        start_id=start_id,
+                        count=INBOX_BATCH_SIZE
+                    )
+                    start_id, entries = result[0], result[1]
+
+                    for entry_id, fields in entries:
+                        if entry_id in self._in_flight or fields is None:
+                            continue
+
+                        if await self._exceeded_deliveries(entry_id, fields):
+                            continue
+
+                        self.stats["reclaimed"] += 1
+                        print(f"🔁 Reprocessando entrada presa do inbox: {entry_id}")
+                        await self._schedule(entry_id, fields)
+
+                    if start_id == "0-0":
+                        break
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ Erro ao reassumir entradas do inbox: {e}")
+
+    async def _exceeded_deliveries(self, entry_id: str, fields: dict) -> bool:
+        """Move para o dead-letter entradas que já falharam vezes demais"""
+        pending = await self.redis.xpending_range(
+            self.stream, self.group, min=entry_id, max=entry_id, count=1
+        )
+        if not pending or pending[0]["times_delivered"] <= INBOX_MAX_DELIVERIES:
+            return False
+
+        print(f"☠️ Entrada {entry_id} excedeu {INBOX_MAX_DELIVERIES} tentativas - movendo para dead-letter")
+        await self.redis.xadd(
+            INBOX_DEAD_LETTER_STREAM,
+            {**fields, "original_id": entry_id},
+            maxlen=INBOX_MAXLEN,
+            approximate=True
+        )
+        await self.redis.xack(self.stream, self.group, entry_id)
+        self.stats["dead_lettered"] += 1
+        return True
+
+    async def _schedule(self, entry_id: str, fields: dict):
+        """Agenda o processamento de uma entrada respeitando o limite em voo"""
+        await self._slots.acquire()
+        task = asyncio.create_task(self._process_entry(entry_id, fields))
+        self._in_flight[entry_id] = task
+
+    async def _process_entry(self, entry_id: str, fields: dict):
+        """Executa o handler e confirma a entrada no stream"""
+        try:
+            webhook_data = json.loads(fields["payload"])
+            await self._handler(webhook_data)
+            await self.redis.xack(self.stream, self.group, entry_id)
+            self.stats["processed"] += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Sem XACK: a entrada continua pendente e será reassumida
+            print(f"❌ Erro ao processar entrada {entry_id} do inbox: {e}")
+            self.stats["failed"] += 1
+        finally:
+            self._in_flight.pop(entry_id, None)
+            self._slots.release()
+
+    def get_stats(self) -> dict:
+        """Retorna contadores do inbox"""
+        return {
+            **self.stats,
+            "mode": WEBHOOK_INBOX_MODE,
+            "in_flight": len(self._in_flight),
+            "consumer": self.consumer_name,
+            "consuming": self._running
+        }
@@ -0,0 +1,290 @@
+"""
+Fila de envio de mensagens do WhatsApp
+Envio assíncrono com limite de taxa por número e por instância, retentativas com
+backoff exponencial em 429/5xx e agrupamento de mensagens de status consecutivas
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Dict, List, Optional
+import httpx
+from dotenv import load_dotenv
+
+from evolution_client import evolution_client, EVOLUTION_INSTANCE
+
+load_dotenv()
+
+# Limites de taxa (tokens por segundo e rajada máxima)
+OUTBOX_NUMBER_RATE = float(os.getenv("OUTBOX_NUMBER_RATE", "1"))
+OUTBOX_NUMBER_BURST = int(os.getenv("OUTBOX_NUMBER_BURST", "3"))
+OUTBOX_INSTANCE_RATE = float(os.getenv("OUTBOX_INSTANCE_RATE", "20"))
+OUTBOX_INSTANCE_BURST = int(os.getenv("OUTBOX_INSTANCE_BURST", "20"))
+
+# Retentativas
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "4"))
+OUTBOX_BACKOFF_BASE = float(os.getenv("OUTBOX_BACKOFF_BASE", "1"))
+OUTBOX_BACKOFF_MAX = float(os.getenv("OUTBOX_BACKOFF_MAX", "30"))
+
+# Tempo que uma mensagem de status espera por uma próxima mensagem para ser agrupada
+OUTBOX_COALESCE_WINDOW = float(os.getenv("OUTBOX_COALESCE_WINDOW", "1.5"))
+OUTBOX_IDLE_TIMEOUT = float(os.getenv("OUTBOX_IDLE_TIMEOUT", "30"))
+
+
+def format_whatsapp_number(phone_number: str) -> str:
+    """Limpa o número e garante o formato internacional (55 + DDD + número)"""
+    clean_phone = phone_number.replace("+", "").replace("-", "").replace(" ", "")
+    if not clean_phone.startswith("55"):
+        clean_phone = f"55{clean_phone}"
+    return clean_phone
+
+
+class TokenBucket:
+    """Token bucket simples para limitar a taxa de envio"""
+
+    def __init__(self, rate: float, capacity: int):
+        """
+        Args:
+            rate: Tokens repostos por segundo
+            capacity: Máximo de tokens acumulados (rajada)
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self) -> float:
+        """
+        Aguarda até haver um token disponível e o consome
+
+        Returns:
+            Tempo esperado em segundos
+        """
+        waited = 0.0
+        while True:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return waited
+
+            delay = (1 - self.tokens) / self.rate
+            await asyncio.sleep(delay)
+            waited += delay
+
+
+class OutboundMessage:
+    """Mensagem aguardando envio"""
+
+    def __init__(self, text: str, coalesce: bool, instance: str):
+        self.text = text
+        self.coalesce = coalesce
+        self.instance = instance
+        self.futures: List[asyncio.Future] = [asyncio.get_running_loop().create_future()]
+
+
+class WhatsAppOutbox:
+    """
+    Fila de saída de mensagens do WhatsApp.
+
+    Cada número tem uma fila e um worker próprios (mantém a ordem das
+    mensagens). Mensagens marcadas com `coalesce=True` (ex: "📸 Analisando
+    sua imagem...") esperam uma janela curta e, se outra mensagem para o
+    mesmo número chegar nesse tempo, as duas viram um único envio.
+    """
+
+    def __init__(self):
+        self._queues: Dict[str, deque] = {}
+        self._events: Dict[str, asyncio.Event] = {}
+        self._workers: Dict[str, asyncio.Task] = {}
+        self._number_buckets: Dict[str, TokenBucket] = {}
+        self._instance_buckets: Dict[str, TokenBucket] = {}
+        self._accepting = True
+
+        self.stats = {
+            "enqueued": 0,
+            "sent": 0,
+            "coalesced": 0,
+            "retries": 0,
+            "failed": 0,
+            "rate_limited_waits": 0
+        }
+
+    def enqueue(
+        self,
+        phone_number: str,
+        text: str,
+        coalesce: bool = False,
+        instance: str = EVOLUTION_INSTANCE
+    ) -> asyncio.Future:
+        """
+        Enfileira uma mensagem para envio e retorna imediatamente
+
+        Args:
+            phone_number: Telefone de destino
+            text: Texto da mensagem
+            coalesce: Se é uma mensagem de status que pode ser agrupada com a próxima
+            instance: Instância da Evolution API
+
+        Returns:
+            Future com True/False indicando se a mensagem foi entregue à Evolution API
+        """
+        number = format_whatsapp_number(phone_number)
+        message = OutboundMessage(text, coalesce, instance)
+
+        if not self._accepting:
+            print(f"⚠️ Fila de envio encerrada - mensagem para {number} descartada")
+            message.futures[0].set_result(False)
+            return message.futures[0]
+
+        queue = self._queues.setdefault(number, deque())
+        queue.append(message)
+        self._events.setdefault(number, asyncio.Event()).set()
+        self.stats["enqueued"] += 1
+
+        worker = self._workers.get(number)
+        if worker is None or worker.done():
+            self._workers[number] = asyncio.create_task(self._worker(number))
+
+        return message.futures[0]
+
+    async def _wait_for_message(self, number: str, timeout: float) -> bool:
+        """Aguarda uma nova mensagem na fila do número"""
+        queue = self._queues[number]
+        if queue:
+            return True
+        # Fila encerrada (drain): nenhuma mensagem nova vai chegar
+        if not self._accepting:
+            return False
+
+        event = self._events[number]
+        event.clear()
+        try:
+            await asyncio.wait_for(event.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        return bool(queue)
+
+    async def _worker(self, number: str):
+        """Envia as mensagens de um número em ordem"""
+        queue = self._queues[number]
+        try:
+            while True:
+                if not await self._wait_for_message(number, OUTBOX_IDLE_TIMEOUT):
+                    break
+
+                message = queue.popleft()
+
+                # Agrupar mensagens de status com a mensagem seguinte
+                while message.coalesce and await self._wait_for_message(number, OUTBOX_COALESCE_WINDOW):
+                    following = queue.popleft()
+                    message.text = f"{message.text}\n\n{following.text}"
+                    message.coalesce = following.coalesce
+                    message.futures.extend(following.futures)
+                    self.stats["coalesced"] += 1
+
+                delivered = await self._deliver(number, message)
+                for future in message.futures:
+                    if not future.done():
+                        future.set_result(delivered)
+        finally:
+            if self._queues.get(number) is queue and not queue:
+                del self._queues[number]
+                self._events.pop(number, None)
+                self._number_buckets.pop(number, None)
+            if self._workers.get(number) is asyncio.current_task():
+                del self._workers[number]
+
+    async def _acquire_rate(self, number: str, instance: str):
+        """Respeita os limites de taxa do número e da instância"""
+        number_bucket = self._number_buckets.get(number)
+        if number_bucket is None:
+            number_bucket = TokenBucket(OUTBOX_NUMBER_RATE, OUTBOX_NUMBER_BURST)
+            self._number_buckets[number] = number_bucket
+
+        instance_bucket = self._instance_buckets.get(instance)
+        if instance_bucket is None:
+            instance_bucket = TokenBucket(OUTBOX_INSTANCE_RATE, OUTBOX_INSTANCE_BURST)
+            self._instance_buckets[instance] = instance_bucket
+
+        waited = await number_bucket.acquire()
+        waited += await instance_bucket.acquire()
+        if waited > 0:
+            self.stats["rate_limited_waits"] += 1
+
+    def _backoff_delay(self, attempt: int, response: Optional[httpx.Response]) -> float:
+        """Calcula a espera antes da próxima tentativa (respeita Retry-After)"""
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after:
+                try:
+                    return min(float(retry_after), OUTBOX_BACKOFF_MAX)
+                except ValueError:
+                    pass
+        return min(OUTBOX_BACKOFF_BASE * (2 ** attempt), OUTBOX_BACKOFF_MAX)
+
+    async def _deliver(self, number: str, message: OutboundMessage) -> bool:
+        """Envia a mensagem com retentativas em 429, 5xx e erros de rede"""
+        for attempt in range(OUTBOX_MAX_ATTEMPTS):
+            await self._acquire_rate(number, message.instance)
+
+            response = None
+            try:
+                response = await evolution_client.send_text(number, message.text, instance=message.instance)
+
+                if response.status_code in [200, 201]:
+                    print(f"✅ Mensagem enviada para {number}")
+                    self.stats["sent"] += 1
+                    return True
+
+                if response.status_code != 429 and response.status_code < 500:
+                    print(f"❌ Erro ao enviar mensagem: {response.status_code} - {response.text}")
+                    break
+
+                print(f"⚠️ Evolution API respondeu {response.status_code} para {number} (tentativa {attempt + 1}/{OUTBOX_MAX_ATTEMPTS})")
+
+            except httpx.HTTPError as e:
+                print(f"⚠️ Erro de rede ao enviar para {number} (tentativa {attempt + 1}/{OUTBOX_MAX_ATTEMPTS}): {e}")
+            except Exception as e:
+                print(f"❌ Erro ao enviar mensagem WhatsApp: {e}")
+                break
+
+            if attempt < OUTBOX_MAX_ATTEMPTS - 1:
+                self.stats["retries"] += 1
+                await asyncio.sleep(self._backoff_delay(attempt, response))
+
+        self.stats["failed"] += 1
+        return False
+
+    async def drain(self, timeout: float = 10):
+        """Para de aceitar mensagens e aguarda as filas esvaziarem"""
+        self._accepting = False
+        workers = list(self._workers.values())
+        if not workers:
+            return
+
+        # Acordar workers ociosos para que encerrem
+        for event in self._events.values():
+            event.set()
+
+        done, pending = await asyncio.wait(workers, timeout=timeout)
+        for worker in pending:
+            worker.cancel()
+        if pending:
+            print(f"⚠️ {len(pending)} filas de envio não terminaram a tempo")
+
+    def get_stats(self) -> dict:
+        """Retorna contadores da fila de envio"""
+        return {
+            **self.stats,
+            "pending": sum(len(queue) for queue in self._queues.values()),
+            "active_numbers": len(self._queues)
+        }
+
+
+# Instância global da fila de envio
+whatsapp_outbox = WhatsAppOutbox()
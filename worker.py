@@ -0,0 +1,50 @@
+"""
+Worker do inbox de webhooks
+Consome o Redis Stream do inbox e processa as mensagens fora do processo web,
+e roda o agendador de recorrências
+Use com WEBHOOK_INBOX_MODE=remote no processo web
+Rode um único worker por implantação: a ordem das mensagens de cada telefone
+é garantida pelo despachante dentro do processo, não entre processos
+Para executar: python worker.py
+"""
+import asyncio
+import signal
+
+from api import dispatcher, webhook_inbox, process_inbox_payload, redis_db
+from chat_redis import close_async_redis_client
+from evolution_client import evolution_client
+from media_processor import close_openai_client
+from receipt_preprocess import shutdown_preprocess_pool
+from recurrence_scheduler import recurrence_scheduler
+from whatsapp_outbox import whatsapp_outbox
+
+
+async def run_worker():
+    """Consome o inbox até receber SIGINT/SIGTERM e então drena as mensagens"""
+    stop_event = asyncio.Event()
+    
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+    
+    await redis_db.connect()
+    await evolution_client.startup()
+    await webhook_inbox.start(process_inbox_payload)
+    await recurrence_scheduler.start()
+    print("🚀 Worker do inbox iniciado!")
+    
+    await stop_event.wait()
+    
+    print("⏹️ Encerrando worker do inbox...")
+    await recurrence_scheduler.stop()
+    await webhook_inbox.stop()
+    await dispatcher.drain()
+    await whatsapp_outbox.drain()
+    await evolution_client.shutdown()
+    await close_openai_client()
+    shutdown_preprocess_pool()
+    await close_async_redis_client()
+
+
+if __name__ == "__main__":
+    asyncio.run(run_worker())